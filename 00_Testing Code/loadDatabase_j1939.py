@@ -1,34 +1,95 @@
 import sqlite3
 import re
+import json
 import argparse
 import os
+import sys
+import time
+
+# The shared J1939 decoding code lives with the J1939 examples
+J1939_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "05_J1939")
+if J1939_DIR not in sys.path:
+    sys.path.append(J1939_DIR)
+from j1939_id import parseJ1939id
+from j1939_pipeline import read_lines, parse_frames, batched
+from metrics import METRICS
 
 # Define a regular expression to parse candump lines
 candump_pattern = re.compile(r"\((\d+\.\d+)\) ([0-9A-Fa-f]+)#([0-9A-Fa-f]*)")
 
+# Number of parsed candump lines written per executemany call and transaction
+BATCH_SIZE = 50000
+
+# SQLite settings used by the bulk loader. These trade durability for speed,
+# which is fine for a database that can be rebuilt from the candump file.
+BULK_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "OFF",
+    "cache_size": -65536, # Negative values are in KiB, so this is 64 MiB
+}
+
+# Settings used by the incremental loader. WAL with synchronous NORMAL keeps
+# the database consistent if the loader or the machine stops mid-batch; the
+# rows and the new log offset are committed together or not at all.
+INCREMENTAL_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "cache_size": -65536,
+}
+
+# Seconds a loader waits for another loader's write transaction to finish
+BUSY_TIMEOUT = 60
+
+# Bytes at the start of a log kept to recognize it. A log truncated in place, as
+# logrotate's copytruncate does, keeps its inode but not its first line.
+HEAD_BYTES = 256
+
+CANDATA_INSERT = "INSERT OR IGNORE INTO candata (source_address, pgn, can_id, timestamp, can_data) VALUES (?, ?, ?, ?, ?)"
+CANFRAMES_INSERT = "INSERT INTO canframes (timestamp_us, can_id, pgn, source_address, can_data) VALUES (?, ?, ?, ?, ?)"
+INGEST_SOURCE_SELECT = "SELECT file_id, head, byte_offset, malformed FROM ingest_sources WHERE source = ?"
+INGEST_SOURCE_UPSERT = """INSERT INTO ingest_sources (source, file_id, head, byte_offset, malformed, last_timestamp, updated)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT (source) DO UPDATE SET file_id = excluded.file_id, head = excluded.head,
+    byte_offset = excluded.byte_offset, malformed = excluded.malformed,
+    last_timestamp = COALESCE(excluded.last_timestamp, last_timestamp), updated = excluded.updated"""
+
+ROWS_STORED = METRICS.counter('sqlite_rows_stored_total', "Candump rows inserted by the SQLite loader")
+BATCH_LATENCY = METRICS.histogram('sqlite_batch_insert_seconds', "Time to insert and commit one bulk loader batch")
+MALFORMED_LINES = METRICS.counter('sqlite_malformed_lines_total', "Candump lines the incremental loader skipped")
+
 def parse_j1939_id(can_id_hex):
-    """Parses a J1939 CAN ID into its components, handling PDU1 and PDU2 formats."""
-    can_id = int(can_id_hex, 16)
-    pgn = (can_id >> 8) & 0xFFFF  # PGN (bits 8-23)
-    source_address = can_id & 0xFF  # Source Address (bits 0-7)
-
-    # Determine if it's PDU1 or PDU2 format
-    pdu_format = (pgn >> 8) & 0xFF  # Extract the PDU format (bits 16-23)
-    if pdu_format < 240:  # PDU1 format
-        destination_address = pgn & 0xFF  # Destination Address (bits 8-15)
-        pgn = pgn & 0xFF00  # Clear the destination address for PDU1 PGN
-    else:  # PDU2 format
-        destination_address = 255  # Set destination address to 255 for PDU2
-
-    return pgn, source_address
-
-def create_database(db_file):
-    """Creates the SQLite database and table."""
+    """Parses a J1939 CAN ID into its components, handling PDU1 and PDU2 formats.
+
+    The decoding is shared with the J1939 examples, so the PGN includes the
+    data page bits the same way everywhere.
+    """
+    j1939_fields = parseJ1939id(int(can_id_hex, 16))
+    return j1939_fields['pgn'], j1939_fields['source_address']
+
+def create_database(db_file, page_size=None, timeseries=False):
+    """Creates the SQLite database and table.
+
+    The page size can only be changed before the first table is created,
+    so it is set here rather than with the other bulk loading pragmas.
+    With timeseries set, the canframes table is created instead of candata.
+    """
     if os.path.exists(db_file):
         os.remove(db_file)
     conn = sqlite3.connect(db_file)
     cursor = conn.cursor()
+    if page_size is not None:
+        cursor.execute(f"PRAGMA page_size = {int(page_size)}")
     
+    create_tables(cursor, timeseries)
+    conn.commit()
+    conn.close()
+
+def create_tables(cursor, timeseries=False):
+    """Creates the candata table, or the canframes table with timeseries set, if it doesn't exist."""
+    if timeseries:
+        create_timeseries_table(cursor)
+        return
+
     # Create table with primary key (source_address) and secondary key (pgn)
     cursor.execute(
         """
@@ -42,47 +103,308 @@ def create_database(db_file):
         )
         """
     )
-    
-    conn.commit()
-    conn.close()
 
-def parse_and_store_candump(candump_file, db_file):
+def create_ingest_table(cursor):
+    """Creates the table that records how much of each candump file has been loaded.
+
+    The byte offset is just past the last complete line that was read.
+    The file ID (device and inode) and the first HEAD_BYTES of the log
+    show when it was rotated, replaced or truncated in place, so it is
+    read again from the start. Malformed counts the lines skipped.
+    """
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS ingest_sources (
+            source TEXT PRIMARY KEY,
+            file_id TEXT NOT NULL,
+            head BLOB NOT NULL,
+            byte_offset INTEGER NOT NULL,
+            malformed INTEGER NOT NULL,
+            last_timestamp REAL,
+            updated REAL NOT NULL
+        )
+        """
+    )
+
+def create_timeseries_table(cursor):
+    """Creates a table that keeps every frame, along with its indexes.
+
+    Timestamps are integer microseconds and the payload is stored as a
+    BLOB, which keeps the rows compact. The secondary indexes let a range
+    query for one PGN or one source address avoid a full table scan.
+    """
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS canframes (
+            timestamp_us INTEGER NOT NULL,
+            can_id INTEGER NOT NULL,
+            pgn INTEGER NOT NULL,
+            source_address INTEGER NOT NULL,
+            can_data BLOB
+        )
+        """
+    )
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS canframes_pgn_time ON canframes (pgn, timestamp_us)"
+    )
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS canframes_sa_time ON canframes (source_address, timestamp_us)"
+    )
+
+def timestamp_to_us(timestamp_string):
+    """Converts a candump timestamp string to integer microseconds without rounding errors."""
+    seconds, _, fraction = timestamp_string.partition(".")
+    return int(seconds) * 1000000 + int(fraction[:6].ljust(6, "0"))
+
+def split_candump_line(line):
+    """Returns the timestamp, CAN ID and data hex strings of a candump line.
+
+    Both candump layouts are supported, as in j1939_pipeline:
+        (1682544964.910156) can1 0CF00300#D10000FFFFFF00FF
+         (000.000000)  can1  18F11031   [8]  00 00 FF FF FF FF FF FF
+    """
+    entries = line.split()
+    if "#" in entries[2]:
+        can_id_hex, _, can_data = entries[2].partition("#")
+    else:
+        if len(entries) < 4 or not entries[3].startswith("["):
+            raise ValueError(f"Not a candump line: {line!r}")
+        can_id_hex = entries[2]
+        can_data = "".join(entries[4:])
+    return entries[0][1:-1], can_id_hex, can_data
+
+def parse_candump_line(line):
+    """Parses a candump line into a row for the candata table."""
+    timestamp, can_id_hex, can_data = split_candump_line(line)
+    pgn, source_address = parse_j1939_id(can_id_hex)
+    return (source_address, pgn, can_id_hex, float(timestamp), can_data)
+
+def parse_candump_frame(line):
+    """Parses a candump line into a row for the canframes table."""
+    timestamp, can_id_hex, can_data = split_candump_line(line)
+    pgn, source_address = parse_j1939_id(can_id_hex)
+    return (timestamp_to_us(timestamp),
+            int(can_id_hex, 16),
+            pgn,
+            source_address,
+            bytes.fromhex(can_data))
+
+def parse_and_store_candump(candump_file, db_file, timeseries=False):
     """Parses the candump file and stores data in the SQLite database."""
     conn = sqlite3.connect(db_file)
     cursor = conn.cursor()
+    insert = CANFRAMES_INSERT if timeseries else CANDATA_INSERT
+    parse_line = parse_candump_frame if timeseries else parse_candump_line
 
+    row_count = 0
     with open(candump_file, "r") as file:
         for line in file:
-            entries = line.split()
-            timestamp = float(entries[0][1:-1])
-            channel = entries[1]
-            can_frame =  entries[2].split("#")
-            can_id_hex = can_frame[0]
-            can_data = can_frame[1]
-
-            pgn, source_address = parse_j1939_id(can_id_hex)
-                
             # Insert the parsed data into the database
-            cursor.execute(
-                "INSERT OR IGNORE INTO candata (source_address, pgn, can_id, timestamp, can_data) VALUES (?, ?, ?, ?, ?)",
-                (source_address, pgn, can_id_hex, float(timestamp), can_data)
-            )
+            cursor.execute(insert, parse_line(line))
+            row_count += 1
 
     conn.commit()
+    ROWS_STORED.incr(row_count)
+    conn.close()
+
+def parse_candump_batches(candump_file, batch_size=BATCH_SIZE, parse_line=parse_candump_line):
+    """Yields lists of up to batch_size parsed candump rows."""
+    return batched(parse_frames(read_lines(candump_file), parse_line), batch_size)
+
+def apply_pragmas(conn, pragmas):
+    """Applies a dictionary of SQLite pragma settings to a connection."""
+    for name, value in pragmas.items():
+        conn.execute(f"PRAGMA {name} = {value}")
+
+def bulk_store_candump(candump_file, db_file, batch_size=BATCH_SIZE, pragmas=None, timeseries=False):
+    """Parses the candump file in batches and stores them with executemany.
+
+    Each batch is written inside its own explicit transaction. Returns the
+    number of frames parsed from the file.
+    """
+    insert = CANFRAMES_INSERT if timeseries else CANDATA_INSERT
+    parse_line = parse_candump_frame if timeseries else parse_candump_line
+    # Autocommit mode, so the transactions below are the only ones used
+    conn = sqlite3.connect(db_file, isolation_level=None)
+    apply_pragmas(conn, BULK_PRAGMAS if pragmas is None else pragmas)
+    cursor = conn.cursor()
+
+    frame_count = 0
+    try:
+        for batch in parse_candump_batches(candump_file, batch_size, parse_line):
+            with BATCH_LATENCY.time():
+                cursor.execute("BEGIN")
+                cursor.executemany(insert, batch)
+                cursor.execute("COMMIT")
+            frame_count += len(batch)
+            ROWS_STORED.incr(len(batch))
+    except BaseException:
+        # A parse or database error leaves the current batch uncommitted
+        if conn.in_transaction:
+            cursor.execute("ROLLBACK")
+        raise
+    finally:
+        conn.close()
+    return frame_count
+
+def read_new_lines(f, offset, batch_size):
+    """Reads up to batch_size complete lines of a binary file from offset.
+
+    A last line without a newline may still be being written, so it is
+    left for the next run. Returns the non-blank lines and the offset
+    after the last line read.
+    """
+    f.seek(offset)
+    lines = []
+    while len(lines) < batch_size:
+        line = f.readline()
+        if not line.endswith(b"\n"):
+            break
+        offset += len(line)
+        if line.strip():
+            # Bytes that aren't ASCII make the line malformed rather than stopping the loader
+            lines.append(line.decode("ascii", "replace"))
+    return lines, offset
+
+def read_head(f, size):
+    """Returns the first size bytes of a binary file, leaving its position unchanged."""
+    offset = f.tell()
+    f.seek(0)
+    head = f.read(size)
+    f.seek(offset)
+    return head
+
+def ingest_batch(cursor, f, source, file_id, insert, parse_line, batch_size):
+    """Stores the next batch of new lines and the new offset in one transaction.
+
+    BEGIN IMMEDIATE takes the write lock before the offset is read, so
+    when two loaders share a database each batch of the log is stored by
+    exactly one of them. Lines that can't be parsed are counted and
+    skipped, so one bad line can't stop the log from being loaded.
+    Returns the number of frames stored, or None when there are no new
+    lines.
+    """
+    cursor.execute("BEGIN IMMEDIATE")
+    try:
+        cursor.execute(INGEST_SOURCE_SELECT, (source,))
+        row = cursor.fetchone()
+        offset = 0
+        malformed = 0
+        # Start over when the log was replaced or truncated
+        if (row is not None and row[0] == file_id and row[2] <= os.fstat(f.fileno()).st_size
+                and read_head(f, len(row[1])) == row[1]):
+            offset, malformed = row[2], row[3]
+        lines, new_offset = read_new_lines(f, offset, batch_size)
+        if new_offset == offset:
+            cursor.execute("ROLLBACK")
+            return None
+        rows = []
+        last_line = None
+        for line in lines:
+            try:
+                rows.append(parse_line(line))
+            except (ValueError, IndexError):
+                malformed += 1
+                MALFORMED_LINES.incr()
+                continue
+            last_line = line
+        cursor.executemany(insert, rows)
+        last_timestamp = float(last_line.split(None, 1)[0][1:-1]) if last_line is not None else None
+        head = read_head(f, min(new_offset, HEAD_BYTES))
+        cursor.execute(INGEST_SOURCE_UPSERT, (source, file_id, head, new_offset, malformed,
+                                              last_timestamp, time.time()))
+    except BaseException:
+        cursor.execute("ROLLBACK")
+        raise
+    cursor.execute("COMMIT")
+    return len(rows)
+
+def incremental_store_candump(candump_file, db_file, batch_size=BATCH_SIZE, pragmas=None, timeseries=False,
+                              page_size=None):
+    """Stores only the lines added to the candump file since the last run.
+
+    The database is created if needed and never removed. The offset of
+    each log is kept in the ingest_sources table, so the work done is
+    proportional to the new data, and an interrupted run picks up after
+    the last committed batch. The page size only takes effect when the
+    database is created. Returns the number of frames stored.
+    """
+    insert = CANFRAMES_INSERT if timeseries else CANDATA_INSERT
+    parse_line = parse_candump_frame if timeseries else parse_candump_line
+    source = os.path.realpath(candump_file)
+    # Autocommit mode, so the transactions in ingest_batch are the only ones used
+    conn = sqlite3.connect(db_file, isolation_level=None, timeout=BUSY_TIMEOUT)
+    if page_size is not None:
+        # Set before WAL mode, which fixes the page size of a new database
+        conn.execute(f"PRAGMA page_size = {int(page_size)}")
+    apply_pragmas(conn, INCREMENTAL_PRAGMAS if pragmas is None else pragmas)
+    cursor = conn.cursor()
+    cursor.execute("BEGIN IMMEDIATE")
+    create_tables(cursor, timeseries)
+    create_ingest_table(cursor)
+    cursor.execute("COMMIT")
+
+    frame_count = 0
+    with open(candump_file, "rb") as f:
+        status = os.fstat(f.fileno())
+        file_id = f"{status.st_dev}:{status.st_ino}"
+        while True:
+            t0 = time.perf_counter_ns()
+            try:
+                stored = ingest_batch(cursor, f, source, file_id, insert, parse_line, batch_size)
+            except BaseException:
+                conn.close()
+                raise
+            if stored is None:
+                break
+            BATCH_LATENCY.observe(time.perf_counter_ns() - t0)
+            frame_count += stored
+            ROWS_STORED.incr(stored)
+
     conn.close()
+    return frame_count
 
 def main():
     parser = argparse.ArgumentParser(description="Parse a candump file and store data in SQLite database.")
     parser.add_argument("candump_file", help="Path to the candump file to be parsed.")
     parser.add_argument("--output", dest="db_file", default=None, help="Path to the output SQLite database file.")
+    parser.add_argument("--bulk", action="store_true", help="Use the batched, transactional bulk loader.")
+    parser.add_argument("--timeseries", action="store_true", help="Keep every frame in the canframes table.")
+    parser.add_argument("--incremental", action="store_true", help="Keep the database and only load lines added since the last run.")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="Number of lines per bulk insert transaction.")
+    parser.add_argument("--journal-mode", default=BULK_PRAGMAS["journal_mode"], help="SQLite journal_mode for the bulk loader.")
+    parser.add_argument("--synchronous", default=BULK_PRAGMAS["synchronous"], help="SQLite synchronous level for the bulk loader.")
+    parser.add_argument("--cache-size", type=int, default=BULK_PRAGMAS["cache_size"], help="SQLite cache_size for the bulk loader (negative for KiB).")
+    parser.add_argument("--page-size", type=int, default=None, help="SQLite page_size used when creating the database. An existing database keeps its page size.")
+    parser.add_argument("--metrics", action="store_true", help="Print the parsing and loading metrics as JSON.")
     args = parser.parse_args()
 
     # Set the default database file name based on the candump file if not provided
     db_file = args.db_file or f"{args.candump_file}.db"
 
-    create_database(db_file)
-    parse_and_store_candump(args.candump_file, db_file)
+    if not args.incremental:
+        create_database(db_file, page_size=args.page_size, timeseries=args.timeseries)
+    start_time = time.perf_counter()
+    if args.incremental:
+        frame_count = incremental_store_candump(args.candump_file, db_file, args.batch_size, timeseries=args.timeseries,
+                                                page_size=args.page_size)
+    elif args.bulk:
+        pragmas = {
+            "journal_mode": args.journal_mode,
+            "synchronous": args.synchronous,
+            "cache_size": args.cache_size,
+        }
+        frame_count = bulk_store_candump(args.candump_file, db_file, args.batch_size, pragmas, args.timeseries)
+    else:
+        parse_and_store_candump(args.candump_file, db_file, args.timeseries)
+    elapsed = time.perf_counter() - start_time
+    if not args.bulk and not args.incremental:
+        with open(args.candump_file, "r") as file:
+            frame_count = sum(1 for line in file if line.strip())
     print(f"Candump data has been successfully stored in the database: {db_file}")
+    print(f"Loaded {frame_count} frames in {elapsed:.3f} seconds ({frame_count / elapsed:.0f} frames/s)")
+    if args.metrics:
+        print(json.dumps(METRICS.snapshot(), indent=2))
 
 if __name__ == "__main__":
     main()
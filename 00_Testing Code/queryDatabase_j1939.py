@@ -0,0 +1,242 @@
+"""
+Query the canframes table built by loadDatabase_j1939.py --timeseries.
+
+Results come back as NumPy arrays, so a plot or an SPN decode works on
+whole columns instead of lists of tuples. Each query uses one fixed SQL
+string per combination of filters, so sqlite3 reuses its prepared
+statement, and read-only connections are cached per database file.
+create_query_indexes adds covering indexes that answer the queries from
+the index alone. Build them once after loading:
+
+    python loadDatabase_j1939.py candump.log --bulk --timeseries
+    python queryDatabase_j1939.py candump.log.db --create-indexes
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import time
+from urllib.request import pathname2url
+import numpy as np
+
+# The SPN decoder lives with the J1939 examples
+J1939_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "05_J1939")
+if J1939_DIR not in sys.path:
+    sys.path.append(J1939_DIR)
+from spn_decoder import SPNDecoder
+
+PGN_EEC1 = 61444
+SPN_ENGINE_SPEED = 190
+
+# Prepared statements kept by each connection
+STATEMENT_CACHE_SIZE = 64
+
+# Settings for read-only connections. Memory mapping lets repeated queries
+# read pages without copying them through the SQLite page cache.
+READ_PRAGMAS = {
+    "query_only": 1,
+    "mmap_size": 1 << 28,
+    "cache_size": -65536, # Negative values are in KiB, so this is 64 MiB
+}
+
+# Covering indexes: every column a query reads is in the index, so the
+# rows themselves are never visited.
+QUERY_INDEXES = {
+    "canframes_pgn_sa_time_covering":
+        "CREATE INDEX IF NOT EXISTS canframes_pgn_sa_time_covering "
+        "ON canframes (pgn, source_address, timestamp_us, can_id, can_data)",
+    "canframes_id_time":
+        "CREATE INDEX IF NOT EXISTS canframes_id_time ON canframes (can_id, timestamp_us)",
+}
+
+# Timestamps are integer microseconds, so these bounds include every frame
+MIN_TIMESTAMP_US = -(1 << 63)
+MAX_TIMESTAMP_US = (1 << 63) - 1
+
+FRAME_COLUMNS = "SELECT timestamp_us, can_id, source_address, can_data FROM canframes "
+# Keyed by whether a PGN and a source address are given
+FRAMES_SQL = {
+    (True, True): FRAME_COLUMNS + "WHERE pgn = ? AND source_address = ? AND timestamp_us BETWEEN ? AND ? ORDER BY timestamp_us",
+    (True, False): FRAME_COLUMNS + "WHERE pgn = ? AND timestamp_us BETWEEN ? AND ? ORDER BY timestamp_us",
+    (False, True): FRAME_COLUMNS + "WHERE source_address = ? AND timestamp_us BETWEEN ? AND ? ORDER BY timestamp_us",
+    (False, False): FRAME_COLUMNS + "WHERE timestamp_us BETWEEN ? AND ? ORDER BY timestamp_us",
+}
+# SQLite returns the other columns from the row holding the MAX
+LATEST_SQL = ("SELECT MAX(timestamp_us), can_id, source_address, can_data FROM canframes "
+              "WHERE pgn = ? GROUP BY source_address ORDER BY source_address")
+LATEST_SOURCE_SQL = ("SELECT timestamp_us, can_id, source_address, can_data FROM canframes "
+                     "WHERE pgn = ? AND source_address = ? ORDER BY timestamp_us DESC LIMIT 1")
+ID_STATISTICS_SQL = ("SELECT can_id, COUNT(*), MIN(timestamp_us), MAX(timestamp_us) FROM canframes "
+                     "WHERE timestamp_us BETWEEN ? AND ? GROUP BY can_id ORDER BY can_id")
+
+FRAME_DTYPE = np.dtype([('timestamp', np.float64),
+                        ('can_id', np.uint32),
+                        ('source_address', np.uint8),
+                        ('dlc', np.uint8),
+                        ('data', np.uint8, (8,))])
+
+ID_STATISTICS_DTYPE = np.dtype([('can_id', np.uint32),
+                                ('count', np.int64),
+                                ('first', np.float64),
+                                ('last', np.float64),
+                                ('rate', np.float64)])
+
+READ_ONLY_CONNECTIONS = {}
+
+def connect(db_file, cached=True):
+    """Opens a read-only connection to the database.
+
+    Cached connections are shared by every query on the same file, so
+    their prepared statements and page cache stay warm. Like any sqlite3
+    connection, a cached one can only be used by the thread that opened it.
+    """
+    path = os.path.abspath(db_file)
+    if cached and path in READ_ONLY_CONNECTIONS:
+        return READ_ONLY_CONNECTIONS[path]
+    if not os.path.exists(path):
+        raise FileNotFoundError(path)
+    conn = sqlite3.connect(f"file:{pathname2url(path)}?mode=ro", uri=True,
+                           cached_statements=STATEMENT_CACHE_SIZE)
+    for name, value in READ_PRAGMAS.items():
+        conn.execute(f"PRAGMA {name} = {value}")
+    if cached:
+        READ_ONLY_CONNECTIONS[path] = conn
+    return conn
+
+def close_cached_connections():
+    for conn in READ_ONLY_CONNECTIONS.values():
+        conn.close()
+    READ_ONLY_CONNECTIONS.clear()
+
+def create_query_indexes(db_file):
+    """Adds the covering indexes to a loaded database and updates the planner statistics.
+
+    Building them after a bulk load is quicker than keeping them up to
+    date during it.
+    """
+    conn = sqlite3.connect(db_file)
+    for create_index in QUERY_INDEXES.values():
+        conn.execute(create_index)
+    conn.execute("ANALYZE")
+    conn.commit()
+    conn.close()
+
+def to_timestamp_us(seconds, default):
+    return default if seconds is None else int(round(seconds * 1000000))
+
+def frames_array(rows):
+    """Converts (timestamp_us, can_id, source_address, can_data) rows to a FRAME_DTYPE array."""
+    frames = np.zeros(len(rows), dtype=FRAME_DTYPE)
+    if not rows:
+        return frames
+    timestamps, can_ids, source_addresses, payloads = zip(*rows)
+    frames['timestamp'] = np.array(timestamps, dtype=np.int64) / 1e6
+    frames['can_id'] = can_ids
+    frames['source_address'] = source_addresses
+    frames['dlc'] = [len(payload) for payload in payloads]
+    # Pad every payload to 8 bytes so the column can be filled from one buffer
+    frames['data'] = np.frombuffer(b''.join(payload[:8].ljust(8, b'\x00') for payload in payloads),
+                                   dtype=np.uint8).reshape(-1, 8)
+    return frames
+
+class CanDatabase():
+    def __init__(self, db_file, cached=True, decoder=None):
+        self.conn = connect(db_file, cached)
+        self.decoder = decoder
+
+    def spn_decoder(self):
+        # J1939db.json is only read when a query needs to decode SPNs
+        if self.decoder is None:
+            self.decoder = SPNDecoder()
+        return self.decoder
+
+    def frames(self, pgn=None, source_address=None, start=None, end=None):
+        """Returns the frames for a PGN and/or source address between start and end seconds, in time order."""
+        parameters = [value for value in (pgn, source_address) if value is not None]
+        parameters += [to_timestamp_us(start, MIN_TIMESTAMP_US), to_timestamp_us(end, MAX_TIMESTAMP_US)]
+        sql = FRAMES_SQL[(pgn is not None, source_address is not None)]
+        return frames_array(self.conn.execute(sql, parameters).fetchall())
+
+    def latest_frames(self, pgn):
+        """Returns the most recent frame of a PGN from each source address."""
+        return frames_array(self.conn.execute(LATEST_SQL, (pgn,)).fetchall())
+
+    def latest_values(self, pgn, source_address):
+        """Returns the timestamp and a dictionary of SPN values from the latest frame of a PGN.
+
+        Returns None when the source address never sent the PGN.
+        """
+        frames = frames_array(self.conn.execute(LATEST_SOURCE_SQL, (pgn, source_address)).fetchall())
+        if not len(frames):
+            return None
+        frame = frames[0]
+        return frame['timestamp'], self.spn_decoder().decode(pgn, frame['data'][:frame['dlc']].tobytes())
+
+    def signal(self, pgn, spn, source_address=None, start=None, end=None):
+        """Returns arrays of the times and values of an SPN, with NaN where it wasn't available."""
+        frames = self.frames(pgn, source_address, start, end)
+        decoder = self.spn_decoder()
+        values = decoder.decode_batch(pgn, frames['data'])[spn]
+        # Short frames were padded with zeros, which aren't real values
+        for plan in decoder.compile_pgn(pgn):
+            if plan.spn == spn:
+                values[frames['dlc'] <= plan.last_byte] = np.nan
+        return frames['timestamp'], values
+
+    def id_statistics(self, start=None, end=None):
+        """Returns the frame count, first and last times and frames per second of each CAN ID."""
+        rows = self.conn.execute(ID_STATISTICS_SQL, (to_timestamp_us(start, MIN_TIMESTAMP_US),
+                                                     to_timestamp_us(end, MAX_TIMESTAMP_US))).fetchall()
+        statistics = np.zeros(len(rows), dtype=ID_STATISTICS_DTYPE)
+        if not rows:
+            return statistics
+        can_ids, counts, firsts, lasts = zip(*rows)
+        statistics['can_id'] = can_ids
+        statistics['count'] = counts
+        firsts = np.array(firsts, dtype=np.int64)
+        lasts = np.array(lasts, dtype=np.int64)
+        statistics['first'] = firsts / 1e6
+        statistics['last'] = lasts / 1e6
+        # Subtract the integer microseconds, which float seconds can't hold exactly
+        duration = (lasts - firsts) / 1e6
+        # The rate needs at least two frames a measurable time apart
+        statistics['rate'] = np.divide(statistics['count'] - 1, duration,
+                                       out=np.full(len(rows), np.nan), where=duration > 0)
+        return statistics
+
+def main():
+    parser = argparse.ArgumentParser(description="Query a database made with loadDatabase_j1939.py --timeseries.")
+    parser.add_argument("db_file", help="Path to the SQLite database file.")
+    parser.add_argument("--create-indexes", action="store_true", help="Add the covering query indexes first.")
+    parser.add_argument("--pgn", type=int, default=PGN_EEC1, help="PGN of the signal to query.")
+    parser.add_argument("--sa", type=int, default=0, help="Source address of the signal to query.")
+    parser.add_argument("--spn", type=int, default=SPN_ENGINE_SPEED, help="SPN of the signal to query.")
+    parser.add_argument("--start", type=float, default=None, help="Start time in seconds.")
+    parser.add_argument("--end", type=float, default=None, help="End time in seconds.")
+    parser.add_argument("--repeat", type=int, default=5, help="Times to repeat the signal query.")
+    args = parser.parse_args()
+
+    if args.create_indexes:
+        start_time = time.perf_counter()
+        create_query_indexes(args.db_file)
+        print(f"Created the query indexes in {time.perf_counter() - start_time:.3f} seconds")
+
+    database = CanDatabase(args.db_file)
+    statistics = database.id_statistics(args.start, args.end)
+    print("{:>10s} {:>10s} {:>12s}".format("CAN ID", "frames", "frames/s"))
+    for row in statistics:
+        print("{:10X} {:10d} {:12.2f}".format(row['can_id'], row['count'], row['rate']))
+
+    for trial in range(args.repeat):
+        start_time = time.perf_counter()
+        times, values = database.signal(args.pgn, args.spn, args.sa, args.start, args.end)
+        elapsed = time.perf_counter() - start_time
+        # The first query includes reading J1939db.json
+        print(f"SPN {args.spn} from SA {args.sa}: {len(values)} values in {elapsed * 1000:.2f} ms")
+    latest = database.latest_values(args.pgn, args.sa)
+    if latest is not None:
+        print(f"Latest at {latest[0]:.6f}: {latest[1].get(args.spn)}")
+    close_cached_connections()
+
+if __name__ == "__main__":
+    main()
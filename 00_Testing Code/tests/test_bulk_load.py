@@ -0,0 +1,77 @@
+
+from loadDatabase_j1939 import * #Import the file with the function to test
+import os
+
+def test_bulk_matches_row_by_row(faker):
+    # Define the random file names
+    candump_file = faker.file_name()
+    row_db_file = faker.file_name()
+    bulk_db_file = faker.file_name()
+
+    # Write several frames from a handful of source addresses
+    with open(candump_file,'w') as f:
+        for i in range(100):
+            can_id_int = faker.random_int(min=0, max=0x1FFFFFFF)
+            f.write(f"({1724771346.025320 + i/1000:0.6f}) can0 {can_id_int:08X}#180194018502FFFF\n")
+
+    create_database(row_db_file)
+    parse_and_store_candump(candump_file, row_db_file)
+
+    create_database(bulk_db_file)
+    # Use a small batch so several transactions are needed
+    frame_count = bulk_store_candump(candump_file, bulk_db_file, batch_size=7)
+    assert frame_count == 100
+
+    #Both loaders should produce the same table
+    rows = []
+    for db_file in (row_db_file, bulk_db_file):
+        conn = sqlite3.connect(db_file)
+        cursor = conn.cursor()
+        cursor.execute("SELECT * FROM candata ORDER BY source_address, pgn")
+        rows.append(cursor.fetchall())
+        conn.close()
+    assert len(rows[0]) > 0
+    assert rows[0] == rows[1]
+
+    #clean up after the test is completed
+    for file_name in (candump_file, row_db_file, bulk_db_file):
+        os.remove(file_name)
+    for suffix in ("-wal", "-shm"):
+        if os.path.exists(bulk_db_file + suffix):
+            os.remove(bulk_db_file + suffix)
+
+def test_parse_error_closes_connection(faker, monkeypatch):
+    candump_file = faker.file_name()
+    db_file = faker.file_name()
+    with open(candump_file,'w') as f:
+        for i in range(20):
+            f.write(f"({1724771346.025320 + i/1000:0.6f}) can0 18FEF2{i:02X}#180194018502FFFF\n")
+        f.write("not a candump line\n")
+
+    create_database(db_file)
+    # Keep the loader's connection to check it is closed
+    connections = []
+    connect = sqlite3.connect
+    def recording_connect(*args, **kwargs):
+        connections.append(connect(*args, **kwargs))
+        return connections[-1]
+    monkeypatch.setattr(sqlite3, "connect", recording_connect)
+    try:
+        bulk_store_candump(candump_file, db_file, batch_size=7, pragmas={})
+        assert False, "The malformed line should raise"
+    except (ValueError, IndexError):
+        pass
+    monkeypatch.undo()
+    try:
+        connections[0].execute("SELECT 1")
+        assert False, "The connection should be closed"
+    except sqlite3.ProgrammingError:
+        pass
+    # The batches before the bad one are committed
+    conn = sqlite3.connect(db_file)
+    assert conn.execute("SELECT COUNT(*) FROM candata").fetchone()[0] == 14
+    conn.close()
+
+    #clean up after the test is completed
+    for file_name in (candump_file, db_file):
+        os.remove(file_name)
@@ -0,0 +1,134 @@
+from loadDatabase_j1939 import * #Import the file with the function to test
+import multiprocessing
+import os
+
+def candump_lines(start, count):
+    return [f"({1724771346.025320 + i / 1000:0.6f}) can0 18FEF2{i % 256:02X}#180194018502FFFF\n"
+            for i in range(start, start + count)]
+
+def stored_frames(db_file):
+    conn = sqlite3.connect(db_file)
+    cursor = conn.cursor()
+    cursor.execute("SELECT timestamp_us FROM canframes ORDER BY timestamp_us")
+    timestamps = [row[0] for row in cursor.fetchall()]
+    cursor.execute("SELECT byte_offset, last_timestamp FROM ingest_sources")
+    source = cursor.fetchone()
+    conn.close()
+    return timestamps, source
+
+def remove_files(*file_names):
+    for file_name in file_names:
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(file_name + suffix):
+                os.remove(file_name + suffix)
+
+def test_only_new_lines_are_loaded(faker):
+    db_file = faker.file_name()
+    candump_file = faker.file_name()
+
+    with open(candump_file, 'w') as f:
+        f.writelines(candump_lines(0, 30))
+    assert incremental_store_candump(candump_file, db_file, batch_size=7, timeseries=True) == 30
+
+    # Append more lines and a partial line that is still being written
+    lines = candump_lines(30, 6)
+    with open(candump_file, 'a') as f:
+        f.writelines(lines[:5])
+        f.write(lines[5][:20])
+    assert incremental_store_candump(candump_file, db_file, batch_size=7, timeseries=True) == 5
+    with open(candump_file, 'a') as f:
+        f.write(lines[5][20:])
+    assert incremental_store_candump(candump_file, db_file, batch_size=7, timeseries=True) == 1
+    assert incremental_store_candump(candump_file, db_file, batch_size=7, timeseries=True) == 0
+
+    timestamps, (byte_offset, last_timestamp) = stored_frames(db_file)
+    assert len(timestamps) == 36
+    assert len(set(timestamps)) == 36
+    assert byte_offset == os.path.getsize(candump_file)
+    assert last_timestamp == float(lines[5].split()[0][1:-1])
+
+    # A replaced log is read from the start
+    os.remove(candump_file)
+    with open(candump_file, 'w') as f:
+        f.writelines(candump_lines(100, 3))
+    assert incremental_store_candump(candump_file, db_file, timeseries=True) == 3
+
+    #clean up after the test is completed
+    remove_files(candump_file, db_file)
+
+def test_malformed_lines_are_skipped(faker):
+    db_file = faker.file_name()
+    candump_file = faker.file_name()
+    lines = candump_lines(0, 10)
+    with open(candump_file, 'wb') as f:
+        f.writelines(line.encode() for line in lines[:4])
+        f.write(b"not a candump line\n")
+        f.write(b"(1724771346.030000) can0 18FEF2ZZ#1801\n")
+        f.write(b"(1724771346.031000) can0 18FEF200#18\xff\n")
+        f.writelines(line.encode() for line in lines[4:])
+
+    # The bad lines are counted and the loader carries on past them
+    assert incremental_store_candump(candump_file, db_file, batch_size=3, timeseries=True) == 10
+    assert incremental_store_candump(candump_file, db_file, batch_size=3, timeseries=True) == 0
+    timestamps, (byte_offset, last_timestamp) = stored_frames(db_file)
+    assert len(timestamps) == 10
+    assert byte_offset == os.path.getsize(candump_file)
+    assert last_timestamp == float(lines[-1].split()[0][1:-1])
+    conn = sqlite3.connect(db_file)
+    assert conn.execute("SELECT malformed FROM ingest_sources").fetchone()[0] == 3
+    conn.close()
+
+    #clean up after the test is completed
+    remove_files(candump_file, db_file)
+
+def test_truncated_in_place(faker):
+    db_file = faker.file_name()
+    candump_file = faker.file_name()
+    with open(candump_file, 'w') as f:
+        f.writelines(candump_lines(0, 30))
+    assert incremental_store_candump(candump_file, db_file, timeseries=True) == 30
+
+    # copytruncate keeps the inode, and the new log grows past the old offset before the next run
+    with open(candump_file, 'r+') as f:
+        f.truncate(0)
+        f.writelines(candump_lines(1000, 50))
+    assert incremental_store_candump(candump_file, db_file, timeseries=True) == 50
+    timestamps, (byte_offset, _) = stored_frames(db_file)
+    assert len(set(timestamps)) == 80
+    assert byte_offset == os.path.getsize(candump_file)
+
+    #clean up after the test is completed
+    remove_files(candump_file, db_file)
+
+def test_concurrent_loaders(faker):
+    db_file = faker.file_name()
+    candump_file = faker.file_name()
+    with open(candump_file, 'w') as f:
+        f.writelines(candump_lines(0, 500))
+
+    # Two loaders on the same log and database store each line once
+    with multiprocessing.Pool(2) as pool:
+        counts = pool.starmap(incremental_store_candump, [(candump_file, db_file, 10, None, True)] * 2)
+    assert sum(counts) == 500
+    timestamps, _ = stored_frames(db_file)
+    assert len(timestamps) == len(set(timestamps)) == 500
+
+    #clean up after the test is completed
+    remove_files(candump_file, db_file)
+
+def test_page_size_on_create(faker):
+    db_file = faker.file_name()
+    candump_file = faker.file_name()
+    with open(candump_file, 'w') as f:
+        f.writelines(candump_lines(0, 30))
+    assert incremental_store_candump(candump_file, db_file, timeseries=True, page_size=16384) == 30
+    with open(candump_file, 'a') as f:
+        f.writelines(candump_lines(30, 5))
+    # An existing database keeps the page size it was created with
+    assert incremental_store_candump(candump_file, db_file, timeseries=True, page_size=1024) == 5
+    conn = sqlite3.connect(db_file)
+    assert conn.execute("PRAGMA page_size").fetchone()[0] == 16384
+    conn.close()
+
+    #clean up after the test is completed
+    remove_files(candump_file, db_file)
@@ -0,0 +1,104 @@
+from loadDatabase_j1939 import create_database, bulk_store_candump, parse_candump_frame
+from queryDatabase_j1939 import * #Import the file with the function to test
+import os
+
+def test_queries_match_log(faker):
+    db_file = faker.file_name()
+    create_database(db_file, timeseries=True)
+    bulk_store_candump("candump.log", db_file, timeseries=True)
+    create_query_indexes(db_file)
+    with open("candump.log") as f:
+        rows = [parse_candump_frame(line) for line in f if line.strip()]
+
+    database = CanDatabase(db_file)
+    # Cached connections are reused
+    assert CanDatabase(db_file).conn is database.conn
+
+    timestamp_us, can_id, pgn, sa, can_data = rows[len(rows) // 2]
+    expected = sorted(row for row in rows if row[2] == pgn and row[3] == sa)
+    frames = database.frames(pgn, sa)
+    assert frames.dtype == FRAME_DTYPE
+    assert len(frames) == len(expected)
+    assert list(frames['timestamp']) == [row[0] / 1e6 for row in expected]
+    assert frames[0]['data'][:frames[0]['dlc']].tobytes() == expected[0][4]
+
+    # A time window keeps the frames inside it
+    window = database.frames(pgn, sa, start=timestamp_us / 1e6, end=timestamp_us / 1e6)
+    assert list(window['can_id']) == [can_id]
+    assert len(database.frames()) == len(rows)
+
+    latest = database.latest_frames(pgn)
+    assert sa in latest['source_address']
+    assert latest[latest['source_address'] == sa][0]['timestamp'] == expected[-1][0] / 1e6
+
+    statistics = database.id_statistics()
+    assert statistics['count'].sum() == len(rows)
+    row = statistics[statistics['can_id'] == can_id][0]
+    times = [row[0] for row in rows if row[1] == can_id]
+    assert row['count'] == len(times)
+    if len(times) > 1 and max(times) > min(times):
+        assert abs(row['rate'] - (len(times) - 1) / ((max(times) - min(times)) / 1e6)) < 1e-6
+
+    # The queries are answered from the covering index
+    plan = database.conn.execute("EXPLAIN QUERY PLAN " + FRAMES_SQL[(True, True)], (pgn, sa, 0, 1)).fetchall()
+    assert "COVERING INDEX canframes_pgn_sa_time_covering" in str(plan)
+    plan = database.conn.execute("EXPLAIN QUERY PLAN " + LATEST_SOURCE_SQL, (pgn, sa)).fetchall()
+    assert "COVERING INDEX canframes_pgn_sa_time_covering" in str(plan)
+
+    close_cached_connections()
+    #clean up after the test is completed
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(db_file + suffix):
+            os.remove(db_file + suffix)
+
+def test_signal_from_database(faker):
+    db_file = faker.file_name()
+    candump_file = faker.file_name()
+    # EEC1 from the engine, the last frame too short to hold engine speed
+    with open(candump_file, 'w') as f:
+        f.write("(1.000000) can0 0CF00400#F07D7D803E00FF7D\n")
+        f.write("(1.010000) can0 0CF00400#F07D7D00FFFFFF7D\n")
+        f.write("(1.020000) can0 0CF00400#F07D7D\n")
+        f.write("(1.030000) can0 0CF00401#F07D7D401F00FF7D\n")
+    create_database(db_file, timeseries=True)
+    bulk_store_candump(candump_file, db_file, timeseries=True)
+
+    database = CanDatabase(db_file, cached=False)
+    times, values = database.signal(PGN_EEC1, SPN_ENGINE_SPEED, source_address=0)
+    assert list(times) == [1.0, 1.01, 1.02]
+    assert values[0] == 0x3E80 * 0.125
+    assert np.isnan(values[1]) and np.isnan(values[2])
+    timestamp, spns = database.latest_values(PGN_EEC1, 1)
+    assert timestamp == 1.03
+    assert spns[SPN_ENGINE_SPEED] == 0x1F40 * 0.125
+    assert database.latest_values(PGN_EEC1, 2) is None
+    database.conn.close()
+
+    #clean up after the test is completed
+    for file_name in (candump_file, db_file, db_file + "-wal", db_file + "-shm"):
+        if os.path.exists(file_name):
+            os.remove(file_name)
+
+def test_engine_speed_plot_from_database(faker):
+    from parse_engine_speed import engine_speed_from_log, engine_speed_from_database
+    db_file = faker.file_name()
+    candump_file = faker.file_name()
+    with open(candump_file, 'w') as f:
+        for i in range(50):
+            # Every fifth frame has engine speed not available
+            speed = 0xFFFF if i % 5 == 0 else 0x3E80 + i
+            f.write(f"({1.0 + i / 100:0.6f}) can0 0CF00400#F07D7D{speed & 0xFF:02X}{speed >> 8:02X}00FF7D\n")
+            f.write(f"({1.0 + i / 100 + 0.001:0.6f}) can0 0CF00401#F07D7D401F00FF7D\n")
+    create_database(db_file, timeseries=True)
+    bulk_store_candump(candump_file, db_file, timeseries=True)
+
+    log_times, log_values, _ = engine_speed_from_log(candump_file)
+    times, values = engine_speed_from_database(db_file)
+    assert len(values) == 40
+    assert np.allclose(times, log_times)
+    assert np.array_equal(values, log_values)
+
+    #clean up after the test is completed
+    for file_name in (candump_file, candump_file + ".npz", db_file, db_file + "-wal", db_file + "-shm"):
+        if os.path.exists(file_name):
+            os.remove(file_name)
@@ -0,0 +1,66 @@
+
+from loadDatabase_j1939 import * #Import the file with the function to test
+import os
+
+def test_timeseries_keeps_every_frame(faker):
+    # Define the random file names
+    db_file = faker.file_name()
+    candump_file = faker.file_name()
+
+    # Repeat the same SA/PGN so the candata table would only keep one row
+    can_id = "18FEF200"
+    with open(candump_file,'w') as f:
+        f.write(f"(1724771346.025320) can0 {can_id}#180194018502FFFF\n")
+        f.write(f"(1724771346.125320) can0 {can_id}#190194018502FFFF\n")
+        f.write(f"(1724771346.2) can0 {can_id}#1A01\n")
+
+    create_database(db_file, timeseries=True)
+    parse_and_store_candump(candump_file, db_file, timeseries=True)
+
+    conn = sqlite3.connect(db_file)
+    cursor = conn.cursor()
+    cursor.execute("SELECT * FROM canframes ORDER BY timestamp_us")
+    rows = cursor.fetchall()
+    cursor.execute("SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'canframes'")
+    indexes = [row[0] for row in cursor.fetchall()]
+    conn.close()
+
+    pgn, sa = parse_j1939_id(can_id)
+    assert len(rows) == 3
+    # Check the timestamp is an exact integer number of microseconds
+    assert rows[0][0] == 1724771346025320
+    assert rows[2][0] == 1724771346200000
+    assert rows[0][1] == 0x18FEF200
+    assert rows[0][2] == pgn
+    assert rows[0][3] == sa
+    # The payload should be bytes, not hex text
+    assert rows[0][4] == bytes.fromhex("180194018502FFFF")
+    assert rows[2][4] == b"\x1a\x01"
+    assert "canframes_pgn_time" in indexes
+    assert "canframes_sa_time" in indexes
+
+    #clean up after the test is completed
+    os.remove(candump_file)
+    os.remove(db_file)
+
+def test_spaced_layout(faker):
+    candump_file = faker.file_name()
+    db_file = faker.file_name()
+    # The layout of KWTruck.txt, with the DLC in brackets and spaced data bytes
+    with open(candump_file,'w') as f:
+        f.write(" (000.000000)  can1  18F11031   [8]  00 00 FF FF FF FF FF FF\n")
+        f.write(" (000.010000)  can1  0CF00400   [3]  F0 7D 7D\n")
+
+    assert parse_candump_frame(" (000.000000)  can1  18F11031   [8]  00 00 FF FF FF FF FF FF") == \
+        parse_candump_frame("(000.000000) can1 18F11031#0000FFFFFFFFFFFF")
+    create_database(db_file, timeseries=True)
+    parse_and_store_candump(candump_file, db_file, timeseries=True)
+    conn = sqlite3.connect(db_file)
+    rows = conn.execute("SELECT timestamp_us, can_id, can_data FROM canframes ORDER BY timestamp_us").fetchall()
+    conn.close()
+    assert rows == [(0, 0x18F11031, bytes.fromhex("0000FFFFFFFFFFFF")),
+                    (10000, 0x0CF00400, bytes.fromhex("F07D7D"))]
+
+    #clean up after the test is completed
+    os.remove(candump_file)
+    os.remove(db_file)
@@ -0,0 +1,197 @@
+"""
+Stream CAN frames to CANStreamServer.py with the batched protocol.
+
+CANStreamClient sends FRAME_DTYPE arrays, such as a candump file read
+with 05_J1939/parse_cache.py, or frames captured from a SocketCAN
+interface. Run as a script it streams the example logs three ways (as
+candump text lines, as batches, and as zlib compressed batches) and
+compares frames/s and bytes/frame:
+
+    python CANStreamClient.py
+"""
+import os
+import sys
+import time
+import socket
+import argparse
+import subprocess
+import numpy as np
+
+from can_stream_protocol import STREAM_MAGIC, ACK, encode_batch, recv_exactly
+
+J1939_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "05_J1939")
+if J1939_DIR not in sys.path:
+    sys.path.append(J1939_DIR)
+from parse_cache import load_candump
+
+HOST = '127.0.0.1'  # The server's hostname or IP address
+PORT = 12355        # The port used by the server
+BATCH_FRAMES = 1000 # Frames per batch
+MAX_WAIT = 0.1      # Seconds a live batch waits to fill before it is sent
+
+# SocketCAN frame layout used in the J1939 notebooks
+CAN_FRAME_FORMAT = "<LB3x8s"
+CAN_FRAME_DTYPE = np.dtype([('can_id', '<u4'),
+                            ('dlc', np.uint8),
+                            ('pad', 'V3'),
+                            ('data', np.uint8, (8,))])
+CAN_EFF_MASK = 0x1FFFFFFF
+
+BENCHMARK_FILES = (os.path.join(J1939_DIR, 'KWTruck.txt'),
+                   os.path.join(J1939_DIR, 'candump-RTSMaxxForceResourceExhaustion.log'))
+SERVER_START_TIMEOUT = 10
+
+class CANStreamClient():
+    def __init__(self, host=HOST, port=PORT, batch_frames=BATCH_FRAMES, compress=False):
+        self.batch_frames = batch_frames
+        self.compress = compress
+        self.sock = socket.create_connection((host, port))
+        self.sock.sendall(STREAM_MAGIC)
+        self.bytes_sent = len(STREAM_MAGIC)
+        self.frames_sent = 0
+
+    def send_batch(self, timestamps_us, can_ids, dlcs, data):
+        batch = encode_batch(timestamps_us, can_ids, dlcs, data, self.compress)
+        self.sock.sendall(batch)
+        self.bytes_sent += len(batch)
+        self.frames_sent += len(can_ids)
+
+    def send_frames(self, frames):
+        """Sends a FRAME_DTYPE array in batches."""
+        timestamps_us = np.round(frames['timestamp'] * 1e6).astype(np.int64)
+        for start in range(0, len(frames), self.batch_frames):
+            end = start + self.batch_frames
+            self.send_batch(timestamps_us[start:end], frames['can_id'][start:end],
+                            frames['dlc'][start:end], frames['data'][start:end])
+
+    def close(self):
+        """Finishes the stream. Returns the number of frames the server stored."""
+        self.sock.shutdown(socket.SHUT_WR)
+        ack = recv_exactly(self.sock, ACK.size)
+        self.sock.close()
+        return ACK.unpack(ack)[0] if len(ack) == ACK.size else None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+def stream_candump(client, filename):
+    """Sends every frame in a candump file. Parsed frames are cached next to the file."""
+    frames, channels = load_candump(filename)
+    client.send_frames(frames)
+    return len(frames)
+
+def socketcan_batches(interface, batch_frames=BATCH_FRAMES, max_wait=MAX_WAIT):
+    """Yields (timestamps_us, can_ids, dlcs, data) batches read from a SocketCAN interface.
+
+    A batch is sent when it is full or when max_wait has passed since its
+    first frame, so quiet buses still stream promptly.
+    """
+    frame_size = CAN_FRAME_DTYPE.itemsize
+    sock = socket.socket(socket.PF_CAN, socket.SOCK_RAW, socket.CAN_RAW)
+    sock.bind((interface,))
+    sock.settimeout(max_wait)
+    buffer = bytearray(batch_frames * frame_size)
+    view = memoryview(buffer)
+    timestamps_us = np.zeros(batch_frames, dtype=np.int64)
+    count = 0
+    deadline = None
+    try:
+        while True:
+            try:
+                sock.recv_into(view[count * frame_size:(count + 1) * frame_size], frame_size)
+                timestamps_us[count] = time.time_ns() // 1000
+                if count == 0:
+                    deadline = time.monotonic() + max_wait
+                count += 1
+            except socket.timeout:
+                pass
+            if count and (count == batch_frames or time.monotonic() >= deadline):
+                frames = np.frombuffer(buffer, dtype=CAN_FRAME_DTYPE, count=count)
+                yield (timestamps_us[:count].copy(), frames['can_id'] & CAN_EFF_MASK,
+                       frames['dlc'].copy(), frames['data'].copy())
+                count = 0
+    finally:
+        sock.close()
+
+def stream_socketcan(client, interface):
+    """Streams live frames from a SocketCAN interface until interrupted."""
+    for batch in socketcan_batches(interface, client.batch_frames):
+        client.send_batch(*batch)
+
+def send_candump_text(filename, host=HOST, port=PORT):
+    """Sends a candump file as text lines. Returns the bytes sent and the frames stored."""
+    with socket.create_connection((host, port)) as sock, open(filename, 'rb') as f:
+        bytes_sent = sock.sendfile(f)
+        sock.shutdown(socket.SHUT_WR)
+        ack = recv_exactly(sock, ACK.size)
+    return bytes_sent, ACK.unpack(ack)[0]
+
+def send_candump_batches(filename, compress, host=HOST, port=PORT):
+    """Sends a candump file as batches. Returns the bytes sent and the frames stored."""
+    client = CANStreamClient(host, port, compress=compress)
+    stream_candump(client, filename)
+    stored = client.close()
+    return client.bytes_sent, stored
+
+def start_server(host, port, db_file):
+    server_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'CANStreamServer.py')
+    server = subprocess.Popen([sys.executable, server_file, '--host', host, '--port', str(port),
+                               '--output', db_file], stdout=subprocess.DEVNULL)
+    deadline = time.monotonic() + SERVER_START_TIMEOUT
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection((host, port), timeout=1) as sock:
+                # An empty stream, so the server stores nothing
+                sock.shutdown(socket.SHUT_WR)
+                recv_exactly(sock, ACK.size)
+            return server
+        except OSError:
+            time.sleep(0.05)
+    server.kill()
+    raise RuntimeError("The stream server did not start")
+
+def main():
+    parser = argparse.ArgumentParser(description="Stream CAN frames to CANStreamServer.py")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--file", help="Stream a candump file instead of running the benchmark")
+    parser.add_argument("--interface", help="Stream live frames from a SocketCAN interface, like can0")
+    parser.add_argument("--compress", action="store_true", help="Compress each batch with zlib")
+    args = parser.parse_args()
+
+    if args.file or args.interface:
+        with CANStreamClient(args.host, args.port, compress=args.compress) as client:
+            if args.file:
+                stream_candump(client, args.file)
+            else:
+                stream_socketcan(client, args.interface)
+        print("Sent {} frames in {} bytes".format(client.frames_sent, client.bytes_sent))
+        return
+
+    db_file = 'can_stream_benchmark.db'
+    server = start_server(args.host, args.port, db_file)
+    try:
+        print("{:45s} {:12s} {:>9s} {:>11s} {:>11s}".format("file", "method", "frames", "frames/s", "bytes/frame"))
+        for filename in BENCHMARK_FILES:
+            # Fill the parse cache, so the batch timings don't include parsing the text
+            load_candump(filename)
+            for method, send in (("text", lambda: send_candump_text(filename, args.host, args.port)),
+                                 ("batch", lambda: send_candump_batches(filename, False, args.host, args.port)),
+                                 ("batch+zlib", lambda: send_candump_batches(filename, True, args.host, args.port))):
+                start = time.perf_counter()
+                bytes_sent, stored = send()
+                elapsed = time.perf_counter() - start
+                print("{:45s} {:12s} {:9d} {:11.0f} {:11.2f}".format(
+                    os.path.basename(filename), method, stored, stored / elapsed, bytes_sent / stored))
+    finally:
+        server.terminate()
+        server.wait()
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(db_file + suffix):
+                os.remove(db_file + suffix)
+
+if __name__ == '__main__':
+    main()
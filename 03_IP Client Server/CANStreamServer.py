@@ -0,0 +1,189 @@
+"""
+Receive streamed CAN frames and store them with the SQLite loader.
+
+Each client gets a thread, like TCPMultiServerThreaded.py. A connection
+that starts with STREAM_MAGIC sends batches in the can_stream_protocol
+format. Any other connection is read as candump text lines, which is
+the baseline CANStreamClient.py compares against. Decoded frames go on
+a queue to a single writer thread that inserts them into the canframes
+table of loadDatabase_j1939.py, one transaction per batch.
+
+    python CANStreamServer.py --output stream.db
+"""
+import os
+import sys
+import queue
+import socket
+import sqlite3
+import zlib
+import argparse
+from itertools import chain
+from threading import Thread, Event
+
+from can_stream_protocol import STREAM_MAGIC, ACK, recv_exactly, recv_batch, decode_batch
+
+# The SQLite loader lives with the testing code and finds the J1939 code itself
+LOADER_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "00_Testing Code")
+if LOADER_DIR not in sys.path:
+    sys.path.append(LOADER_DIR)
+from loadDatabase_j1939 import (create_database, apply_pragmas, parse_candump_frame,
+                                BULK_PRAGMAS, CANFRAMES_INSERT)
+from j1939_id import decode_j1939_ids
+from j1939_pipeline import batched
+
+HOST = '127.0.0.1'  # Standard loopback interface address (localhost)
+PORT = 12355        # Port to listen on (non-privileged ports are > 1023)
+DB_FILE = 'can_stream.db'
+TEXT_BATCH_LINES = 5000  # Candump lines stored per transaction
+QUEUE_BATCHES = 64       # Batches waiting for the writer before readers block
+WRITER_CHECK = 1.0       # Seconds between checks that the writer is still running
+
+def batch_rows(columns):
+    """Converts decoded batch columns to canframes rows."""
+    fields = decode_j1939_ids(columns['can_id'])
+    dlcs = columns['dlc'].tolist()
+    return list(zip(columns['timestamp_us'].tolist(),
+                    columns['can_id'].tolist(),
+                    fields['pgn'].tolist(),
+                    fields['source_address'].tolist(),
+                    [row[:dlc].tobytes() for row, dlc in zip(columns['data'], dlcs)]))
+
+class DatabaseWriter(Thread):
+    """Owns the SQLite connection and stores the row lists put on its queue.
+
+    After a database error the writer records it in error and keeps
+    emptying the queue without storing anything, so stream threads
+    never block on it and can tell their clients the frames were lost.
+    """
+    def __init__(self, db_file):
+        super().__init__()
+        self.db_file = db_file
+        self.rows = queue.Queue(QUEUE_BATCHES)
+        self.frame_count = 0
+        self.error = None
+
+    def run(self):
+        conn = None
+        try:
+            conn = sqlite3.connect(self.db_file, isolation_level=None)
+            apply_pragmas(conn, BULK_PRAGMAS)
+        except sqlite3.Error as error:
+            self.fail(error)
+        while True:
+            rows = self.rows.get()
+            if rows is None:
+                break
+            if isinstance(rows, Event):
+                # A stream finished and everything it queued has been committed
+                rows.set()
+                continue
+            if self.error is not None:
+                continue
+            try:
+                conn.execute("BEGIN")
+                conn.executemany(CANFRAMES_INSERT, rows)
+                conn.execute("COMMIT")
+            except sqlite3.Error as error:
+                self.fail(error)
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+                continue
+            self.frame_count += len(rows)
+        if conn is not None:
+            conn.close()
+
+    def fail(self, error):
+        print(f"database writer failed: {error}")
+        self.error = error
+
+    def wait_stored(self, stored):
+        """Waits for a stream's frames to be committed. Raises ConnectionError if they can't be."""
+        while not stored.wait(WRITER_CHECK):
+            if not self.is_alive():
+                raise ConnectionError("the database writer stopped")
+        if self.error is not None:
+            raise ConnectionError(f"the database writer failed: {self.error}")
+
+    def stop(self):
+        self.rows.put(None)
+        self.join()
+
+class StreamThread(Thread):
+    def __init__(self, conn, writer, verbose=False):
+        super().__init__(daemon=True)
+        self.conn = conn
+        self.writer = writer
+        self.verbose = verbose
+
+    def run(self):
+        try:
+            magic = recv_exactly(self.conn, len(STREAM_MAGIC))
+            if magic == STREAM_MAGIC:
+                frame_count = self.read_batches()
+            else:
+                frame_count = self.read_lines(magic)
+            # Acknowledge once the frames are stored, so clients can time the whole trip
+            stored = Event()
+            self.writer.rows.put(stored)
+            self.writer.wait_stored(stored)
+            self.conn.sendall(ACK.pack(frame_count))
+            if self.verbose:
+                print(f"end of data from {self.conn.getpeername()}, {frame_count} frames")
+        except (ConnectionError, ValueError, zlib.error) as error:
+            print(f"dropping {self.conn}: {error}")
+        finally:
+            self.conn.close()
+
+    def read_batches(self):
+        frame_count = 0
+        while True:
+            batch = recv_batch(self.conn)
+            if batch is None:
+                return frame_count
+            rows = batch_rows(decode_batch(batch))
+            self.writer.rows.put(rows)
+            frame_count += len(rows)
+
+    def read_lines(self, start):
+        with self.conn.makefile('rb') as f:
+            # The bytes read to check for the magic are the start of the first line
+            lines = chain([start + f.readline()], f)
+            rows = (parse_candump_frame(line.decode('ascii')) for line in lines if line.strip())
+            frame_count = 0
+            for batch in batched(rows, TEXT_BATCH_LINES):
+                self.writer.rows.put(batch)
+                frame_count += len(batch)
+        return frame_count
+
+def serve(host, port, writer, verbose=False):
+    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    s.bind((host, port))
+    s.listen()
+    while True:
+        srvConn, addr = s.accept()
+        if verbose:
+            print(f"connection from {addr}")
+        StreamThread(srvConn, writer, verbose).start()
+
+def main():
+    parser = argparse.ArgumentParser(description="Store streamed CAN frames in SQLite")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--output", dest="db_file", default=DB_FILE, help="SQLite database file")
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    create_database(args.db_file, timeseries=True)
+    writer = DatabaseWriter(args.db_file)
+    writer.start()
+    try:
+        serve(args.host, args.port, writer, args.verbose)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        writer.stop()
+    print(f"Stored {writer.frame_count} frames in {args.db_file}")
+
+if __name__ == '__main__':
+    main()
@@ -1,8 +1,18 @@
+import os
+import json
+import time
 import logging
+import argparse
+import platform
+import cryptography
 from cryptography.fernet import Fernet
-from Timer import Timer
+from Timer import Timer, measure, TRIALS, WARMUP_TRIALS, MIN_TRIAL_NS
 from cryptography.hazmat.backends import default_backend
-from cryptography.hazmat.primitives.asymmetric import rsa
+from cryptography.hazmat.backends.openssl.backend import backend as openssl_backend
+from cryptography.hazmat.primitives.asymmetric import rsa, ec
+from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PrivateKey
+from cryptography.hazmat.primitives.asymmetric.x25519 import X25519PrivateKey
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM, ChaCha20Poly1305
 
 from cryptography.hazmat.primitives import hashes
 from cryptography.hazmat.primitives.asymmetric import padding
@@ -60,13 +70,166 @@ def asymmetricKeySigningTiming():
             sig = privateKey.sign(plain_text_bytes, padSpec, hashes.SHA256())
             publicKey.verify(sig, plain_text_bytes, padSpec, hashes.SHA256())
 
+#
+# Benchmark suite: repeated trials with percentiles, swept over key and payload sizes
+#
+
+PAYLOAD_SIZES = (64, 1024, 16384, 1 << 20)
+RSA_KEY_SIZES = (2048, 3072, 4096)
+EC_CURVES = {'P-256': ec.SECP256R1, 'P-384': ec.SECP384R1, 'P-521': ec.SECP521R1}
+RSA_PAYLOAD = os.urandom(32)  # A symmetric key, which is what RSA encrypts in practice
+
+def symmetric_cases(payload_sizes):
+    """Fernet, as the Tornado examples use, against the AEAD ciphers it could be swapped for."""
+    ciphers = (('Fernet', 256, Fernet(Fernet.generate_key())),
+               ('AES-GCM', 256, AESGCM(AESGCM.generate_key(bit_length=256))),
+               ('ChaCha20-Poly1305', 256, ChaCha20Poly1305(ChaCha20Poly1305.generate_key())))
+    for size in payload_sizes:
+        payload = os.urandom(size)
+        for algorithm, key_bits, cipher in ciphers:
+            if algorithm == 'Fernet':
+                token = cipher.encrypt(payload)
+                encrypt = lambda cipher=cipher, payload=payload: cipher.encrypt(payload)
+                decrypt = lambda cipher=cipher, token=token: cipher.decrypt(token)
+            else:
+                nonce = os.urandom(12)
+                token = cipher.encrypt(nonce, payload, None)
+                # Reusing a nonce is only acceptable because nothing here is kept secret
+                encrypt = lambda cipher=cipher, nonce=nonce, payload=payload: cipher.encrypt(nonce, payload, None)
+                decrypt = lambda cipher=cipher, nonce=nonce, token=token: cipher.decrypt(nonce, token, None)
+            yield {'group': 'symmetric', 'algorithm': algorithm, 'key_bits': key_bits, 'payload_bytes': size}, \
+                  {'encrypt': encrypt, 'decrypt': decrypt}
+
+def rsa_cases(key_sizes):
+    oaep = padding.OAEP(mgf=padding.MGF1(hashes.SHA256()), algorithm=hashes.SHA256(), label=None)
+    pss = padding.PSS(mgf=padding.MGF1(hashes.SHA256()), salt_length=padding.PSS.MAX_LENGTH)
+    for key_bits in key_sizes:
+        private_key = rsa.generate_private_key(public_exponent=65537, key_size=key_bits, backend=default_backend())
+        public_key = private_key.public_key()
+        ciphertext = public_key.encrypt(RSA_PAYLOAD, oaep)
+        signature = private_key.sign(plain_text_bytes, pss, hashes.SHA256())
+        yield {'group': 'rsa', 'algorithm': 'RSA-OAEP', 'key_bits': key_bits, 'payload_bytes': len(RSA_PAYLOAD)}, \
+              {'encrypt': lambda public_key=public_key: public_key.encrypt(RSA_PAYLOAD, oaep),
+               'decrypt': lambda private_key=private_key, ciphertext=ciphertext: private_key.decrypt(ciphertext, oaep)}
+        yield {'group': 'rsa', 'algorithm': 'RSA-PSS', 'key_bits': key_bits, 'payload_bytes': len(plain_text_bytes)}, \
+              {'sign': lambda private_key=private_key: private_key.sign(plain_text_bytes, pss, hashes.SHA256()),
+               'verify': lambda public_key=public_key, signature=signature:
+                   public_key.verify(signature, plain_text_bytes, pss, hashes.SHA256())}
+
+def ecdh_cases():
+    """X25519 from the ECDH notebook, and the NIST curves."""
+    private_key = X25519PrivateKey.generate()
+    peer_public_key = X25519PrivateKey.generate().public_key()
+    yield {'group': 'ecdh', 'algorithm': 'X25519', 'key_bits': 255, 'payload_bytes': 0}, \
+          {'generate': X25519PrivateKey.generate,
+           'exchange': lambda private_key=private_key, peer_public_key=peer_public_key:
+               private_key.exchange(peer_public_key)}
+    for name, curve in EC_CURVES.items():
+        private_key = ec.generate_private_key(curve())
+        peer_public_key = ec.generate_private_key(curve()).public_key()
+        yield {'group': 'ecdh', 'algorithm': f'ECDH {name}', 'key_bits': curve.key_size, 'payload_bytes': 0}, \
+              {'generate': lambda curve=curve: ec.generate_private_key(curve()),
+               'exchange': lambda private_key=private_key, peer_public_key=peer_public_key:
+                   private_key.exchange(ec.ECDH(), peer_public_key)}
+
+def signature_cases():
+    """Ed25519 from the signing notebook, and ECDSA on the NIST curves."""
+    private_key = Ed25519PrivateKey.generate()
+    public_key = private_key.public_key()
+    signature = private_key.sign(plain_text_bytes)
+    yield {'group': 'signature', 'algorithm': 'Ed25519', 'key_bits': 255, 'payload_bytes': len(plain_text_bytes)}, \
+          {'sign': lambda private_key=private_key: private_key.sign(plain_text_bytes),
+           'verify': lambda public_key=public_key, signature=signature: public_key.verify(signature, plain_text_bytes)}
+    for name, curve in EC_CURVES.items():
+        private_key = ec.generate_private_key(curve())
+        public_key = private_key.public_key()
+        algorithm = ec.ECDSA(hashes.SHA256())
+        signature = private_key.sign(plain_text_bytes, algorithm)
+        yield {'group': 'signature', 'algorithm': f'ECDSA {name}', 'key_bits': curve.key_size,
+               'payload_bytes': len(plain_text_bytes)}, \
+              {'sign': lambda private_key=private_key, algorithm=algorithm: private_key.sign(plain_text_bytes, algorithm),
+               'verify': lambda public_key=public_key, signature=signature, algorithm=algorithm:
+                   public_key.verify(signature, plain_text_bytes, algorithm)}
+
+GROUPS = {'symmetric': lambda args: symmetric_cases(args.payload_sizes),
+          'rsa': lambda args: rsa_cases(args.rsa_key_sizes),
+          'ecdh': lambda args: ecdh_cases(),
+          'signature': lambda args: signature_cases()}
+
+def machine_info():
+    return {'platform': platform.platform(),
+            'machine': platform.machine(),
+            'processor': platform.processor(),
+            'cpu_count': os.cpu_count(),
+            'python': platform.python_version(),
+            'cryptography': cryptography.__version__,
+            'openssl': openssl_backend.openssl_version_text(),
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S%z')}
+
+def result_key(result):
+    return (result['group'], result['algorithm'], result['operation'], result['key_bits'], result['payload_bytes'])
+
+def run_suite(groups, args):
+    results = []
+    print("{:20s} {:9s} {:>5s} {:>8s} {:>11s} {:>11s} {:>10s} {:>9s}".format(
+        "algorithm", "operation", "bits", "bytes", "p50 us", "p99 us", "ops/s", "MB/s"))
+    for group in groups:
+        for case, operations in GROUPS[group](args):
+            for operation, call in operations.items():
+                result = dict(case, operation=operation, **measure(call, args.trials, args.warmup))
+                results.append(result)
+                print("{:20s} {:9s} {:5d} {:8d} {:11.2f} {:11.2f} {:10.0f} {:9s}".format(
+                    result['algorithm'], operation, result['key_bits'], result['payload_bytes'],
+                    result['p50_ns'] / 1e3, result['p99_ns'] / 1e3, 1e9 / result['p50_ns'],
+                    "{:9.1f}".format(result['payload_bytes'] * 1e3 / result['p50_ns']) if group == 'symmetric' else ""))
+    return results
+
+def compare(results, baseline_file):
+    """Prints how the p50 of each result changed from a saved run."""
+    with open(baseline_file) as f:
+        baseline = {result_key(result): result for result in json.load(f)['results']}
+    print(f"\nChange in p50 against {baseline_file} (below 1 is faster)")
+    for result in results:
+        old = baseline.get(result_key(result))
+        if old is not None:
+            print("{:20s} {:9s} {:5d} {:8d} {:6.2f}x".format(result['algorithm'], result['operation'], result['key_bits'],
+                                                           result['payload_bytes'], result['p50_ns'] / old['p50_ns']))
+
+def trial_count(text):
+    """Argument type for --trials. measure needs at least 2 trials for the spread."""
+    trials = int(text)
+    if trials < 2:
+        raise argparse.ArgumentTypeError("at least 2 trials are needed")
+    return trials
 
 def main():
+    parser = argparse.ArgumentParser(description="Benchmark the cryptographic primitives used in the examples")
+    parser.add_argument("--groups", nargs="+", choices=GROUPS, default=list(GROUPS))
+    parser.add_argument("--payload-sizes", type=int, nargs="+", default=PAYLOAD_SIZES)
+    parser.add_argument("--rsa-key-sizes", type=int, nargs="+", default=RSA_KEY_SIZES)
+    parser.add_argument("--trials", type=trial_count, default=TRIALS)
+    parser.add_argument("--warmup", type=int, default=WARMUP_TRIALS)
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    parser.add_argument("--compare", help="JSON file from an earlier run to compare against")
+    parser.add_argument("--legacy", action="store_true", help="Run the original fixed loop timings instead")
+    args = parser.parse_args()
+
     logging.basicConfig(level=logging.INFO)
-    symmetricKeyTiming()
-    asymmetricKeyEncryptionTiming()
-    asymmetricKeySigningTiming()
-    pass
+    if args.legacy:
+        symmetricKeyTiming()
+        asymmetricKeyEncryptionTiming()
+        asymmetricKeySigningTiming()
+        return
+
+    results = run_suite(args.groups, args)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'machine': machine_info(),
+                       'settings': {'trials': args.trials, 'warmup': args.warmup, 'min_trial_ns': MIN_TRIAL_NS},
+                       'results': results}, f, indent=2)
+        print(f"Wrote {len(results)} results to {args.output}")
+    if args.compare:
+        compare(results, args.compare)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,73 @@
+"""
+Measure key exchange handshakes/sec on TornadoSuperServer.py.
+
+Runs the /serverPublicKeySymmetricKeyExchange/ handshake of
+KeyExchangeClient.py for a set of client keys, with the server started
+with --max-sessions 0 (no cache) and with a cache for every key. The
+first pass over the keys is cold, and the median of the later passes is
+warm, answered from the cache when there is one. Both servers report
+the same statistics, since the best of several noisy passes would
+always beat a single pass.
+
+    python HandshakeBenchmark.py --keys 100 --rounds 5
+"""
+import time
+import base64
+import statistics
+import argparse
+import requests
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives.asymmetric import rsa
+from cryptography.hazmat.primitives.serialization import Encoding, PublicFormat
+
+from ProxyBenchmark import start, stop
+
+PORT = 9100
+SERVER_URL = f"http://localhost:{PORT}"
+KEYS = 100   # Distinct client public keys
+ROUNDS = 5   # Warm passes over the keys
+
+def client_keys(count):
+    keys = []
+    for _ in range(count):
+        private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048, backend=default_backend())
+        keys.append(base64.b64encode(private_key.public_key().public_bytes(Encoding.DER, PublicFormat.SubjectPublicKeyInfo)))
+    return keys
+
+def handshakes(session, keys):
+    """Runs one handshake per key. Returns the handshakes per second."""
+    start = time.perf_counter()
+    for encodedClientPublicKey in keys:
+        r = session.get(f"{SERVER_URL}/serverPublicKeySymmetricKeyExchange/",
+                        params={'client_publicKey': encodedClientPublicKey})
+        r.raise_for_status()
+    return len(keys) / (time.perf_counter() - start)
+
+def run(keys, rounds, max_sessions):
+    server = start("TornadoSuperServer.py", PORT, "--max-sessions", str(max_sessions))
+    try:
+        with requests.Session() as session:
+            cold = handshakes(session, keys)
+            warm = [handshakes(session, keys) for _ in range(rounds)]
+            counters = session.get(f"{SERVER_URL}/sessionCache/").json()
+    finally:
+        stop(server)
+    return cold, statistics.median(warm), counters
+
+def main():
+    parser = argparse.ArgumentParser(description="Key exchange handshakes/sec with and without the session cache")
+    parser.add_argument("--keys", type=int, default=KEYS)
+    parser.add_argument("--rounds", type=int, default=ROUNDS)
+    args = parser.parse_args()
+
+    print(f"Generating {args.keys} client keys")
+    keys = client_keys(args.keys)
+    uncached_cold, uncached_warm, _ = run(keys, args.rounds, 0)
+    cold, warm, counters = run(keys, args.rounds, args.keys)
+    print("{:10s} {:>14s} {:>14s}".format("", "cold/s", "warm/s"))
+    for name, first, later in (("no cache", uncached_cold, uncached_warm), ("cache", cold, warm)):
+        print("{:10s} {:14.0f} {:14.0f}".format(name, first, later))
+    print(f"Session cache: {counters}")
+
+if __name__ == "__main__":
+    main()
@@ -18,22 +18,23 @@ PUBLIC_KEY = PRIVATE_KEY.public_key()
 PORT = 9100  # set this here so we can reuse app for PITM
 
 def main():
-encodedClientPublicKey = base64.b64encode(PUBLIC_KEY.public_bytes(Encoding.DER, PublicFormat.SubjectPublicKeyInfo))
-r = requests.get(f"http://localhost:{PORT}/serverPublicKeySymmetricKeyExchange/", {'client_publicKey': encodedClientPublicKey})
-jsonReply = r.json()
-encodedEncryptedSymmetricKey = jsonReply['encodedEncryptedSymmetricKey']
-encryptedSymmetricKey = base64.b64decode(encodedEncryptedSymmetricKey)
-symmetricKey = PRIVATE_KEY.decrypt(encryptedSymmetricKey, padding.OAEP(mgf=padding.MGF1(algorithm=hashes.SHA256()),
-                                                                      algorithm=hashes.SHA256(),
-                                                                      label=None))
-f = Fernet(symmetricKey)
-plain_text = "I have a dream that my four little children will one day live in a nation where they will not be judged by the color of their skin but by the content of their character."
-cipher_text = f.encrypt(plain_text.encode('utf-8'))
-r = requests.post(f"http://localhost:{PORT}/encrypted/", json={'cipher_text': cipher_text.decode('utf-8'), })
-reply = r.json()
-print(reply['plaintext'])
-
-    pass
+    # One session for the whole exchange, so the key request and the
+    # message reuse the same keep-alive connection
+    with requests.Session() as session:
+        encodedClientPublicKey = base64.b64encode(PUBLIC_KEY.public_bytes(Encoding.DER, PublicFormat.SubjectPublicKeyInfo))
+        r = session.get(f"http://localhost:{PORT}/serverPublicKeySymmetricKeyExchange/", params={'client_publicKey': encodedClientPublicKey})
+        jsonReply = r.json()
+        encodedEncryptedSymmetricKey = jsonReply['encodedEncryptedSymmetricKey']
+        encryptedSymmetricKey = base64.b64decode(encodedEncryptedSymmetricKey)
+        symmetricKey = PRIVATE_KEY.decrypt(encryptedSymmetricKey, padding.OAEP(mgf=padding.MGF1(algorithm=hashes.SHA256()),
+                                                                              algorithm=hashes.SHA256(),
+                                                                              label=None))
+        f = Fernet(symmetricKey)
+        plain_text = "I have a dream that my four little children will one day live in a nation where they will not be judged by the color of their skin but by the content of their character."
+        cipher_text = f.encrypt(plain_text.encode('utf-8'))
+        r = session.post(f"http://localhost:{PORT}/encrypted/", json={'cipher_text': cipher_text.decode('utf-8'), })
+        reply = r.json()
+        print(reply['plaintext'])
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
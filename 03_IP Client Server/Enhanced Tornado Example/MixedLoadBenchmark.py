@@ -0,0 +1,103 @@
+"""
+Measure TornadoSuperServer.py under a mix of RSA decrypts and plain GETs.
+
+Some clients post messages encrypted with the server public key to
+/serverPublicKey/, like PublicKeyClient.py, while others poll / for the
+time. The server runs once with RSA decrypts on the IOLoop and once
+with each worker pool, and the table shows decrypts/s, 503s, and the
+latency of the GETs that had to wait behind the decrypts.
+
+    python MixedLoadBenchmark.py --decrypt-clients 8 --get-clients 2
+"""
+import os
+import time
+import base64
+import argparse
+import threading
+import requests
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.asymmetric import padding
+
+from ProxyBenchmark import start, stop
+
+PORT = 9100
+SERVER_URL = f"http://localhost:{PORT}"
+DECRYPT_CLIENTS = 8
+GET_CLIENTS = 2
+DURATION = 5  # Seconds per server setup
+# Matches the server's padding, built here so the benchmark doesn't import the server and generate its keys
+OAEP_PADDING = padding.OAEP(mgf=padding.MGF1(algorithm=hashes.SHA256()), algorithm=hashes.SHA256(), label=None)
+MESSAGE = "I have a dream that my four little children will one day live in a nation where they will not be judged by the color of their skin but by the content of their character."
+
+def percentile(values, fraction):
+    return sorted(values)[int(len(values) * fraction)] * 1000 if values else float('nan')
+
+def decrypt_client(stop_time, cipher_text, latencies, busy):
+    with requests.Session() as session:
+        while time.perf_counter() < stop_time:
+            start = time.perf_counter()
+            r = session.post(f"{SERVER_URL}/serverPublicKey/", json={'cipher_text': cipher_text})
+            if r.status_code == 503:
+                busy.append(1)
+                continue
+            r.raise_for_status()
+            latencies.append(time.perf_counter() - start)
+
+def get_client(stop_time, latencies):
+    with requests.Session() as session:
+        while time.perf_counter() < stop_time:
+            start = time.perf_counter()
+            session.get(f"{SERVER_URL}/").raise_for_status()
+            latencies.append(time.perf_counter() - start)
+
+def load_test(decrypt_clients, get_clients, duration):
+    publicKey = serialization.load_pem_public_key(
+        requests.get(f"{SERVER_URL}/serverPublicKey/").json()['publicKey'].encode('ASCII'),
+        backend=default_backend())
+    cipher_text = base64.b64encode(publicKey.encrypt(MESSAGE.encode('utf-8'), OAEP_PADDING)).decode('utf-8')
+    decrypt_latencies = []
+    busy = []
+    get_latencies = []
+    stop_time = time.perf_counter() + duration
+    threads = [threading.Thread(target=decrypt_client, args=(stop_time, cipher_text, decrypt_latencies, busy))
+               for _ in range(decrypt_clients)]
+    threads += [threading.Thread(target=get_client, args=(stop_time, get_latencies))
+                for _ in range(get_clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return {'decrypts_per_s': len(decrypt_latencies) / duration,
+            'decrypt_p50_ms': percentile(decrypt_latencies, 0.5),
+            '503s': len(busy),
+            'gets_per_s': len(get_latencies) / duration,
+            'get_p50_ms': percentile(get_latencies, 0.5),
+            'get_p99_ms': percentile(get_latencies, 0.99)}
+
+def main():
+    parser = argparse.ArgumentParser(description="RSA decrypts and GETs against TornadoSuperServer.py")
+    parser.add_argument("--decrypt-clients", type=int, default=DECRYPT_CLIENTS)
+    parser.add_argument("--get-clients", type=int, default=GET_CLIENTS)
+    parser.add_argument("--duration", type=float, default=DURATION)
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Size of the worker pools")
+    args = parser.parse_args()
+
+    setups = (("ioloop", ["--crypto-workers", "0"]),
+              ("processes", ["--crypto-workers", str(args.workers)]),
+              ("threads", ["--crypto-workers", str(args.workers), "--crypto-threads"]))
+    print("{:10s} {:>10s} {:>10s} {:>6s} {:>8s} {:>8s} {:>8s}".format(
+        "decrypts", "decrypts/s", "p50 ms", "503s", "GETs/s", "GET p50", "GET p99"))
+    for name, server_args in setups:
+        server = start("TornadoSuperServer.py", PORT, *server_args)
+        try:
+            result = load_test(args.decrypt_clients, args.get_clients, args.duration)
+        finally:
+            stop(server)
+        print("{:10s} {:10.0f} {:10.1f} {:6d} {:8.0f} {:8.1f} {:8.1f}".format(
+            name, result['decrypts_per_s'], result['decrypt_p50_ms'], result['503s'],
+            result['gets_per_s'], result['get_p50_ms'], result['get_p99_ms']))
+
+if __name__ == "__main__":
+    main()
@@ -5,7 +5,8 @@ import json
 import os
 import base64
 import logging
-import requests
+from tornado.httpclient import AsyncHTTPClient
+from tornado.httputil import url_concat
 
 from cryptography.fernet import Fernet
 
@@ -19,6 +20,10 @@ from cryptography.hazmat.primitives.asymmetric import padding
 from cryptography.hazmat.primitives.serialization import Encoding, PublicFormat
 
 
+SERVER_URL = "http://localhost:9100"
+# Upstream requests in flight at once. Tornado queues any beyond this.
+MAX_UPSTREAM_CLIENTS = 100
+
 SYMMETRIC_KEY = Fernet.generate_key()
 SERVER_SYMMETRIC_KEY = None
 PRIVATE_KEY = rsa.generate_private_key(
@@ -30,12 +35,14 @@ PUBLIC_KEY = PRIVATE_KEY.public_key()
 
 class EncryptedHandler(tornado.web.RequestHandler):
 
-    def sendFakeMessageToServer(self, msg):
+    async def sendFakeMessageToServer(self, msg):
         f = Fernet(SERVER_SYMMETRIC_KEY)
         plain_text = msg
         cipher_text = f.encrypt(plain_text.encode('utf-8'))
-        r = requests.post(f"http://localhost:9100/encrypted/", json={'cipher_text': cipher_text.decode('utf-8'), })
-        reply = r.json()
+        # Wait for the server without blocking the other proxied clients
+        r = await AsyncHTTPClient().fetch(f"{SERVER_URL}/encrypted/", method='POST',
+                                          body=json.dumps({'cipher_text': cipher_text.decode('utf-8'), }))
+        reply = json.loads(r.body)
         logging.debug(f"Successfully sent fake message to server!!!  Reply: {reply}")
 
     def get(self):
@@ -43,7 +50,7 @@ class EncryptedHandler(tornado.web.RequestHandler):
         # Don't ever do this. It is bad. You'll expose the key!
         self.write({'key': SYMMETRIC_KEY.decode('utf-8')})
 
-    def post(self):
+    async def post(self):
         data = json.loads(self.request.body.decode('utf-8'))
         logging.debug(f'Got JSON data: {data}')
         cipher_text = data['cipher_text']
@@ -51,16 +58,17 @@ class EncryptedHandler(tornado.web.RequestHandler):
         plaintext = f.decrypt(cipher_text.encode('utf-8')).decode('utf-8')
         logging.debug(f"Got the super secret message!!!  It is '{plaintext}'")
         fake_message = 'Jerry is a stinker!'
-        self.sendFakeMessageToServer(fake_message)
+        await self.sendFakeMessageToServer(fake_message)
         self.write({'ciphertext': cipher_text, 'plaintext': fake_message})
 
 class ServerPublicKeyExchangeHandler(tornado.web.RequestHandler):
 
-    def getSymmetricKeyFromServer(self):
+    async def getSymmetricKeyFromServer(self):
         global SERVER_SYMMETRIC_KEY
         pitmPublicKey = base64.b64encode(PUBLIC_KEY.public_bytes(Encoding.DER, PublicFormat.SubjectPublicKeyInfo))
-        r = requests.get(f"http://localhost:9100/serverPublicKeySymmetricKeyExchange/", {'client_publicKey': pitmPublicKey})
-        jsonReply = r.json()
+        r = await AsyncHTTPClient().fetch(url_concat(f"{SERVER_URL}/serverPublicKeySymmetricKeyExchange/",
+                                                     {'client_publicKey': pitmPublicKey.decode('ASCII')}))
+        jsonReply = json.loads(r.body)
         encodedEncryptedSymmetricKey = jsonReply['encodedEncryptedSymmetricKey']
         encryptedSymmetricKey = base64.b64decode(encodedEncryptedSymmetricKey)
         SERVER_SYMMETRIC_KEY = PRIVATE_KEY.decrypt(encryptedSymmetricKey,
@@ -69,11 +77,11 @@ class ServerPublicKeyExchangeHandler(tornado.web.RequestHandler):
                                                         label=None))
         return SYMMETRIC_KEY
 
-    def get(self):
+    async def get(self):
         encodedClientPublicKey = self.request.query_arguments['client_publicKey'][0]
         clientPublicKeyBytes = base64.b64decode(encodedClientPublicKey)
         clientPublicKey = serialization.load_der_public_key(clientPublicKeyBytes, backend=default_backend())
-        serverSymmKey = self.getSymmetricKeyFromServer()
+        serverSymmKey = await self.getSymmetricKeyFromServer()
         # provide the symmetric key, but encrypt it with the client public key to keep it secret
         logging.debug(f"Symmetric key: {SYMMETRIC_KEY}")
         encryptedSymmetricKey = clientPublicKey.encrypt(SYMMETRIC_KEY,
@@ -106,9 +114,19 @@ class ServerPublicKeyExchangeHandler(tornado.web.RequestHandler):
             plaintext = None
         self.write({'original_text': data['cipher_text'], 'plaintext': plaintext.decode('utf-8')})
 
+def configure_upstream_client(max_clients=MAX_UPSTREAM_CLIENTS):
+    """Uses libcurl when it is installed, since it keeps upstream connections
+    alive between requests. Tornado's own client opens one per request."""
+    try:
+        import pycurl
+        AsyncHTTPClient.configure("tornado.curl_httpclient.CurlAsyncHTTPClient", max_clients=max_clients)
+    except ImportError:
+        AsyncHTTPClient.configure(None, max_clients=max_clients)
+
 def main():
     try:
         logging.basicConfig(level=logging.DEBUG)
+        configure_upstream_client()
         port = 9101
         app = tornado.web.Application([
             (r"/encrypted/", EncryptedHandler),
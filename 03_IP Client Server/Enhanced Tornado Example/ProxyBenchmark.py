@@ -0,0 +1,107 @@
+"""
+Measure requests/sec through the PITM proxy with concurrent clients.
+
+Starts TornadoSuperServer.py and PITM.py, has the proxy exchange keys
+with the server, then runs 1, 10 and 100 clients that each post Fernet
+messages to the proxy's /encrypted/ endpoint over their own keep-alive
+session. Every proxied post makes an upstream request to the server,
+so the proxy has to keep many upstream calls in flight at once.
+
+    python ProxyBenchmark.py --clients 1 10 100 --duration 5
+"""
+import os
+import sys
+import signal
+import time
+import base64
+import argparse
+import threading
+import subprocess
+import requests
+from cryptography.fernet import Fernet
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives.asymmetric import rsa
+from cryptography.hazmat.primitives.serialization import Encoding, PublicFormat
+
+SERVER_PORT = 9100
+PITM_PORT = 9101
+PITM_URL = f"http://localhost:{PITM_PORT}"
+CLIENT_COUNTS = (1, 10, 100)
+DURATION = 5  # Seconds per client count
+START_TIMEOUT = 10
+MESSAGE = "I have a dream that my four little children will one day live in a nation where they will not be judged by the color of their skin but by the content of their character."
+
+def start(script, port, *args):
+    process = subprocess.Popen([sys.executable, script, *args], cwd=os.path.dirname(os.path.abspath(__file__)),
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, start_new_session=True)
+    deadline = time.monotonic() + START_TIMEOUT
+    while time.monotonic() < deadline:
+        try:
+            requests.get(f"http://localhost:{port}/encrypted/", timeout=1)
+            return process
+        except requests.ConnectionError:
+            time.sleep(0.1)
+    stop(process)
+    raise RuntimeError(f"{script} did not start")
+
+def stop(process):
+    """Stops a server started with start, along with any processes it forked."""
+    os.killpg(process.pid, signal.SIGTERM)
+    process.wait()
+
+def exchange_keys():
+    """Makes the proxy fetch the server's symmetric key, as a client key exchange would."""
+    private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048, backend=default_backend())
+    encodedClientPublicKey = base64.b64encode(private_key.public_key().public_bytes(Encoding.DER, PublicFormat.SubjectPublicKeyInfo))
+    requests.get(f"{PITM_URL}/serverPublicKeySymmetricKeyExchange/", params={'client_publicKey': encodedClientPublicKey}).raise_for_status()
+
+def run_client(stop_time, latencies, errors):
+    with requests.Session() as session:
+        f = Fernet(session.get(f"{PITM_URL}/encrypted/").json()['key'])
+        cipher_text = f.encrypt(MESSAGE.encode('utf-8')).decode('utf-8')
+        while time.perf_counter() < stop_time:
+            start = time.perf_counter()
+            try:
+                session.post(f"{PITM_URL}/encrypted/", json={'cipher_text': cipher_text}).raise_for_status()
+                latencies.append(time.perf_counter() - start)
+            except requests.RequestException:
+                errors.append(1)
+
+def load_test(clients, duration):
+    latencies = []
+    errors = []
+    start = time.perf_counter()
+    threads = [threading.Thread(target=run_client, args=(start + duration, latencies, errors))
+               for _ in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {'requests_per_s': len(latencies) / elapsed,
+            'p50_ms': latencies[len(latencies) // 2] * 1000 if latencies else float('nan'),
+            'p99_ms': latencies[int(len(latencies) * 0.99)] * 1000 if latencies else float('nan'),
+            'errors': len(errors)}
+
+def main():
+    parser = argparse.ArgumentParser(description="Requests/sec through the PITM proxy")
+    parser.add_argument("--clients", type=int, nargs="+", default=CLIENT_COUNTS)
+    parser.add_argument("--duration", type=float, default=DURATION)
+    args = parser.parse_args()
+
+    server = start("TornadoSuperServer.py", SERVER_PORT)
+    pitm = start("PITM.py", PITM_PORT)
+    try:
+        exchange_keys()
+        print("{:>7s} {:>10s} {:>9s} {:>9s} {:>7s}".format("clients", "req/s", "p50 ms", "p99 ms", "errors"))
+        for clients in args.clients:
+            result = load_test(clients, args.duration)
+            print("{:7d} {:10.0f} {:9.1f} {:9.1f} {:7d}".format(
+                clients, result['requests_per_s'], result['p50_ms'], result['p99_ms'], result['errors']))
+    finally:
+        stop(pitm)
+        stop(server)
+
+if __name__ == "__main__":
+    main()
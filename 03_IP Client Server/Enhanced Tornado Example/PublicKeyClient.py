@@ -7,7 +7,9 @@ from cryptography.hazmat.primitives.asymmetric import padding
 import base64
 
 def main():
-    r = requests.get("http://localhost:9100/serverPublicKey/")
+    # Reuse one keep-alive connection for both requests
+    session = requests.Session()
+    r = session.get("http://localhost:9100/serverPublicKey/")
     jsonReply = r.json()
     serverPublicKeyPEM = jsonReply['publicKey'].encode('ASCII')
     serverPublicKey = serialization.load_pem_public_key(serverPublicKeyPEM, backend=default_backend())
@@ -24,12 +26,11 @@ def main():
     encryptedB64 = base64.b64encode(encrypted)
     encryptedB64ASCII = encryptedB64.decode('ASCII')
 
-    r = requests.post("http://localhost:9100/serverPublicKey/",
+    r = session.post("http://localhost:9100/serverPublicKey/",
                       json={'cipher_text': encryptedB64ASCII})
     reply = r.json()
     print(reply['plaintext'])
-
-    pass
+    session.close()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
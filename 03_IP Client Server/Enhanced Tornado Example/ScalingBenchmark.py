@@ -0,0 +1,100 @@
+"""
+Measure how TornadoSuperServer.py --production scales with worker processes.
+
+A wrk style load generator: --threads processes, each holding its share
+of --connections keep-alive connections, send Fernet messages to
+/encrypted/ as fast as the server answers. The server is started with
+each worker count in turn and the table shows requests/sec and latency.
+Scaling is only linear while there are idle cores for both the server
+workers and the load generator.
+
+    python ScalingBenchmark.py --processes 1 2 4 --threads 2 --connections 64
+"""
+import os
+import time
+import json
+import asyncio
+import argparse
+import multiprocessing
+import requests
+from cryptography.fernet import Fernet
+
+from ProxyBenchmark import start, stop
+
+HOST = "localhost"
+PORT = 9100
+PROCESS_COUNTS = (1, 2, 4)
+THREADS = 2       # Load generating processes, like wrk -t
+CONNECTIONS = 64  # Connections across all of them, like wrk -c
+DURATION = 5      # Seconds per worker count
+MESSAGE = "I have a dream that my four little children will one day live in a nation where they will not be judged by the color of their skin but by the content of their character."
+
+def post_request(body):
+    return (f"POST /encrypted/ HTTP/1.1\r\n"
+            f"Host: {HOST}:{PORT}\r\n"
+            f"Content-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n\r\n").encode('ASCII') + body
+
+async def connection(request, stop_time, latencies, errors):
+    reader, writer = await asyncio.open_connection(HOST, PORT)
+    try:
+        while time.perf_counter() < stop_time:
+            start = time.perf_counter()
+            writer.write(request)
+            headers = await reader.readuntil(b"\r\n\r\n")
+            length = 0
+            for line in headers.split(b"\r\n"):
+                if line.lower().startswith(b"content-length:"):
+                    length = int(line.split(b":")[1])
+            await reader.readexactly(length)
+            if headers.startswith(b"HTTP/1.1 200"):
+                latencies.append(time.perf_counter() - start)
+            else:
+                errors.append(1)
+    finally:
+        writer.close()
+
+async def generate_load(request, connections, stop_time):
+    latencies = []
+    errors = []
+    await asyncio.gather(*(connection(request, stop_time, latencies, errors) for _ in range(connections)))
+    return latencies, len(errors)
+
+def load_thread(args):
+    return asyncio.run(generate_load(*args))
+
+def load_test(threads, connections, duration):
+    key = requests.get(f"http://{HOST}:{PORT}/encrypted/").json()['key']
+    cipher_text = Fernet(key).encrypt(MESSAGE.encode('utf-8')).decode('utf-8')
+    request = post_request(json.dumps({'cipher_text': cipher_text}).encode('utf-8'))
+    stop_time = time.perf_counter() + duration
+    shares = [connections // threads + (i < connections % threads) for i in range(threads)]
+    with multiprocessing.Pool(threads) as pool:
+        results = pool.map(load_thread, [(request, share, stop_time) for share in shares])
+    latencies = sorted(latency for thread_latencies, _ in results for latency in thread_latencies)
+    return {'requests_per_s': len(latencies) / duration,
+            'p50_ms': latencies[len(latencies) // 2] * 1000 if latencies else float('nan'),
+            'p99_ms': latencies[int(len(latencies) * 0.99)] * 1000 if latencies else float('nan'),
+            'errors': sum(errors for _, errors in results)}
+
+def main():
+    parser = argparse.ArgumentParser(description="Requests/sec on /encrypted/ by server worker count")
+    parser.add_argument("--processes", type=int, nargs="+", default=PROCESS_COUNTS, help="Server worker counts")
+    parser.add_argument("--threads", type=int, default=THREADS)
+    parser.add_argument("--connections", type=int, default=CONNECTIONS)
+    parser.add_argument("--duration", type=float, default=DURATION)
+    args = parser.parse_args()
+
+    print(f"{os.cpu_count()} CPUs")
+    print("{:>9s} {:>10s} {:>9s} {:>9s} {:>7s}".format("processes", "req/s", "p50 ms", "p99 ms", "errors"))
+    for processes in args.processes:
+        server = start("TornadoSuperServer.py", PORT, "--production", "--processes", str(processes))
+        try:
+            result = load_test(args.threads, args.connections, args.duration)
+        finally:
+            stop(server)
+        print("{:9d} {:10.0f} {:9.1f} {:9.1f} {:7d}".format(
+            processes, result['requests_per_s'], result['p50_ms'], result['p99_ms'], result['errors']))
+
+if __name__ == "__main__":
+    main()
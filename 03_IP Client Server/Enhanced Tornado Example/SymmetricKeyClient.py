@@ -2,16 +2,18 @@ import requests
 from cryptography.fernet import Fernet
 
 def main():
+    # Reuse one keep-alive connection for both requests
+    session = requests.Session()
     # Get the key (Don't actually do this)
-    r = requests.get("http://localhost:9100/encrypted/")
+    r = session.get("http://localhost:9100/encrypted/")
     key = r.json()['key']
     f = Fernet(key)
     plain_text = "I have a dream that my four little children will one day live in a nation where they will not be judged by the color of their skin but by the content of their character."
     cipher_text = f.encrypt(plain_text.encode('utf-8'))
-    r = requests.post("http://localhost:9100/encrypted/", json={'cipher_text': cipher_text.decode('utf-8'), })
+    r = session.post("http://localhost:9100/encrypted/", json={'cipher_text': cipher_text.decode('utf-8'), })
     reply = r.json()
     print(reply['plaintext'])
-    pass
+    session.close()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
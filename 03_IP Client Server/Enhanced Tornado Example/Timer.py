@@ -1,16 +1,21 @@
-from datetime import datetime
+from time import perf_counter_ns
+import statistics
 import logging
 import sys
 
+WARMUP_TRIALS = 3
+TRIALS = 30
+MIN_TRIAL_NS = 2_000_000  # Calls are batched until a trial takes at least this long
+
 class Timer(object):
 
     def __init__(self, counterName, logger=None, loglevel=logging.INFO, blockSize=sys.maxsize):
         self.counterName = counterName
         self.logger = logger if logger else logging.getLogger(__name__)
         self.loglevel = loglevel
-        self.t0 = datetime.now()
-        self.t1 = datetime.now()
-        self.deltat = self.t1 - self.t0
+        self.t0 = perf_counter_ns()
+        self.t1 = perf_counter_ns()
+        self.deltat = (self.t1 - self.t0) / 1e9
         self.counter = 1
         self.blockSize = blockSize
 
@@ -27,26 +32,66 @@ class Timer(object):
         self.report()
 
     def start(self):
-        self.t0 = datetime.now()
+        self.t0 = perf_counter_ns()
         self.counter = 1
 
     def stop(self):
-        self.t1 = datetime.now()
+        self.t1 = perf_counter_ns()
 
     def incr(self):
         self.counter += 1
         if (self.counter % self.blockSize) == 0:
-            self.t1 = datetime.now()
+            self.t1 = perf_counter_ns()
             self.report()
 
     def setCount(self, count):
         self.counter = count
 
     def report(self):
-        self.deltat = self.t1 - self.t0
-        secs = self.deltat.total_seconds()
+        self.deltat = (self.t1 - self.t0) / 1e9
+        secs = self.deltat
 
         secs = secs if secs != 0 else 1
         self.logger.log(self.loglevel, "{0}: {1}, secs: {2}, {0} per second: {3}"
                         .format(self.counterName, self.counter, secs, self.counter / secs))
 
+#
+# Repeated trials, for numbers that show the spread and not just a mean
+#
+
+def time_calls(operation, number):
+    """Returns the nanoseconds number calls of operation take."""
+    t0 = perf_counter_ns()
+    for _ in range(number):
+        operation()
+    return perf_counter_ns() - t0
+
+def calls_per_trial(operation, min_trial_ns=MIN_TRIAL_NS):
+    """Doubles the calls in a trial until it takes min_trial_ns, so fast operations aren't lost in timer overhead."""
+    number = 1
+    while time_calls(operation, number) < min_trial_ns:
+        number *= 2
+    return number
+
+def measure(operation, trials=TRIALS, warmup=WARMUP_TRIALS, min_trial_ns=MIN_TRIAL_NS):
+    """Times operation over repeated trials after warm-up trials.
+
+    Returns statistics of the time per call in nanoseconds across the
+    trials. At least 2 trials are needed for the percentiles.
+    """
+    if trials < 2:
+        raise ValueError("measure needs at least 2 trials, not {}".format(trials))
+    number = calls_per_trial(operation, min_trial_ns)
+    for _ in range(warmup):
+        time_calls(operation, number)
+    times = [time_calls(operation, number) / number for _ in range(trials)]
+    percentiles = statistics.quantiles(times, n=100, method='inclusive')
+    return {'calls_per_trial': number,
+            'trials': trials,
+            'min_ns': min(times),
+            'mean_ns': statistics.fmean(times),
+            'stdev_ns': statistics.stdev(times),
+            'p50_ns': percentiles[49],
+            'p90_ns': percentiles[89],
+            'p99_ns': percentiles[98],
+            'max_ns': max(times)}
@@ -1,10 +1,32 @@
 import tornado.ioloop
 import tornado.web
+import tornado.httpserver
+import tornado.netutil
+import tornado.process
 import time
 import json
 import os
+import re
+import sys
 import base64
 import logging
+import hashlib
+import signal
+import argparse
+import tempfile
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+# The metrics registry is shared with the J1939 examples
+J1939_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, os.pardir, "05_J1939")
+if J1939_DIR not in sys.path:
+    sys.path.append(J1939_DIR)
+from metrics import METRICS
+
+MAX_SESSIONS = 1024  # Client sessions kept by the key exchange
+SESSION_TTL = 300    # Seconds a client session is reused
+MAX_PENDING_DECRYPTS = 64  # RSA decrypts queued or running before posts get a 503
 
 # No encryption
 
@@ -32,9 +54,8 @@ class EncryptedHandler(tornado.web.RequestHandler):
 
     def post(self):
         data = json.loads(self.request.body.decode('utf-8'))
-        logging.debug(f'Got JSON data: {data}')
+        logging.debug('Got JSON data: %s', data)
         cipher_text = data['cipher_text']
-        f = Fernet(SYMMETRIC_KEY)
         plaintext = f.decrypt(cipher_text.encode('utf-8')).decode('utf-8')
         self.write({'ciphertext': cipher_text, 'plaintext': plaintext})
 
@@ -55,6 +76,91 @@ PRIVATE_KEY = rsa.generate_private_key(
 )
 PUBLIC_KEY = PRIVATE_KEY.public_key()
 
+# The padding object is immutable, so one instance serves every request
+OAEP_PADDING = padding.OAEP(
+    mgf=padding.MGF1(algorithm=hashes.SHA256()),
+    algorithm=hashes.SHA256(),
+    label=None
+)
+
+# A production server loads its keys from files, so every worker process has the same keys
+
+KEY_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, os.pardir, "04_Cryptography")
+PRIVATE_KEY_FILE = os.path.join(KEY_DIR, "Daily_Private_RSA2048_key.pem")
+SYMMETRIC_KEY_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "server_symmetric.key")
+
+def load_keys(private_key_file=PRIVATE_KEY_FILE, symmetric_key_file=SYMMETRIC_KEY_FILE):
+    """Replaces the generated keys with keys from files. A missing symmetric key file is created."""
+    global PRIVATE_KEY, PUBLIC_KEY, SYMMETRIC_KEY, f
+    with open(private_key_file, 'rb') as key_file:
+        PRIVATE_KEY = serialization.load_pem_private_key(key_file.read(), password=None, backend=default_backend())
+    PUBLIC_KEY = PRIVATE_KEY.public_key()
+    if not os.path.exists(symmetric_key_file):
+        fd = os.open(symmetric_key_file, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        with os.fdopen(fd, 'wb') as key_file:
+            key_file.write(Fernet.generate_key())
+    with open(symmetric_key_file, 'rb') as key_file:
+        SYMMETRIC_KEY = key_file.read().strip()
+    f = Fernet(SYMMETRIC_KEY)
+
+# RSA decryption is the slowest step here, so the handlers hand it to a pool of worker processes
+# (or threads) and the IOLoop keeps answering other requests meanwhile.
+
+def init_decrypt_worker(private_pem):
+    global PRIVATE_KEY
+    # Ctrl-C is for the server, which shuts the workers down itself
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    PRIVATE_KEY = serialization.load_pem_private_key(private_pem, password=None, backend=default_backend())
+
+def rsa_decrypt(cypherbytes):
+    return PRIVATE_KEY.decrypt(cypherbytes, OAEP_PADDING)
+
+DECRYPT_LATENCY = METRICS.histogram('rsa_decrypt_seconds', "RSA decrypt time, including any wait for a worker")
+DECRYPTS_REJECTED = METRICS.counter('rsa_decrypts_rejected_total', "Decrypts turned away with a 503")
+
+class DecryptPool():
+    """Runs RSA decrypts on an executor with at most max_pending waiting or running.
+
+    Without an executor the decrypt runs on the IOLoop, as before. When the
+    pool is full the request gets a 503, so a burst of decrypts can't queue
+    up without limit.
+    """
+    def __init__(self, executor=None, max_pending=MAX_PENDING_DECRYPTS):
+        self.executor = executor
+        self.max_pending = max_pending
+        self.pending = 0
+
+    async def decrypt(self, cypherbytes):
+        if self.executor is None:
+            with DECRYPT_LATENCY.time():
+                return rsa_decrypt(cypherbytes)
+        if self.pending >= self.max_pending:
+            DECRYPTS_REJECTED.incr()
+            raise tornado.web.HTTPError(503, "Too many decrypts in progress")
+        self.pending += 1
+        try:
+            with DECRYPT_LATENCY.time():
+                return await tornado.ioloop.IOLoop.current().run_in_executor(self.executor, rsa_decrypt, cypherbytes)
+        finally:
+            self.pending -= 1
+
+    def start(self, workers, use_threads=False):
+        if use_threads:
+            self.executor = ThreadPoolExecutor(workers)
+        else:
+            private_pem = PRIVATE_KEY.private_bytes(serialization.Encoding.PEM,
+                                                    serialization.PrivateFormat.PKCS8,
+                                                    serialization.NoEncryption())
+            # Spawned workers don't inherit the listening socket, which would keep the port open if the server died
+            self.executor = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn'),
+                                                initializer=init_decrypt_worker, initargs=(private_pem,))
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown(cancel_futures=True)
+
+DECRYPT_POOL = DecryptPool()
+
 class ServerPublicKeyHandler(tornado.web.RequestHandler):
 
     def get(self):
@@ -65,22 +171,15 @@ class ServerPublicKeyHandler(tornado.web.RequestHandler):
         )
         self.write({'publicKey': pem.decode('ASCII')})
 
-    def post(self):
+    async def post(self):
         data = json.loads(self.request.body.decode('utf-8'))
         cyphertext = data['cipher_text']
-        logging.debug(f"Cyphertext: {cyphertext}")
+        logging.debug("Cyphertext: %s", cyphertext)
         cypherbytes = base64.b64decode(cyphertext)
-        logging.debug(f"Cypherbytes: {cypherbytes}")
+        logging.debug("Cypherbytes: %s", cypherbytes)
 
         try:
-            plaintext = PRIVATE_KEY.decrypt(
-                cypherbytes,
-                padding.OAEP(
-                    mgf=padding.MGF1(algorithm=hashes.SHA256()),
-                    algorithm=hashes.SHA256(),
-                    label=None
-                )
-            )
+            plaintext = await DECRYPT_POOL.decrypt(cypherbytes)
         except ValueError as e:
             logging.warning(f"Value Error: {e}")
             plaintext = None
@@ -89,62 +188,245 @@ class ServerPublicKeyHandler(tornado.web.RequestHandler):
 # Transfer a symmetric key -- kinda like the first example.  But this example uses the client's public key
 # to encrypt the symmetric key, so it is safe from snooping.
 
+class ClientSession():
+    """What the key exchange works out for one client public key."""
+    __slots__ = ('public_key', 'encrypted_symmetric_key', 'expires')
+
+    def __init__(self, clientPublicKeyBytes, expires):
+        self.public_key = serialization.load_der_public_key(clientPublicKeyBytes, backend=default_backend())
+        logging.debug("Symmetric key: %s", SYMMETRIC_KEY)
+        self.encrypted_symmetric_key = self.public_key.encrypt(SYMMETRIC_KEY, OAEP_PADDING)
+        self.expires = expires
+
+class SessionCache():
+    """LRU cache of ClientSessions keyed by a hash of the client public key.
+
+    A client that repeats the key exchange gets the key it was sent before
+    without the server parsing its public key or running RSA again.
+    Sessions expire ttl seconds after they are made, and the least
+    recently used session is dropped when there are max_sessions.
+    A max_sessions of 0 turns the cache off.
+    """
+    def __init__(self, max_sessions=MAX_SESSIONS, ttl=SESSION_TTL):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.sessions = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evicted = 0
+
+    def session(self, clientPublicKeyBytes):
+        now = time.monotonic()
+        key = hashlib.blake2b(clientPublicKeyBytes, digest_size=16).digest()
+        session = self.sessions.get(key)
+        if session is not None:
+            if session.expires > now:
+                self.hits += 1
+                self.sessions.move_to_end(key)
+                return session
+            self.expired += 1
+            del self.sessions[key]
+        self.misses += 1
+        session = ClientSession(clientPublicKeyBytes, now + self.ttl)
+        if self.max_sessions:
+            if len(self.sessions) >= self.max_sessions:
+                self.sessions.popitem(last=False)
+                self.evicted += 1
+            self.sessions[key] = session
+        return session
+
+    def counters(self):
+        return {'sessions': len(self.sessions), 'hits': self.hits, 'misses': self.misses,
+                'expired': self.expired, 'evicted': self.evicted}
+
+SESSION_CACHE = SessionCache()
+
+class SessionCacheHandler(tornado.web.RequestHandler):
+    def get(self):
+        self.write(SESSION_CACHE.counters())
+
 class ServerPublicKeyExchangeHandler(tornado.web.RequestHandler):
 
     def get(self):
         encodedClientPublicKey = self.request.query_arguments['client_publicKey'][0]
         clientPublicKeyBytes = base64.b64decode(encodedClientPublicKey)
-        clientPublicKey = serialization.load_der_public_key(clientPublicKeyBytes, backend=default_backend())
         # provide the symmetric key, but encrypt it with the client public key to keep it secret
-        logging.debug(f"Symmetric key: {SYMMETRIC_KEY}")
-        encryptedSymmetricKey = clientPublicKey.encrypt(SYMMETRIC_KEY,
-                                                        padding.OAEP(
-                                                            mgf=padding.MGF1(algorithm=hashes.SHA256()),
-                                                            algorithm=hashes.SHA256(),
-                                                            label=None)
-                                                        )
+        session = SESSION_CACHE.session(clientPublicKeyBytes)
+        encryptedSymmetricKey = session.encrypted_symmetric_key
         encodedEncryptedSymmetricKey = base64.b64encode(encryptedSymmetricKey).decode('utf-8')
         self.write({'encodedEncryptedSymmetricKey': encodedEncryptedSymmetricKey})
 
-    def post(self):
+    async def post(self):
         data = json.loads(self.request.body.decode('utf-8'))
         cyphertext = data['cipher_text']
-        logging.debug(f"Cyphertext: {cyphertext}")
+        logging.debug("Cyphertext: %s", cyphertext)
         cypherbytes = base64.b64decode(cyphertext)
-        logging.debug(f"Cypherbytes: {cypherbytes}")
+        logging.debug("Cypherbytes: %s", cypherbytes)
 
         try:
-            plaintext = PRIVATE_KEY.decrypt(
-                cypherbytes,
-                padding.OAEP(
-                    mgf=padding.MGF1(algorithm=hashes.SHA256()),
-                    algorithm=hashes.SHA256(),
-                    label=None
-                )
-            )
+            plaintext = await DECRYPT_POOL.decrypt(cypherbytes)
         except ValueError as e:
             logging.warning(f"Value Error: {e}")
             plaintext = None
         self.write({'original_text': data['cipher_text'], 'plaintext': plaintext.decode('utf-8')})
 
+# Large files, like candump logs, are uploaded in AES-GCM chunks with a key derived from the
+# exchanged symmetric key. The body is decrypted and written as it arrives, so a large upload
+# never has to fit in memory.
+
+from encrypted_upload import UploadDecryptor
+
+UPLOAD_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "uploads")
+MAX_UPLOAD_BYTES = 4 << 30
+# Letters, digits, '.', '_' and '-', not starting with a '.', so '', '.', '..' and hidden files are refused
+UPLOAD_NAME = re.compile(r'[A-Za-z0-9_-][A-Za-z0-9._-]*')
+UPLOAD_BYTES = METRICS.counter('upload_bytes_total', "Decrypted bytes written by /upload/")
+
+def max_rss_kb():
+    """Returns the peak resident memory of this process in KiB, or None where there is no resource module (Windows)."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+@tornado.web.stream_request_body
+class UploadHandler(tornado.web.RequestHandler):
+    def prepare(self):
+        self.request.connection.set_max_body_size(MAX_UPLOAD_BYTES)
+        self.name = self.get_query_argument('name', 'upload.log')
+        if not UPLOAD_NAME.fullmatch(self.name):
+            raise tornado.web.HTTPError(400, "Bad upload name")
+        os.makedirs(UPLOAD_DIR, exist_ok=True)
+        self.path = os.path.join(UPLOAD_DIR, self.name)
+        # Each upload writes a file of its own, which only replaces the named file once it is
+        # complete and authenticated, so uploads with the same name can't clobber each other
+        fd, self.part_path = tempfile.mkstemp(prefix='.' + self.name + '.', suffix='.part', dir=UPLOAD_DIR)
+        self.file = os.fdopen(fd, 'wb')
+        self.decryptor = UploadDecryptor(SYMMETRIC_KEY)
+        self.digest = hashlib.sha256()
+        self.size = 0
+        self.error = None
+
+    def data_received(self, chunk):
+        if self.error is not None:
+            return
+        try:
+            plaintexts = self.decryptor.feed(chunk)
+        except ValueError as e:
+            logging.warning("Upload of %s failed: %s", self.name, e)
+            self.error = str(e)
+            return
+        for plaintext in plaintexts:
+            self.file.write(plaintext)
+            self.digest.update(plaintext)
+            self.size += len(plaintext)
+            UPLOAD_BYTES.incr(len(plaintext))
+
+    def post(self):
+        self.file.close()
+        if self.error is None and not self.decryptor.finished:
+            self.error = "The upload ended before its last chunk"
+        if self.error is not None:
+            os.remove(self.part_path)
+            self.set_status(400)
+            self.write({'error': self.error})
+            return
+        os.replace(self.part_path, self.path)
+        reply = {'name': self.name, 'bytes': self.size, 'sha256': self.digest.hexdigest()}
+        rss = max_rss_kb()
+        if rss is not None:
+            reply['max_rss_kb'] = rss
+        self.write(reply)
+
+    def on_connection_close(self):
+        # The client went away in the middle of the upload. There is no file if prepare refused the request.
+        file = getattr(self, 'file', None)
+        if file is not None and not file.closed:
+            file.close()
+            os.remove(self.part_path)
+
+# Request latencies and response codes for every handler, and an endpoint to read them.
+# Each production worker process keeps its own metrics, so /metrics shows the process that answered.
+
+class InstrumentedApplication(tornado.web.Application):
+    def log_request(self, handler):
+        labels = {'handler': type(handler).__name__, 'method': handler.request.method}
+        METRICS.histogram('tornado_request_seconds', "Request handling time", labels).observe(
+            int(handler.request.request_time() * 1e9))
+        METRICS.counter('tornado_responses_total', "Responses by status code",
+                        {'handler': labels['handler'], 'code': handler.get_status()}).incr()
+        super().log_request(handler)
+
+class MetricsHandler(tornado.web.RequestHandler):
+    def get(self):
+        if self.get_query_argument('format', None) == 'json':
+            self.write(METRICS.snapshot())
+        else:
+            self.set_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.write(METRICS.prometheus_text())
+
 def main():
-try:
-    logging.basicConfig(level=logging.DEBUG)
-    port = 9100
-    app = tornado.web.Application([
-        (r"/", MainHandler),
-        (r"/encrypted/", EncryptedHandler),
-        (r"/serverPublicKey/", ServerPublicKeyHandler),
-        (r"/serverPublicKeySymmetricKeyExchange/", ServerPublicKeyExchangeHandler)
-       ], debug = True) #turn off debugging for production
-
-    app.listen(port)
-    print("Listening on port {}".format(port))
-    tornado.ioloop.IOLoop.current().start()
-    #Restart Kernel to stop
-except OSError:
-    os._exit(00)
-    #Be sure to run all
+    parser = argparse.ArgumentParser(description="Tornado server for the encryption examples")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--production", action="store_true",
+                        help="Fork worker processes on one socket, load the keys from files and only log warnings")
+    parser.add_argument("--processes", type=int, default=0,
+                        help="Worker processes in production mode, 0 for one per CPU")
+    parser.add_argument("--private-key", default=PRIVATE_KEY_FILE, help="PEM private key for production mode")
+    parser.add_argument("--symmetric-key", default=SYMMETRIC_KEY_FILE,
+                        help="Fernet key file for production mode, created if missing")
+    parser.add_argument("--max-sessions", type=int, default=MAX_SESSIONS,
+                        help="Client sessions cached by the key exchange, 0 to turn the cache off")
+    parser.add_argument("--session-ttl", type=float, default=SESSION_TTL, help="Seconds a client session is reused")
+    parser.add_argument("--crypto-workers", type=int,
+                        help="Processes for RSA decrypts, 0 to decrypt on the IOLoop "
+                             "(default: one per CPU, or 0 in production mode, where the server processes share the load)")
+    parser.add_argument("--crypto-threads", action="store_true", help="Use threads instead of processes")
+    parser.add_argument("--max-pending-decrypts", type=int, default=MAX_PENDING_DECRYPTS)
+    args = parser.parse_args()
+    if args.crypto_workers is None:
+        args.crypto_workers = 0 if args.production else os.cpu_count()
+    # Stop cleanly on SIGTERM too, so the decrypt workers are shut down
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    DECRYPT_POOL.max_pending = args.max_pending_decrypts
+    SESSION_CACHE.max_sessions = args.max_sessions
+    SESSION_CACHE.ttl = args.session_ttl
+    try:
+        port = args.port
+        app = InstrumentedApplication([
+            (r"/", MainHandler),
+            (r"/encrypted/", EncryptedHandler),
+            (r"/serverPublicKey/", ServerPublicKeyHandler),
+            (r"/serverPublicKeySymmetricKeyExchange/", ServerPublicKeyExchangeHandler),
+            (r"/sessionCache/", SessionCacheHandler),
+            (r"/upload/", UploadHandler),
+            (r"/metrics", MetricsHandler)
+           ], debug = not args.production) #turn off debugging for production
+
+        if args.production:
+            logging.basicConfig(level=logging.WARNING)
+            load_keys(args.private_key, args.symmetric_key)
+            # Bind before forking, so the kernel shares the connections out among the workers
+            sockets = tornado.netutil.bind_sockets(port)
+            print("Listening on port {} with {} processes".format(port, args.processes or os.cpu_count()))
+            tornado.process.fork_processes(args.processes)
+            server = tornado.httpserver.HTTPServer(app)
+            server.add_sockets(sockets)
+        else:
+            logging.basicConfig(level=logging.DEBUG)
+            app.listen(port)
+            print("Listening on port {}".format(port))
+        if args.crypto_workers:
+            DECRYPT_POOL.start(args.crypto_workers, args.crypto_threads)
+        tornado.ioloop.IOLoop.current().start()
+        #Restart Kernel to stop
+    except OSError:
+        os._exit(00)
+        #Be sure to run all
+    finally:
+        DECRYPT_POOL.shutdown()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,120 @@
+"""
+Upload large log files to TornadoSuperServer.py in encrypted chunks.
+
+The client gets the server's symmetric key with the key exchange of
+KeyExchangeClient.py, then streams the file to /upload/ in AES-GCM
+chunks (see encrypted_upload.py). Neither side holds more than a chunk
+of the file in memory. To upload a file to a running server:
+
+    python UploadClient.py --file candump.log
+
+Without --file it starts a server and uploads candump logs of growing
+size, made by repeating 05_J1939/KWTruck.txt, and reports MB/s and the
+peak memory of the client and the server.
+"""
+import os
+import time
+import base64
+import hashlib
+import argparse
+import tempfile
+import requests
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.asymmetric import padding
+from cryptography.hazmat.primitives.asymmetric import rsa
+from cryptography.hazmat.primitives.serialization import Encoding, PublicFormat
+
+from encrypted_upload import encrypt_file, CHUNK_SIZE
+from ProxyBenchmark import start, stop
+
+PORT = 9100
+SERVER_URL = f"http://localhost:{PORT}"
+SIZES_MB = (16, 64, 256)
+SAMPLE_LOG = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, os.pardir, "05_J1939", "KWTruck.txt")
+
+def exchange_keys(session):
+    """Returns the server's symmetric key, sent encrypted with a new client public key."""
+    private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048, backend=default_backend())
+    encodedClientPublicKey = base64.b64encode(private_key.public_key().public_bytes(Encoding.DER, PublicFormat.SubjectPublicKeyInfo))
+    r = session.get(f"{SERVER_URL}/serverPublicKeySymmetricKeyExchange/", params={'client_publicKey': encodedClientPublicKey})
+    encryptedSymmetricKey = base64.b64decode(r.json()['encodedEncryptedSymmetricKey'])
+    return private_key.decrypt(encryptedSymmetricKey, padding.OAEP(mgf=padding.MGF1(algorithm=hashes.SHA256()),
+                                                                   algorithm=hashes.SHA256(),
+                                                                   label=None))
+
+def upload(session, filename, symmetric_key, chunk_size=CHUNK_SIZE):
+    """Streams a file to the server. Returns the server's reply."""
+    with open(filename, 'rb') as f:
+        # A generator body is sent with chunked transfer encoding, one encrypted chunk at a time
+        r = session.post(f"{SERVER_URL}/upload/", params={'name': os.path.basename(filename)},
+                         data=encrypt_file(f, symmetric_key, chunk_size))
+    r.raise_for_status()
+    return r.json()
+
+def make_log(filename, size):
+    """Writes a candump log of about size bytes by repeating the sample log."""
+    with open(SAMPLE_LOG, 'rb') as f:
+        sample = f.read()
+    with open(filename, 'wb') as f:
+        for _ in range(-(-size // len(sample))):
+            f.write(sample)
+
+def file_sha256(filename):
+    digest = hashlib.sha256()
+    with open(filename, 'rb') as f:
+        for block in iter(lambda: f.read(CHUNK_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def max_rss_kb():
+    """Returns the peak resident memory of this process in KiB, or None where there is no resource module (Windows)."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+def rss_mb(rss_kb):
+    return "{:.1f}".format(rss_kb / 1024) if rss_kb is not None else "-"
+
+def benchmark(sizes_mb, chunk_size):
+    server = start("TornadoSuperServer.py", PORT, "--production", "--processes", "1")
+    log_file = os.path.join(tempfile.gettempdir(), "upload_benchmark.log")
+    try:
+        with requests.Session() as session:
+            symmetric_key = exchange_keys(session)
+            print("{:>8s} {:>10s} {:>8s} {:>15s} {:>15s}".format("MB", "seconds", "MB/s", "client RSS MB", "server RSS MB"))
+            for size_mb in sizes_mb:
+                make_log(log_file, size_mb << 20)
+                size = os.path.getsize(log_file)
+                start_time = time.perf_counter()
+                reply = upload(session, log_file, symmetric_key, chunk_size)
+                elapsed = time.perf_counter() - start_time
+                if reply['bytes'] != size or reply['sha256'] != file_sha256(log_file):
+                    raise RuntimeError("The server stored a different file")
+                os.remove(os.path.join(os.path.dirname(os.path.abspath(__file__)), "uploads", reply['name']))
+                print("{:8.0f} {:10.2f} {:8.1f} {:>15s} {:>15s}".format(
+                    size / 1e6, elapsed, size / 1e6 / elapsed,
+                    rss_mb(max_rss_kb()), rss_mb(reply.get('max_rss_kb'))))
+    finally:
+        stop(server)
+        if os.path.exists(log_file):
+            os.remove(log_file)
+
+def main():
+    parser = argparse.ArgumentParser(description="Upload log files to TornadoSuperServer.py in encrypted chunks")
+    parser.add_argument("--file", help="Upload this file instead of running the benchmark")
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES_MB, help="Benchmark file sizes in MB")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help="Plaintext bytes per encrypted chunk")
+    args = parser.parse_args()
+
+    if args.file:
+        with requests.Session() as session:
+            reply = upload(session, args.file, exchange_keys(session), args.chunk_size)
+        print("Stored {} bytes as {}, sha256 {}".format(reply['bytes'], reply['name'], reply['sha256']))
+        return
+    benchmark(args.sizes, args.chunk_size)
+
+if __name__ == "__main__":
+    main()
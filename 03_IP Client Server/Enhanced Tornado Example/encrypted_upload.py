@@ -0,0 +1,112 @@
+"""
+Chunked AES-GCM format for streaming large log uploads.
+
+An upload starts with UPLOAD_HEADER: the magic b'CANU', a version byte
+and a random salt. The AES-256-GCM key for the upload is derived with
+HKDF from the Fernet key handed out by the key exchange and the salt,
+so every upload is encrypted with a key of its own. The file follows
+as chunks:
+
+    u32  length of the encrypted chunk, including the 16 byte tag
+    u8   1 for the last chunk, otherwise 0
+    the encrypted chunk
+
+The nonce of a chunk is its index, and the chunk header is
+authenticated along with the data, so the server notices chunks that
+are changed, reordered or dropped, and uploads that are cut short.
+"""
+import os
+import base64
+import struct
+from cryptography.exceptions import InvalidTag
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+
+MAGIC = b'CANU'
+VERSION = 1
+SALT_SIZE = 16
+UPLOAD_HEADER = struct.Struct('>4sB16s')
+CHUNK_HEADER = struct.Struct('>LB')
+TAG_SIZE = 16
+CHUNK_SIZE = 1 << 20       # Plaintext bytes per chunk
+MAX_CHUNK_SIZE = 16 << 20  # Largest chunk the server accepts, so a bad length can't exhaust memory
+HKDF_INFO = b'CAN log upload'
+
+def upload_key(symmetric_key, salt):
+    """Derives the AES-GCM key of an upload from the exchanged Fernet key."""
+    return HKDF(algorithm=hashes.SHA256(), length=32, salt=salt,
+                info=HKDF_INFO).derive(base64.urlsafe_b64decode(symmetric_key))
+
+def chunk_nonce(index):
+    return index.to_bytes(12, 'big')
+
+def encrypt_file(f, symmetric_key, chunk_size=CHUNK_SIZE):
+    """Yields the encrypted upload of a binary file object, one chunk at a time."""
+    salt = os.urandom(SALT_SIZE)
+    aesgcm = AESGCM(upload_key(symmetric_key, salt))
+    yield UPLOAD_HEADER.pack(MAGIC, VERSION, salt)
+    index = 0
+    chunk = f.read(chunk_size)
+    while True:
+        next_chunk = f.read(chunk_size)
+        last = not next_chunk
+        header = CHUNK_HEADER.pack(len(chunk) + TAG_SIZE, last)
+        yield header + aesgcm.encrypt(chunk_nonce(index), chunk, header)
+        if last:
+            return
+        chunk = next_chunk
+        index += 1
+
+class UploadDecryptor():
+    """Decrypts an upload that arrives in pieces of any size.
+
+    feed returns the plaintext of each chunk as soon as the whole chunk
+    has arrived, so only one chunk is buffered at a time. It raises
+    ValueError for anything that isn't a valid upload.
+    """
+    def __init__(self, symmetric_key):
+        self.symmetric_key = symmetric_key
+        self.aesgcm = None
+        self.buffer = bytearray()
+        self.index = 0
+        self.finished = False
+
+    def feed(self, data):
+        if self.finished:
+            raise ValueError("Data after the last chunk")
+        self.buffer += data
+        plaintexts = []
+        position = 0
+        if self.aesgcm is None:
+            if len(self.buffer) < UPLOAD_HEADER.size:
+                return plaintexts
+            magic, version, salt = UPLOAD_HEADER.unpack_from(self.buffer)
+            if magic != MAGIC or version != VERSION:
+                raise ValueError("Not an encrypted upload")
+            self.aesgcm = AESGCM(upload_key(self.symmetric_key, salt))
+            position = UPLOAD_HEADER.size
+        view = memoryview(self.buffer)
+        while len(self.buffer) - position >= CHUNK_HEADER.size:
+            length, last = CHUNK_HEADER.unpack_from(self.buffer, position)
+            if length < TAG_SIZE or length > MAX_CHUNK_SIZE + TAG_SIZE:
+                raise ValueError("Bad chunk length {}".format(length))
+            end = position + CHUNK_HEADER.size + length
+            if len(self.buffer) < end:
+                break
+            try:
+                plaintexts.append(self.aesgcm.decrypt(chunk_nonce(self.index),
+                                                      view[position + CHUNK_HEADER.size:end],
+                                                      view[position:position + CHUNK_HEADER.size]))
+            except InvalidTag:
+                raise ValueError("Chunk {} failed authentication".format(self.index))
+            self.index += 1
+            position = end
+            if last:
+                self.finished = True
+                break
+        view.release()
+        del self.buffer[:position]
+        if self.finished and self.buffer:
+            raise ValueError("Data after the last chunk")
+        return plaintexts
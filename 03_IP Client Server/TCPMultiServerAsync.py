@@ -0,0 +1,112 @@
+"""
+Echo server for many clients on a single thread with asyncio.
+
+This serves the same echo protocol as TCPMultiServerThreaded.py, but
+each connection is a coroutine instead of a thread, so thousands of
+clients only cost a small buffer each. Printing every message is slow
+and makes the latency depend on the console, so per-message logging is
+only done when the log level is DEBUG.
+
+Run it and connect with the Basic Client notebook or echo_benchmark.py:
+    python TCPMultiServerAsync.py --port 12354 --read-size 4096 --verbose
+Stop it with Ctrl-C. Open connections get a few seconds to finish.
+"""
+import asyncio
+import argparse
+import logging
+import signal
+
+HOST = '127.0.0.1'  # Standard loopback interface address (localhost)
+PORT = 12354        # Port to listen on (non-privileged ports are > 1023)
+
+READ_SIZE = 1024      # Bytes requested per read, the same as the threaded server
+SHUTDOWN_TIMEOUT = 5  # Seconds to let open connections finish when stopping
+BACKLOG = 1024        # Pending connections queued by the operating system
+
+logger = logging.getLogger(__name__)
+
+class EchoServer():
+    def __init__(self, host=HOST, port=PORT, read_size=READ_SIZE):
+        self.host = host
+        self.port = port
+        self.read_size = read_size
+        self.server = None
+        self.connections = set()
+        self.connection_count = 0
+
+    async def handle_client(self, reader, writer):
+        task = asyncio.current_task()
+        self.connections.add(task)
+        self.connection_count += 1
+        # Check once so the loop below doesn't format messages that are never shown
+        debug = logger.isEnabledFor(logging.DEBUG)
+        peer = writer.get_extra_info('peername')
+        if debug:
+            logger.debug("Echoing %s", peer)
+        num_lines = 0
+        try:
+            while True:
+                data = await reader.read(self.read_size)
+                if not data:
+                    break
+                writer.write(data)
+                # Wait when the client isn't reading its echoes fast enough
+                await writer.drain()
+                num_lines += 1
+                if debug:
+                    logger.debug("received data from %s: %r, count: %d", peer, data, num_lines)
+        except ConnectionError:
+            pass
+        finally:
+            self.connections.discard(task)
+            writer.close()
+            if debug:
+                logger.debug("end of data from %s after %d reads", peer, num_lines)
+
+    async def start(self):
+        self.server = await asyncio.start_server(self.handle_client, self.host, self.port,
+                                                 backlog=BACKLOG, limit=self.read_size)
+        logger.info("Listening on %s:%d", self.host, self.port)
+
+    async def stop(self, timeout=SHUTDOWN_TIMEOUT):
+        """Stops accepting, then gives the open connections time to finish before cancelling them.
+
+        Since Python 3.12 wait_closed also waits for every open connection,
+        so it is only awaited once the connections have been cancelled.
+        """
+        self.server.close()
+        if self.connections:
+            logger.info("Waiting for %d connections to close", len(self.connections))
+            done, pending = await asyncio.wait(self.connections, timeout=timeout)
+            # Cancelling a connection closes its writer
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+        try:
+            await asyncio.wait_for(self.server.wait_closed(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning("Server still closing after %s seconds", timeout)
+        logger.info("Stopped after %d connections", self.connection_count)
+
+    async def serve(self):
+        """Runs until SIGINT or SIGTERM."""
+        await self.start()
+        stop_event = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for signal_number in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(signal_number, stop_event.set)
+        await stop_event.wait()
+        await self.stop()
+
+def main(host=HOST, port=PORT, read_size=READ_SIZE):
+    asyncio.run(EchoServer(host, port, read_size).serve())
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Single threaded asyncio echo server")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--read-size", type=int, default=READ_SIZE, help="Bytes per read from each client")
+    parser.add_argument("--verbose", action="store_true", help="Log every message (slow)")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO)
+    main(args.host, args.port, args.read_size)
@@ -5,34 +5,48 @@ HOST = '127.0.0.1'  # Standard loopback interface address (localhost)
 PORT = 12354        # Port to listen on (non-privileged ports are > 1023)
 
 class EchoThread(Thread):
-    def __init__(self, conn):
+    def __init__(self, conn, verbose=True):
         super().__init__()
         self.conn = conn
+        self.verbose = verbose
 
     def run(self):
-        print()
-        print(f"Echoing {self.conn}")
+        if self.verbose:
+            print()
+            print(f"Echoing {self.conn}")
         numLines = 0
         while True:
-            data = self.conn.recv(1024)
+            try:
+                data = self.conn.recv(1024)
+            except ConnectionError:
+                data = b''
             if not data:
-                print("end of data, stopping")
+                if self.verbose:
+                    print("end of data, stopping")
+                self.conn.close()
                 return
             self.conn.sendall(data)
             numLines += 1
-            print(f"received data from {self.conn}")
-            print(f"  data: {data}, count: {numLines}")
+            if self.verbose:
+                print(f"received data from {self.conn}")
+                print(f"  data: {data}, count: {numLines}")
 
-def main(host, port):
+def main(host, port, verbose=True):
+    # Set verbose to False to stop printing every message, such as when
+    # comparing with TCPMultiServerAsync.py in echo_benchmark.py
     s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
     s.bind((host, port))
-    s.listen()
+    s.listen(1024)
 
     while True:
-        print("Main thread waiting for connections")
+        if verbose:
+            print("Main thread waiting for connections")
         srvConn, addr = s.accept()
-        eThread = EchoThread(srvConn)
-        print(f"connection from {addr}, spawning echo thread {eThread.name}")
+        eThread = EchoThread(srvConn, verbose)
+        if verbose:
+            print(f"connection from {addr}, spawning echo thread {eThread.name}")
         eThread.start()
 
-main(HOST, PORT)
\ No newline at end of file
+if __name__ == '__main__':
+    main(HOST, PORT)
\ No newline at end of file
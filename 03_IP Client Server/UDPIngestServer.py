@@ -0,0 +1,189 @@
+"""
+Receive CAN frames forwarded over UDP from many gateways.
+
+Each datagram holds one or more CAN frames packed in the SocketCAN
+layout used in the J1939 notebooks (struct format "<LB3x8s", 16 bytes
+per frame). The server drains the socket in batches with recv_into, so
+datagrams are written straight into slots of a ring of preallocated
+buffers instead of a new bytes object per packet. Each filled buffer is
+decoded in one step as a NumPy array of frames. Datagrams longer than a
+slot are counted as malformed rather than read in part.
+
+Every report interval it prints the packet and frame rates, malformed
+datagrams, and the datagrams the kernel dropped because the socket
+receive buffer was full.
+
+    python UDPIngestServer.py --port 12354 --rcvbuf 8388608
+    python UDPMultiClient.py --load --senders 4 --rate 50000
+"""
+import time
+import socket
+import argparse
+import selectors
+import numpy as np
+
+HOST = '127.0.0.1'  # Standard loopback interface address (localhost)
+PORT = 12354        # Port to listen on (non-privileged ports are > 1023)
+
+CAN_FRAME_FORMAT = "<LB3x8s"
+CAN_FRAME_SIZE = 16
+# The same layout as CAN_FRAME_FORMAT, for decoding a buffer all at once
+CAN_FRAME_DTYPE = np.dtype([('can_id', '<u4'),
+                            ('dlc', np.uint8),
+                            ('pad', 'V3'),
+                            ('data', np.uint8, (8,))])
+CAN_EFF_FLAG = 0x80000000
+CAN_EFF_MASK = 0x1FFFFFFF
+
+MAX_DATAGRAM = 1472     # The largest UDP payload that fits in a 1500 byte Ethernet frame
+FRAMES_PER_SLOT = MAX_DATAGRAM // CAN_FRAME_SIZE
+# With MSG_TRUNC, Linux returns the whole length of a datagram that didn't fit
+RECV_FLAGS = getattr(socket, 'MSG_TRUNC', 0)
+BATCH_BYTES = 1 << 20   # Size of each buffer in the ring
+RING_BUFFERS = 4        # Decoded batches stay valid until the ring wraps around
+RCVBUF = 8 << 20        # Requested socket receive buffer size
+REPORT_INTERVAL = 1.0   # Seconds between statistics reports
+
+def read_udp_drops(port):
+    """Returns the kernel's drop count for the UDP socket on a port, or None if it can't be read.
+
+    Linux lists it in the last column of /proc/net/udp.
+    """
+    try:
+        with open('/proc/net/udp', 'r') as f:
+            next(f)
+            for line in f:
+                fields = line.split()
+                if int(fields[1].split(':')[1], 16) == port:
+                    return int(fields[-1])
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+class UDPIngestServer():
+    def __init__(self, host=HOST, port=PORT, rcvbuf=RCVBUF, batch_bytes=BATCH_BYTES,
+                 ring_buffers=RING_BUFFERS, on_batch=None):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, rcvbuf)
+        self.sock.bind((host, port))
+        self.sock.setblocking(False)
+        self.port = self.sock.getsockname()[1]
+        # Each datagram is read into a slot of its own, so the slot views are made once here
+        self.slots = max(batch_bytes // MAX_DATAGRAM, 1)
+        self.ring = [bytearray(self.slots * MAX_DATAGRAM) for _ in range(ring_buffers)]
+        self.ring_slots = [[memoryview(buffer)[start:start + MAX_DATAGRAM]
+                            for start in range(0, len(buffer), MAX_DATAGRAM)]
+                           for buffer in self.ring]
+        self.slot_frames = np.zeros(self.slots, dtype=np.intp)
+        self.ring_index = 0
+        self.on_batch = on_batch
+        self.selector = selectors.DefaultSelector()
+        self.selector.register(self.sock, selectors.EVENT_READ)
+        self.packets = 0
+        self.frames = 0
+        self.malformed = 0
+        self.start_drops = read_udp_drops(self.port)
+
+    def drain(self):
+        """Reads datagrams until the socket is empty or every slot is full.
+
+        Returns a NumPy array of the frames. When every datagram filled its
+        slot, as under load, it is a view into the ring buffer. Otherwise
+        the frames are copied out of the slots in one step.
+        """
+        slot_views = self.ring_slots[self.ring_index]
+        slot_frames = self.slot_frames
+        used = 0
+        full = True
+        recv_into = self.sock.recv_into
+        while used < self.slots:
+            try:
+                nbytes = recv_into(slot_views[used], MAX_DATAGRAM, RECV_FLAGS)
+            except BlockingIOError:
+                break
+            self.packets += 1
+            if nbytes == 0 or nbytes > MAX_DATAGRAM or nbytes % CAN_FRAME_SIZE:
+                # Not whole frames, or cut short to fit the slot, so leave it to be overwritten
+                self.malformed += 1
+                continue
+            slot_frames[used] = nbytes // CAN_FRAME_SIZE
+            full = full and nbytes == MAX_DATAGRAM
+            used += 1
+        frames = np.frombuffer(self.ring[self.ring_index], dtype=CAN_FRAME_DTYPE,
+                               count=used * FRAMES_PER_SLOT)
+        if not full:
+            frames = frames.reshape(used, FRAMES_PER_SLOT)[
+                np.arange(FRAMES_PER_SLOT) < slot_frames[:used, None]]
+        self.ring_index = (self.ring_index + 1) % len(self.ring)
+        self.frames += len(frames)
+        return frames
+
+    def drops(self):
+        drops = read_udp_drops(self.port)
+        if drops is None or self.start_drops is None:
+            return None
+        return drops - self.start_drops
+
+    def serve(self, duration=None, report_interval=REPORT_INTERVAL):
+        start = time.perf_counter()
+        next_report = start + report_interval
+        last_packets = 0
+        last_frames = 0
+        last_time = start
+        while True:
+            self.selector.select(report_interval)
+            frames = self.drain()
+            if len(frames) and self.on_batch is not None:
+                self.on_batch(frames)
+            now = time.perf_counter()
+            if now >= next_report:
+                elapsed = now - last_time
+                print("{:10.0f} packets/s {:10.0f} frames/s  malformed {}  dropped {}".format(
+                    (self.packets - last_packets) / elapsed,
+                    (self.frames - last_frames) / elapsed,
+                    self.malformed, self.drops()))
+                last_packets = self.packets
+                last_frames = self.frames
+                last_time = now
+                next_report = now + report_interval
+            if duration is not None and now - start >= duration:
+                return
+
+    def close(self):
+        self.selector.close()
+        self.sock.close()
+
+def count_ids(counts):
+    """Returns an on_batch handler that counts frames per CAN ID."""
+    def on_batch(frames):
+        ids, id_counts = np.unique(frames['can_id'] & CAN_EFF_MASK, return_counts=True)
+        for can_id, count in zip(ids.tolist(), id_counts.tolist()):
+            counts[can_id] = counts.get(can_id, 0) + count
+    return on_batch
+
+def main():
+    parser = argparse.ArgumentParser(description="UDP ingest server for packed CAN frames")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--rcvbuf", type=int, default=RCVBUF, help="Socket receive buffer size in bytes")
+    parser.add_argument("--batch-bytes", type=int, default=BATCH_BYTES, help="Size of each ring buffer")
+    parser.add_argument("--duration", type=float, help="Seconds to run before stopping")
+    args = parser.parse_args()
+
+    counts = {}
+    server = UDPIngestServer(args.host, args.port, args.rcvbuf, args.batch_bytes, on_batch=count_ids(counts))
+    print("Listening on {}:{}".format(args.host, server.port))
+    try:
+        server.serve(args.duration)
+    except KeyboardInterrupt:
+        pass
+    # The drop count is only available while the socket is open
+    dropped = server.drops()
+    server.close()
+    print("{} packets, {} frames, {} malformed, {} dropped".format(
+        server.packets, server.frames, server.malformed, dropped))
+    for can_id, count in sorted(counts.items(), key=lambda item: -item[1])[:10]:
+        print("{:08X} {:10d}".format(can_id, count))
+
+if __name__ == '__main__':
+    main()
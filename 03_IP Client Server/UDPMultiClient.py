@@ -1,13 +1,94 @@
 import socket
 import os
 import time
+import struct
+import argparse
+import multiprocessing
 
 HOST = '127.0.0.1'  # The server's hostname or IP address
 PORT = 12354        # The port used by the server
 
-with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
-    for i in range(10):
-        s.sendto(f'Hello, world ({os.getpid()})'.encode('UTF-8'), (HOST, PORT))
-        data = s.recv(1024)
-        print(i, data)
-        time.sleep(2)
+# SocketCAN frame layout used in the J1939 notebooks and UDPIngestServer.py
+CAN_FRAME_FORMAT = "<LB3x8s"
+CAN_EFF_FLAG = 0x80000000
+MAX_FRAMES_PER_PACKET = 92  # 92 frames of 16 bytes fit in one 1472 byte datagram
+
+def hello(host, port):
+    """Sends a few greetings to an echo server, as in the UDP notebooks."""
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+        for i in range(10):
+            s.sendto(f'Hello, world ({os.getpid()})'.encode('UTF-8'), (host, port))
+            data = s.recv(1024)
+            print(i, data)
+            time.sleep(2)
+
+def make_packet(sender, frames_per_packet):
+    """Packs frames_per_packet CAN frames into one datagram."""
+    return b''.join(struct.pack(CAN_FRAME_FORMAT,
+                                (0x18FEF100 | (sender & 0xFF)) | CAN_EFF_FLAG,
+                                8,
+                                struct.pack('<HHL', sender, i, 0))
+                    for i in range(frames_per_packet))
+
+def send_load(sender, host, port, rate, frames_per_packet, duration, results):
+    """Sends datagrams at a target rate in packets per second. A rate of 0 sends as fast as possible."""
+    packet = make_packet(sender, frames_per_packet)
+    sent = 0
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+        s.connect((host, port))
+        start = time.perf_counter()
+        end = start + duration
+        now = start
+        while now < end:
+            if rate:
+                # Send whatever is due so far, then sleep until more is due
+                due = int((now - start) * rate) - sent
+                if due <= 0:
+                    time.sleep(min(0.001, end - now))
+                    now = time.perf_counter()
+                    continue
+            else:
+                due = 1000
+            for _ in range(due):
+                try:
+                    s.send(packet)
+                    sent += 1
+                except (BlockingIOError, ConnectionRefusedError):
+                    pass
+            now = time.perf_counter()
+    results.put((sent, now - start))
+
+def main():
+    parser = argparse.ArgumentParser(description="UDP client. Without --load it greets an echo server.")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--load", action="store_true", help="Send CAN frames to UDPIngestServer.py")
+    parser.add_argument("--senders", type=int, default=1, help="Number of sending processes")
+    parser.add_argument("--rate", type=float, default=10000, help="Total packets per second, 0 for no limit")
+    parser.add_argument("--frames", type=int, default=1, choices=range(1, MAX_FRAMES_PER_PACKET + 1),
+                        metavar="1-{}".format(MAX_FRAMES_PER_PACKET), help="CAN frames per packet")
+    parser.add_argument("--duration", type=float, default=10, help="Seconds to send for")
+    args = parser.parse_args()
+
+    if not args.load:
+        hello(args.host, args.port)
+        return
+
+    results = multiprocessing.Queue()
+    senders = [multiprocessing.Process(target=send_load,
+                                       args=(i, args.host, args.port, args.rate / args.senders,
+                                             args.frames, args.duration, results))
+               for i in range(args.senders)]
+    for sender in senders:
+        sender.start()
+    totals = [results.get() for _ in senders]
+    for sender in senders:
+        sender.join()
+    sent = sum(count for count, elapsed in totals)
+    elapsed = max(elapsed for count, elapsed in totals)
+    print("Sent {} packets ({} frames, {} bytes each) in {:0.2f} s: {:0.0f} packets/s, {:0.0f} frames/s".format(
+        sent, sent * args.frames, args.frames * struct.calcsize(CAN_FRAME_FORMAT), elapsed,
+        sent / elapsed, sent * args.frames / elapsed))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,129 @@
+"""
+Compact wire protocol for streaming CAN frames over TCP.
+
+A connection starts with the 4 byte STREAM_MAGIC. After that, each
+batch of frames is sent as:
+
+    u32  length of the rest of the batch
+    header (BATCH_HEADER, little endian):
+        u8   flags, FLAG_ZLIB when the body is compressed
+        u16  number of frames
+        u64  timestamp of the first frame in microseconds
+    body, columns one after another:
+        i32  timestamp delta from the previous frame in microseconds, per frame
+        u32  CAN ID, per frame
+        u8   DLC, per frame
+        the data bytes of every frame, DLC bytes each
+
+When the client has sent everything, it shuts down its side of the
+connection and the server answers with ACK, the number of frames stored.
+
+Storing the columns separately keeps similar bytes together, which
+helps zlib, and lets the batch be encoded and decoded with NumPy.
+"""
+import struct
+import zlib
+import numpy as np
+
+STREAM_MAGIC = b'CANS'
+ACK = struct.Struct('<Q')  # Frames stored, sent back after the client shuts down its side
+LENGTH_PREFIX = struct.Struct('<L')
+BATCH_HEADER = struct.Struct('<BHQ')
+FLAG_ZLIB = 0x01
+MAX_BATCH_FRAMES = 0xFFFF
+MAX_BATCH_BYTES = 1 << 24  # Limit on an incoming batch, so a bad length can't exhaust memory
+FRAME_BYTES = 4 + 4 + 1 + 8  # Largest body size of one frame: delta, CAN ID, DLC and data
+DELTA_MIN = -(1 << 31)
+DELTA_MAX = (1 << 31) - 1
+ZLIB_LEVEL = 1             # Fast compression; higher levels save little on CAN data
+
+def encode_batch(timestamps_us, can_ids, dlcs, data, compress=False):
+    """Packs columns of frames into length prefixed batches.
+
+    timestamps_us are integers, data is an (n, 8) uint8 array with the
+    payload left aligned. Usually this is one batch, but a gap between
+    frames too long for an i32 delta (about 35 minutes) starts a new
+    batch with its own base timestamp. The batches are returned joined,
+    ready to send.
+    """
+    count = len(can_ids)
+    if count > MAX_BATCH_FRAMES:
+        raise ValueError("A batch holds at most {} frames".format(MAX_BATCH_FRAMES))
+    timestamps_us = np.asarray(timestamps_us, dtype=np.int64)
+    dlcs = np.minimum(np.asarray(dlcs, dtype=np.uint8), 8)
+    data = np.asarray(data, dtype=np.uint8)
+    base = int(timestamps_us[0]) if count else 0
+    deltas = np.diff(timestamps_us, prepend=base)
+    gaps = np.flatnonzero((deltas < DELTA_MIN) | (deltas > DELTA_MAX))
+    if len(gaps):
+        can_ids = np.asarray(can_ids)
+        bounds = [0] + gaps.tolist() + [count]
+        return b''.join(encode_batch(timestamps_us[start:end], can_ids[start:end], dlcs[start:end],
+                                     data[start:end], compress)
+                        for start, end in zip(bounds[:-1], bounds[1:]))
+    deltas = deltas.astype('<i4')
+    # Keep only the first dlc bytes of each row
+    payload = data[np.arange(data.shape[1]) < dlcs[:, None]]
+    body = b''.join((deltas.tobytes(),
+                     np.asarray(can_ids, dtype='<u4').tobytes(),
+                     dlcs.tobytes(),
+                     payload.tobytes()))
+    flags = 0
+    if compress:
+        body = zlib.compress(body, ZLIB_LEVEL)
+        flags |= FLAG_ZLIB
+    header = BATCH_HEADER.pack(flags, count, base)
+    return LENGTH_PREFIX.pack(len(header) + len(body)) + header + body
+
+def decode_batch(batch):
+    """Unpacks a batch without its length prefix into a dictionary of columns."""
+    flags, count, base = BATCH_HEADER.unpack_from(batch)
+    body = batch[BATCH_HEADER.size:]
+    if flags & FLAG_ZLIB:
+        # Limit the output to the largest body count frames can need, so a
+        # small batch can't expand without bound
+        decompressor = zlib.decompressobj()
+        body = decompressor.decompress(body, count * FRAME_BYTES)
+        if decompressor.unconsumed_tail or not decompressor.eof:
+            raise ValueError("Compressed batch is larger than its frames")
+    position = 0
+    deltas = np.frombuffer(body, dtype='<i4', count=count, offset=position)
+    position += 4 * count
+    can_ids = np.frombuffer(body, dtype='<u4', count=count, offset=position)
+    position += 4 * count
+    dlcs = np.frombuffer(body, dtype=np.uint8, count=count, offset=position)
+    position += count
+    payload = np.frombuffer(body, dtype=np.uint8, offset=position)
+    if len(payload) != int(dlcs.sum(dtype=np.int64)):
+        raise ValueError("Batch payload does not match the data lengths")
+    data = np.zeros((count, 8), dtype=np.uint8)
+    data[np.arange(8) < dlcs[:, None]] = payload
+    return {'timestamp_us': base + np.cumsum(deltas, dtype=np.int64),
+            'can_id': can_ids,
+            'dlc': dlcs,
+            'data': data}
+
+def recv_exactly(sock, size):
+    """Reads size bytes from a socket. Returns fewer only if the connection closes."""
+    buffer = bytearray(size)
+    view = memoryview(buffer)
+    position = 0
+    while position < size:
+        nbytes = sock.recv_into(view[position:])
+        if nbytes == 0:
+            return bytes(buffer[:position])
+        position += nbytes
+    return bytes(buffer)
+
+def recv_batch(sock):
+    """Returns the next batch from a socket without its length prefix, or None at the end of the stream."""
+    prefix = recv_exactly(sock, LENGTH_PREFIX.size)
+    if len(prefix) < LENGTH_PREFIX.size:
+        return None
+    length = LENGTH_PREFIX.unpack(prefix)[0]
+    if length < BATCH_HEADER.size or length > MAX_BATCH_BYTES:
+        raise ValueError("Bad batch length {}".format(length))
+    batch = recv_exactly(sock, length)
+    if len(batch) < length:
+        raise ConnectionError("Connection closed in the middle of a batch")
+    return batch
@@ -0,0 +1,125 @@
+"""
+Compare the threaded and asyncio echo servers under load on loopback.
+
+Each server is started in its own process. The load generator opens
+the clients, then every client sends a number of messages and waits
+for each echo. It reports how fast the connections were accepted and
+the echo round trip latency percentiles.
+
+    python echo_benchmark.py --clients 100 1000 10000 --messages 10 --size 64
+"""
+import os
+import sys
+import time
+import socket
+import asyncio
+import argparse
+import subprocess
+import resource
+
+HOST = '127.0.0.1'
+PORT = 12360
+CLIENT_COUNTS = (100, 1000, 10000)
+MESSAGES = 10
+MESSAGE_SIZE = 64
+CONNECT_CONCURRENCY = 256  # Connection attempts in flight at once
+SERVER_START_TIMEOUT = 10
+
+SERVER_DIR = os.path.dirname(os.path.abspath(__file__))
+SERVERS = {
+    'threaded': ["-c", "from TCPMultiServerThreaded import main; main({host!r}, {port}, verbose=False)"],
+    'asyncio': ["TCPMultiServerAsync.py", "--host", "{host}", "--port", "{port}"],
+}
+
+def raise_file_limit():
+    """Each client needs a file descriptor, so allow as many as the system does."""
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    return hard
+
+def start_server(name, host, port):
+    command = [sys.executable] + [part.format(host=host, port=port) for part in SERVERS[name]]
+    server = subprocess.Popen(command, cwd=SERVER_DIR, preexec_fn=raise_file_limit,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + SERVER_START_TIMEOUT
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection((host, port), timeout=1).close()
+            return server
+        except OSError:
+            time.sleep(0.05)
+    server.kill()
+    raise RuntimeError("The {} server did not start".format(name))
+
+def stop_server(server):
+    server.terminate()
+    try:
+        server.wait(SERVER_START_TIMEOUT)
+    except subprocess.TimeoutExpired:
+        server.kill()
+        server.wait()
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))] if values else float('nan')
+
+async def open_client(host, port, semaphore):
+    async with semaphore:
+        return await asyncio.open_connection(host, port)
+
+async def run_client(reader, writer, messages, size, latencies):
+    payload = os.urandom(size)
+    for _ in range(messages):
+        start = time.perf_counter()
+        writer.write(payload)
+        await writer.drain()
+        await reader.readexactly(size)
+        latencies.append(time.perf_counter() - start)
+    writer.close()
+
+async def load_test(host, port, clients, messages, size):
+    semaphore = asyncio.Semaphore(CONNECT_CONCURRENCY)
+    start = time.perf_counter()
+    results = await asyncio.gather(*[open_client(host, port, semaphore) for _ in range(clients)],
+                                   return_exceptions=True)
+    connect_time = time.perf_counter() - start
+    connections = [result for result in results if not isinstance(result, BaseException)]
+    latencies = []
+    start = time.perf_counter()
+    echo_results = await asyncio.gather(*[run_client(reader, writer, messages, size, latencies)
+                                          for reader, writer in connections],
+                                        return_exceptions=True)
+    echo_time = time.perf_counter() - start
+    errors = (len(results) - len(connections)
+              + sum(isinstance(result, BaseException) for result in echo_results))
+    return {'connections': len(connections),
+            'connections_per_s': len(connections) / connect_time,
+            'echoes_per_s': len(latencies) / echo_time,
+            'p50_ms': percentile(latencies, 0.50) * 1000,
+            'p99_ms': percentile(latencies, 0.99) * 1000,
+            'errors': errors}
+
+def main():
+    parser = argparse.ArgumentParser(description="Echo server load test")
+    parser.add_argument("--clients", type=int, nargs="+", default=CLIENT_COUNTS)
+    parser.add_argument("--messages", type=int, default=MESSAGES, help="Messages sent by each client")
+    parser.add_argument("--size", type=int, default=MESSAGE_SIZE, help="Bytes per message")
+    parser.add_argument("--servers", nargs="+", default=list(SERVERS), choices=list(SERVERS))
+    args = parser.parse_args()
+    raise_file_limit()
+
+    print("{:9s} {:>7s} {:>10s} {:>10s} {:>9s} {:>9s} {:>7s}".format(
+        "server", "clients", "conn/s", "echoes/s", "p50 ms", "p99 ms", "errors"))
+    for clients in args.clients:
+        for name in args.servers:
+            server = start_server(name, HOST, PORT)
+            try:
+                result = asyncio.run(load_test(HOST, PORT, clients, args.messages, args.size))
+            finally:
+                stop_server(server)
+            print("{:9s} {:7d} {:10.0f} {:10.0f} {:9.2f} {:9.2f} {:7d}".format(
+                name, clients, result['connections_per_s'], result['echoes_per_s'],
+                result['p50_ms'], result['p99_ms'], result['errors']))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+from CANStreamServer import * #Import the file with the function to test
+from CANStreamClient import CANStreamClient, stream_candump, J1939_DIR
+from can_stream_protocol import encode_batch, FRAME_BYTES, BATCH_HEADER, LENGTH_PREFIX, FLAG_ZLIB
+import numpy as np
+import pytest
+
+def stream(writer, send):
+    """Runs a StreamThread on one end of a socket pair and send on the other. Returns the ACK bytes."""
+    server_side, client_side = socket.socketpair()
+    thread = StreamThread(server_side, writer)
+    thread.start()
+    send(client_side)
+    client_side.shutdown(socket.SHUT_WR)
+    ack = recv_exactly(client_side, ACK.size)
+    client_side.close()
+    thread.join()
+    return ack
+
+def send_text(filename):
+    def send(sock):
+        with open(filename, 'rb') as f:
+            sock.sendfile(f)
+    return send
+
+def send_batches(filename, compress):
+    def send(sock):
+        # A client on an existing socket, which CANStreamClient.__init__ would open
+        client = CANStreamClient.__new__(CANStreamClient)
+        client.sock = sock
+        sock.sendall(STREAM_MAGIC)
+        client.batch_frames = 100
+        client.compress = compress
+        client.bytes_sent = client.frames_sent = 0
+        stream_candump(client, filename)
+    return send
+
+def stored_rows(db_file):
+    conn = sqlite3.connect(db_file)
+    rows = conn.execute("SELECT * FROM canframes ORDER BY rowid").fetchall()
+    conn.close()
+    return rows
+
+@pytest.mark.parametrize("log", ["KWTruck.txt", "candump-RTSMaxxForceResourceExhaustion.log"])
+def test_text_and_batches_store_the_same_rows(tmp_path, log):
+    # Both candump layouts: spaced in KWTruck.txt, compact in the other log
+    filename = tmp_path / log
+    with open(os.path.join(J1939_DIR, log)) as f:
+        filename.write_text(''.join(f.readlines()[:500]))
+    rows = []
+    for name, send in (("text", send_text(filename)),
+                       ("batch", send_batches(str(filename), False)),
+                       ("zlib", send_batches(str(filename), True))):
+        db_file = str(tmp_path / f"{name}.db")
+        create_database(db_file, timeseries=True)
+        writer = DatabaseWriter(db_file)
+        writer.start()
+        try:
+            assert ACK.unpack(stream(writer, send))[0] == 500
+        finally:
+            writer.stop()
+        rows.append(stored_rows(db_file))
+    assert len(rows[0]) == 500
+    assert all(row[4] for row in rows[0])
+    assert rows[0] == rows[1] == rows[2]
+
+def test_long_gap_starts_a_new_batch():
+    timestamps = [0, 3_000_000_000, 3_000_000_010]
+    data = np.zeros((3, 8), dtype=np.uint8)
+    encoded = encode_batch(timestamps, [1, 2, 3], [8, 8, 8], data)
+    columns = []
+    position = 0
+    while position < len(encoded):
+        length = LENGTH_PREFIX.unpack_from(encoded, position)[0]
+        position += LENGTH_PREFIX.size
+        columns.append(decode_batch(encoded[position:position + length]))
+        position += length
+    assert len(columns) == 2
+    assert np.concatenate([batch['timestamp_us'] for batch in columns]).tolist() == timestamps
+
+def test_compressed_batch_limited_to_its_frames():
+    body = zlib.compress(bytes(100 * FRAME_BYTES))
+    with pytest.raises(ValueError):
+        decode_batch(BATCH_HEADER.pack(FLAG_ZLIB, 10, 0) + body)
+
+def test_writer_failure_drops_streams(tmp_path):
+    writer = DatabaseWriter(str(tmp_path / "missing" / "stream.db"))
+    writer.start()
+    send = lambda sock: sock.sendall(b"(1.000000) can0 18FEF200#180194018502FFFF\n")
+    # The connection is closed without an ACK instead of hanging
+    assert stream(writer, send) == b''
+    assert writer.error is not None
+    writer.stop()
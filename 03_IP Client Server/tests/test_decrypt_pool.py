@@ -0,0 +1,85 @@
+import os
+import sys
+import json
+import base64
+import asyncio
+import concurrent.futures
+import tornado.testing
+import tornado.web
+
+# The decrypt pool lives in the Tornado example
+TORNADO_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "Enhanced Tornado Example")
+if TORNADO_DIR not in sys.path:
+    sys.path.append(TORNADO_DIR)
+import TornadoSuperServer
+from TornadoSuperServer import DecryptPool
+
+MAX_PENDING = 2
+
+class BlockingExecutor(concurrent.futures.Executor):
+    """Keeps every submitted decrypt waiting until the test finishes it."""
+    def __init__(self):
+        self.futures = []
+
+    def submit(self, function, *args, **kwargs):
+        future = concurrent.futures.Future()
+        self.futures.append(future)
+        return future
+
+class DecryptPoolTest(tornado.testing.AsyncHTTPTestCase):
+    def setUp(self):
+        self.executor = BlockingExecutor()
+        self.pool = DecryptPool(self.executor, max_pending=MAX_PENDING)
+        self.saved_pool = TornadoSuperServer.DECRYPT_POOL
+        TornadoSuperServer.DECRYPT_POOL = self.pool
+        super().setUp()
+
+    def tearDown(self):
+        super().tearDown()
+        TornadoSuperServer.DECRYPT_POOL = self.saved_pool
+
+    def get_app(self):
+        return tornado.web.Application([(r"/serverPublicKey/", TornadoSuperServer.ServerPublicKeyHandler)])
+
+    def post(self):
+        body = json.dumps({'cipher_text': base64.b64encode(b"cipher").decode('utf-8')})
+        return self.http_client.fetch(self.get_url("/serverPublicKey/"), method="POST", body=body, raise_error=False)
+
+    async def wait_for_pending(self, count):
+        while self.pool.pending < count:
+            await asyncio.sleep(0.01)
+
+    @tornado.testing.gen_test
+    async def test_full_pool_gets_503(self):
+        responses = [self.post() for _ in range(MAX_PENDING)]
+        await self.wait_for_pending(MAX_PENDING)
+        rejected = await self.post()
+        assert rejected.code == 503
+        assert len(self.executor.futures) == MAX_PENDING
+        for future in self.executor.futures:
+            future.set_result(b"plain")
+        for response in responses:
+            response = await response
+            assert response.code == 200
+            assert json.loads(response.body)['plaintext'] == "plain"
+        assert self.pool.pending == 0
+
+    @tornado.testing.gen_test
+    async def test_pending_is_released_after_a_failed_decrypt(self):
+        decrypts = [asyncio.ensure_future(self.pool.decrypt(b"cipher")) for _ in range(MAX_PENDING)]
+        await self.wait_for_pending(MAX_PENDING)
+        for future in self.executor.futures:
+            future.set_exception(ValueError("Decryption failed"))
+        for decrypt in decrypts:
+            try:
+                await decrypt
+                assert False, "The worker's ValueError should be raised"
+            except ValueError:
+                pass
+        assert self.pool.pending == 0
+        # The freed slots take new decrypts
+        decrypt = asyncio.ensure_future(self.pool.decrypt(b"cipher"))
+        await self.wait_for_pending(1)
+        self.executor.futures[-1].set_result(b"plain")
+        assert await decrypt == b"plain"
+        assert self.pool.pending == 0
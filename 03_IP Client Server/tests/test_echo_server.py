@@ -0,0 +1,28 @@
+from TCPMultiServerAsync import * #Import the file with the function to test
+import time
+
+async def echo_then_stop(idle_clients):
+    server = EchoServer(port=0)
+    await server.start()
+    port = server.server.sockets[0].getsockname()[1]
+    reader, writer = await asyncio.open_connection(HOST, port)
+    writer.write(b"hello\n")
+    assert await reader.readexactly(6) == b"hello\n"
+    # Connected but idle, so only cancelling them ends these connections
+    idle = [await asyncio.open_connection(HOST, port) for _ in range(idle_clients)]
+    await asyncio.sleep(0.05)
+    assert len(server.connections) == idle_clients + 1
+    start = time.monotonic()
+    await asyncio.wait_for(server.stop(timeout=0.2), 5)
+    elapsed = time.monotonic() - start
+    assert not server.connections
+    # The server closed the connections
+    assert await reader.read() == b""
+    for _, idle_writer in idle:
+        idle_writer.close()
+    writer.close()
+    return elapsed
+
+def test_stop_with_idle_clients():
+    elapsed = asyncio.run(echo_then_stop(3))
+    assert elapsed < 2
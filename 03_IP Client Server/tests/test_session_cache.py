@@ -0,0 +1,81 @@
+import os
+import sys
+from cryptography.hazmat.primitives.asymmetric import rsa
+from cryptography.hazmat.primitives.serialization import Encoding, PublicFormat
+
+# The session cache lives in the Tornado example
+TORNADO_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "Enhanced Tornado Example")
+if TORNADO_DIR not in sys.path:
+    sys.path.append(TORNADO_DIR)
+import TornadoSuperServer
+from TornadoSuperServer import SessionCache
+
+def client_private_keys(count):
+    # Small keys are quicker to make and still hold the OAEP wrapped symmetric key
+    return [rsa.generate_private_key(public_exponent=65537, key_size=1024) for _ in range(count)]
+
+def client_keys(count):
+    return [private_key.public_key().public_bytes(Encoding.DER, PublicFormat.SubjectPublicKeyInfo)
+            for private_key in client_private_keys(count)]
+
+class FakeClock():
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+def fake_clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(TornadoSuperServer.time, 'monotonic', clock)
+    return clock
+
+def test_hits_and_misses(monkeypatch):
+    fake_clock(monkeypatch)
+    cache = SessionCache(max_sessions=4, ttl=60)
+    first, second = client_keys(2)
+    session = cache.session(first)
+    assert cache.session(first) is session
+    assert cache.session(second) is not session
+    assert cache.session(first) is session
+    assert cache.counters() == {'sessions': 2, 'hits': 2, 'misses': 2, 'expired': 0, 'evicted': 0}
+
+def test_least_recently_used_is_evicted(monkeypatch):
+    fake_clock(monkeypatch)
+    cache = SessionCache(max_sessions=2, ttl=60)
+    first, second, third = client_keys(3)
+    sessions = [cache.session(key) for key in (first, second)]
+    # Using the first key makes the second the least recently used
+    assert cache.session(first) is sessions[0]
+    cache.session(third)
+    assert cache.counters()['evicted'] == 1
+    assert cache.session(first) is sessions[0]
+    assert cache.session(second) is not sessions[1]
+    assert cache.counters() == {'sessions': 2, 'hits': 2, 'misses': 4, 'expired': 0, 'evicted': 2}
+
+def test_sessions_expire(monkeypatch):
+    clock = fake_clock(monkeypatch)
+    cache = SessionCache(max_sessions=4, ttl=60)
+    key, = client_keys(1)
+    session = cache.session(key)
+    clock.now += 59.9
+    assert cache.session(key) is session
+    # The TTL counts from when the session was made, not when it was last used
+    clock.now += 0.1
+    renewed = cache.session(key)
+    assert renewed is not session
+    assert renewed.expires == clock.now + 60
+    assert cache.counters() == {'sessions': 1, 'hits': 1, 'misses': 2, 'expired': 1, 'evicted': 0}
+
+def test_zero_sessions_turns_the_cache_off(monkeypatch):
+    fake_clock(monkeypatch)
+    cache = SessionCache(max_sessions=0, ttl=60)
+    private_key, = client_private_keys(1)
+    key = private_key.public_key().public_bytes(Encoding.DER, PublicFormat.SubjectPublicKeyInfo)
+    first = cache.session(key)
+    second = cache.session(key)
+    assert first is not second
+    # Each session wraps the server's symmetric key for the client
+    for session in (first, second):
+        assert private_key.decrypt(session.encrypted_symmetric_key, TornadoSuperServer.OAEP_PADDING) == TornadoSuperServer.SYMMETRIC_KEY
+    assert cache.counters() == {'sessions': 0, 'hits': 0, 'misses': 2, 'expired': 0, 'evicted': 0}
@@ -0,0 +1,43 @@
+from UDPIngestServer import * #Import the file with the function to test
+import struct
+import socket
+
+def packed_frames(start, count):
+    return b''.join(struct.pack(CAN_FRAME_FORMAT, (0x18FEF200 + i % 256) | CAN_EFF_FLAG, 8, bytes([i % 256]) * 8)
+                    for i in range(start, start + count))
+
+def drain_datagrams(server, datagrams):
+    sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    for datagram in datagrams:
+        sender.sendto(datagram, (HOST, server.port))
+    sender.close()
+    server.selector.select(1)
+    return server.drain()
+
+def test_full_datagrams_are_a_view():
+    server = UDPIngestServer(port=0, batch_bytes=16 * MAX_DATAGRAM)
+    try:
+        datagrams = [packed_frames(i * FRAMES_PER_SLOT, FRAMES_PER_SLOT) for i in range(5)]
+        frames = drain_datagrams(server, datagrams)
+        assert len(frames) == 5 * FRAMES_PER_SLOT
+        assert frames.base is not None
+        assert frames.tobytes() == b''.join(datagrams)
+    finally:
+        server.close()
+
+def test_oversized_datagrams_are_malformed():
+    server = UDPIngestServer(port=0, batch_bytes=16 * MAX_DATAGRAM)
+    try:
+        datagrams = [packed_frames(0, 3),
+                     # One frame too many for a slot, which would otherwise be read as 92 frames
+                     packed_frames(100, FRAMES_PER_SLOT + 1),
+                     packed_frames(300, FRAMES_PER_SLOT),
+                     packed_frames(500, 2)[:-1],
+                     packed_frames(600, 1)]
+        frames = drain_datagrams(server, datagrams)
+        assert frames.tobytes() == datagrams[0] + datagrams[2] + datagrams[4]
+        assert server.packets == 5
+        assert server.malformed == 2
+        assert server.frames == 3 + FRAMES_PER_SLOT + 1
+    finally:
+        server.close()
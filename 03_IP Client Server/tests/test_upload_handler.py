@@ -0,0 +1,76 @@
+import os
+import sys
+import hashlib
+import tempfile
+import tornado.escape
+import tornado.testing
+import tornado.web
+
+# The server and its upload format live in the Tornado example
+TORNADO_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "Enhanced Tornado Example")
+if TORNADO_DIR not in sys.path:
+    sys.path.append(TORNADO_DIR)
+import TornadoSuperServer
+from encrypted_upload import encrypt_file, UPLOAD_HEADER, CHUNK_HEADER
+
+SAMPLE_LOG = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, os.pardir, "05_J1939", "KWTruck.txt")
+CHUNK_SIZE = 4096
+
+def encrypted_upload(filename, chunk_size=CHUNK_SIZE):
+    with open(filename, 'rb') as f:
+        return b''.join(encrypt_file(f, TornadoSuperServer.SYMMETRIC_KEY, chunk_size))
+
+class UploadHandlerTest(tornado.testing.AsyncHTTPTestCase):
+    def setUp(self):
+        self.upload_dir = tempfile.TemporaryDirectory()
+        self.saved_upload_dir = TornadoSuperServer.UPLOAD_DIR
+        TornadoSuperServer.UPLOAD_DIR = self.upload_dir.name
+        super().setUp()
+
+    def tearDown(self):
+        super().tearDown()
+        TornadoSuperServer.UPLOAD_DIR = self.saved_upload_dir
+        self.upload_dir.cleanup()
+
+    def get_app(self):
+        return tornado.web.Application([(r"/upload/", TornadoSuperServer.UploadHandler)])
+
+    def post(self, name, body):
+        return self.fetch("/upload/?name=" + name, method="POST", body=body, raise_error=False)
+
+    def test_round_trip(self):
+        response = self.post("candump.log", encrypted_upload(SAMPLE_LOG))
+        assert response.code == 200
+        with open(SAMPLE_LOG, 'rb') as f:
+            sample = f.read()
+        with open(os.path.join(self.upload_dir.name, "candump.log"), 'rb') as f:
+            assert f.read() == sample
+        reply = tornado.escape.json_decode(response.body)
+        assert reply['bytes'] == len(sample)
+        assert reply['sha256'] == hashlib.sha256(sample).hexdigest()
+        assert os.listdir(self.upload_dir.name) == ["candump.log"]
+
+    def test_tampered_chunk(self):
+        body = bytearray(encrypted_upload(SAMPLE_LOG))
+        # Flip a bit in the data of the second chunk
+        body[UPLOAD_HEADER.size + 2 * CHUNK_HEADER.size + CHUNK_SIZE + 100] ^= 1
+        response = self.post("candump.log", bytes(body))
+        assert response.code == 400
+        assert b"Chunk 1 failed authentication" in response.body
+        assert os.listdir(self.upload_dir.name) == []
+
+    def test_truncated_stream(self):
+        body = encrypted_upload(SAMPLE_LOG)
+        # Cut the upload at the end of a chunk, so only the missing last chunk gives it away
+        end = UPLOAD_HEADER.size + 3 * (CHUNK_HEADER.size + CHUNK_SIZE + 16)
+        response = self.post("candump.log", body[:end])
+        assert response.code == 400
+        assert b"ended before its last chunk" in response.body
+        assert os.listdir(self.upload_dir.name) == []
+
+    def test_bad_names(self):
+        body = encrypted_upload(SAMPLE_LOG)
+        for name in ("", ".", "..", "..%2Fescape.log", ".hidden", "a%20b.log"):
+            assert self.post(name, body).code == 400
+        assert not os.path.exists(os.path.join(self.upload_dir.name, os.pardir, "escape.log"))
+        assert os.listdir(self.upload_dir.name) == []
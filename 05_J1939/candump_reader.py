@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+"""
+Read candump logs into a NumPy structured array.
+
+The log is memory mapped and read a block at a time. Loggers write
+most lines at one width, so the lines of a block that have the same
+length and the same layout are parsed straight from a two dimensional
+NumPy view of the map, a whole column at a time, without a Python
+object per line. The remaining lines are matched with a bytes regular
+expression, and the matched fields are converted a column at a time too.
+
+Both candump layouts are supported:
+    (1682544964.910156) can1 0CF00300#D10000FFFFFF00FF
+     (000.000000)  can1  18F11031   [8]  00 00 FF FF FF FF FF FF
+"""
+import re
+import mmap
+import time
+import numpy as np
+
+# One row per CAN frame. The channel is an index into the list of
+# channel names returned with the frames.
+FRAME_DTYPE = np.dtype([('timestamp', np.float64),
+                        ('can_id', np.uint32),
+                        ('dlc', np.uint8),
+                        ('data', np.uint8, (8,)),
+                        ('channel', np.uint8)])
+
+# The data must end the line or be followed by whitespace, so "123#R" or
+# "123#0011X" are rejected rather than read as shorter frames
+CANDUMP_PATTERN = re.compile(
+    rb"\(([0-9.]{1,24})\)[ \t]+(\S{1,16})[ \t]+([0-9A-Fa-f]{1,8})"
+    rb"(?:#([0-9A-Fa-f]{0,16})|[ \t]+\[(\d)\]((?:[ \t]{1,3}[0-9A-Fa-f]{2}){0,8}))(?=\s|$)")
+
+# Width of the fixed size byte strings that hold the matched fields
+FIELD_WIDTH = 40
+
+# Bytes of the log parsed per regular expression pass. This bounds the
+# memory used for the matched text before it is converted.
+BLOCK_SIZE = 1 << 22
+
+# Lines of one length are parsed as fixed width lines when there are at
+# least this many of them in a block. Fewer are left to the regular expression.
+MIN_FIXED_LINES = 64
+
+# Timestamps with more digits than a float64 holds exactly are left to the regular expression
+MAX_EXACT_TIMESTAMP = 1 << 53
+
+NEWLINE = ord('\n')
+
+# Lookup table from an ASCII character to its hex digit value
+HEX_VALUES = np.zeros(256, dtype=np.uint8)
+for value, character in enumerate(b'0123456789abcdef'):
+    HEX_VALUES[character] = value
+for value, character in enumerate(b'ABCDEF'):
+    HEX_VALUES[character] = value + 10
+
+# Lookup tables from an ASCII character to whether it is in a class
+IS_DIGIT = np.zeros(256, dtype=bool)
+IS_DIGIT[np.frombuffer(b'0123456789', dtype=np.uint8)] = True
+IS_HEX = np.zeros(256, dtype=bool)
+IS_HEX[np.frombuffer(b'0123456789abcdefABCDEF', dtype=np.uint8)] = True
+IS_SPACE = np.zeros(256, dtype=bool)
+IS_SPACE[np.frombuffer(b' \t\n\r\x0b\x0c', dtype=np.uint8)] = True
+
+def hex_to_uint32(chars):
+    """Converts rows of up to 8 left aligned hex characters to uint32."""
+    chars = chars[:, :8]
+    lengths = np.count_nonzero(chars, axis=1)
+    nibbles = HEX_VALUES[chars].astype(np.uint32)
+    shifts = 4 * (lengths[:, None] - 1 - np.arange(chars.shape[1]))
+    nibbles[shifts < 0] = 0
+    return np.bitwise_or.reduce(nibbles << np.maximum(shifts, 0).astype(np.uint32), axis=1)
+
+def hex_to_bytes(chars):
+    """Converts rows of up to 16 left aligned hex characters to an (n, 8) uint8 array."""
+    nibbles = HEX_VALUES[chars[:, :16]].reshape(-1, 8, 2)
+    return (nibbles[:, :, 0] << 4) | nibbles[:, :, 1]
+
+def parse_block(matches, frames, channels):
+    """Fills frames with the columns from a list of regular expression matches."""
+    fields = np.array(matches, dtype='S{}'.format(FIELD_WIDTH))
+    chars = fields.view(np.uint8).reshape(len(matches), -1, FIELD_WIDTH)
+    timestamps, channel_names, ids, compact_data, dlcs, spaced_data = range(6)
+    frames['timestamp'] = fields[:, timestamps].astype(np.float64)
+    frames['can_id'] = hex_to_uint32(chars[:, ids])
+    # Only one of the two data groups is filled in for each line
+    spaced = chars[:, dlcs, 0] != 0
+    data_chars = chars[:, compact_data]
+    if spaced.any():
+        spaced_text = np.char.replace(np.char.replace(fields[spaced, spaced_data], b' ', b''), b'\t', b'')
+        data_chars = data_chars.copy()
+        data_chars[spaced] = np.array(spaced_text, dtype='S{}'.format(FIELD_WIDTH)).view(np.uint8).reshape(-1, FIELD_WIDTH)
+    frames['data'] = hex_to_bytes(data_chars)
+    frames['dlc'] = np.where(spaced, HEX_VALUES[chars[:, dlcs, 0]], np.count_nonzero(data_chars, axis=1) // 2)
+    # There are only a few channels, so compare against each name in turn
+    names = fields[:, channel_names]
+    unassigned = np.ones(len(names), dtype=bool)
+    while unassigned.any():
+        name = names[np.argmax(unassigned)]
+        same_channel = names == name
+        name = name.decode('ascii', 'replace')
+        if name not in channels:
+            channels.append(name)
+        frames['channel'][same_channel] = channels.index(name)
+        unassigned &= ~same_channel
+
+class FixedLayout():
+    """The columns of the fields in lines laid out like one candump line.
+
+    Every column outside the fields, such as the parentheses, the spaces
+    and the '#', must hold the same character as in that line, and the
+    fields must be as wide, so a line that fits parses the same way as
+    it would with CANDUMP_PATTERN.
+    """
+    def __init__(self, line, match):
+        columns = np.arange(len(line))
+        template = np.frombuffer(line, dtype=np.uint8)
+        def span(group):
+            return columns[match.start(group):match.end(group)]
+        timestamp = span(1)
+        self.timestamp_columns = timestamp[IS_DIGIT[template[timestamp]]]
+        text = match.group(1)
+        self.timestamp_scale = 10 ** (len(text) - 1 - text.index(b'.')) if b'.' in text else 1
+        self.channel_columns = span(2)
+        self.id_columns = span(3)
+        if match.group(4) is not None:
+            self.data_columns = span(4)
+            self.dlc = len(self.data_columns) // 2
+        else:
+            data = span(6)
+            self.data_columns = data[IS_HEX[template[data]]]
+            self.dlc = HEX_VALUES[template[match.start(5)]]
+        fields = np.concatenate((self.timestamp_columns, self.channel_columns, self.id_columns, self.data_columns))
+        self.exact_columns = np.setdiff1d(columns, fields)
+        self.exact_values = template[self.exact_columns]
+
+    @classmethod
+    def from_line(cls, line):
+        """Returns the layout of a line, or None if it isn't a CAN frame or its timestamp has too many digits."""
+        match = CANDUMP_PATTERN.search(line)
+        if match is None or match.group(1).count(b'.') > 1:
+            return None
+        layout = cls(line, match)
+        if len(layout.timestamp_columns) > 18:
+            return None
+        return layout
+
+    def fits(self, rows):
+        """Returns a mask of the rows, each one a line as uint8, that have this layout."""
+        fits = (rows[:, self.exact_columns] == self.exact_values).all(axis=1)
+        fits &= IS_DIGIT[rows[:, self.timestamp_columns]].all(axis=1)
+        fits &= IS_HEX[rows[:, self.id_columns]].all(axis=1)
+        fits &= IS_HEX[rows[:, self.data_columns]].all(axis=1)
+        fits &= ~IS_SPACE[rows[:, self.channel_columns]].any(axis=1)
+        fits &= self.timestamp_digits(rows) < MAX_EXACT_TIMESTAMP
+        return fits
+
+    def timestamp_digits(self, rows):
+        digits = rows[:, self.timestamp_columns].astype(np.int64) - ord('0')
+        return digits @ 10 ** np.arange(len(self.timestamp_columns) - 1, -1, -1, dtype=np.int64)
+
+    def parse(self, rows, frames, channels):
+        """Fills frames with the fields of rows that fit this layout."""
+        # Both numbers are exact, so the division rounds the same way as parsing the text
+        frames['timestamp'] = self.timestamp_digits(rows) / self.timestamp_scale
+        frames['can_id'] = hex_to_uint32(rows[:, self.id_columns])
+        data_chars = np.zeros((len(rows), 16), dtype=np.uint8)
+        data_chars[:, :len(self.data_columns)] = rows[:, self.data_columns]
+        frames['data'] = hex_to_bytes(data_chars)
+        frames['dlc'] = self.dlc
+        width = len(self.channel_columns)
+        names = np.ascontiguousarray(rows[:, self.channel_columns]).view('S{}'.format(width))[:, 0]
+        names, first, inverse = np.unique(names, return_index=True, return_inverse=True)
+        for name in names[np.argsort(first)]:
+            name = name.decode('ascii', 'replace')
+            if name not in channels:
+                channels.append(name)
+        indexes = np.array([channels.index(name.decode('ascii', 'replace')) for name in names], dtype=np.uint8)
+        frames['channel'] = indexes[inverse.ravel()]
+
+def line_rows(buffer, starts, length):
+    """Returns the lines of one length that begin at starts as an (n, length) uint8 array.
+
+    Consecutive lines are a view of the buffer. Others are gathered into a copy.
+    """
+    stop = starts[-1] + length + 1
+    if stop <= len(buffer) and (np.diff(starts) == length + 1).all():
+        return buffer[starts[0]:stop].reshape(-1, length + 1)[:, :length]
+    return buffer[starts[:, None] + np.arange(length)]
+
+def parse_lines(mm, buffer, start, end, frames, channels):
+    """Parses the lines between start and end into frames. Returns the number of frames."""
+    newlines = np.flatnonzero(buffer[start:end] == NEWLINE) + start
+    starts = np.concatenate(([start], newlines + 1))
+    ends = np.concatenate((newlines, [end]))
+    lengths = ends - starts
+    block = np.empty(len(starts), dtype=FRAME_DTYPE)
+    parsed = np.zeros(len(starts), dtype=bool)
+    lengths_found, counts = np.unique(lengths, return_counts=True)
+    for length in lengths_found[(counts >= MIN_FIXED_LINES) & (lengths_found > 0)]:
+        lines = np.flatnonzero(lengths == length)
+        layout = FixedLayout.from_line(mm[starts[lines[0]]:ends[lines[0]]])
+        if layout is None:
+            continue
+        rows = line_rows(buffer, starts[lines], length)
+        fits = layout.fits(rows)
+        if not fits.all():
+            rows = rows[fits]
+            lines = lines[fits]
+        fixed = np.empty(len(lines), dtype=FRAME_DTYPE)
+        layout.parse(rows, fixed, channels)
+        block[lines] = fixed
+        parsed[lines] = True
+    if not parsed.any():
+        # No fixed width lines, so match the whole block at once
+        matches = CANDUMP_PATTERN.findall(mm, start, end)
+        if matches:
+            parse_block(matches, frames[:len(matches)], channels)
+        return len(matches)
+    matches = []
+    matched_lines = []
+    for line in np.flatnonzero(~parsed & (lengths > 0)).tolist():
+        match = CANDUMP_PATTERN.search(mm, starts[line], ends[line])
+        if match is not None:
+            matches.append(match.groups(b''))
+            matched_lines.append(line)
+    if matches:
+        matched = np.empty(len(matches), dtype=FRAME_DTYPE)
+        parse_block(matches, matched, channels)
+        block[matched_lines] = matched
+        parsed[matched_lines] = True
+    count = np.count_nonzero(parsed)
+    frames[:count] = block[parsed]
+    return count
+
+def read_candump(filename, block_size=BLOCK_SIZE):
+    """Reads a candump file into a FRAME_DTYPE array.
+
+    Returns the frames and the list of channel names that the channel
+    column indexes into. Lines that are not CAN frames are skipped.
+    """
+    channels = []
+    with open(filename, 'rb') as f:
+        try:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # Empty files can't be mapped
+            return np.empty(0, dtype=FRAME_DTYPE), channels
+    with mm:
+        buffer = np.frombuffer(mm, dtype=np.uint8)
+        size = len(buffer)
+        # Allocate one row per line up front, then trim the unused rows
+        frames = np.empty(np.count_nonzero(buffer == NEWLINE) + 1, dtype=FRAME_DTYPE)
+        count = 0
+        position = 0
+        try:
+            while position < size:
+                end = min(position + block_size, size)
+                last_newline = mm.rfind(b'\n', position, end)
+                if end < size and last_newline >= 0:
+                    # Stop the block at the end of the last whole line
+                    end = last_newline + 1
+                # The newline that ends the block isn't part of a line
+                line_end = end - 1 if buffer[end - 1] == NEWLINE else end
+                count += parse_lines(mm, buffer, position, line_end, frames[count:], channels)
+                position = end
+        finally:
+            # Release the view so the map can be closed
+            del buffer
+    return frames[:count], channels
+
+def main():
+    for filename in ('KWTruck.txt', 'candump-RTSMaxxForceResourceExhaustion.log'):
+        start = time.perf_counter()
+        frames, channels = read_candump(filename)
+        elapsed = time.perf_counter() - start
+        print("{}: {} frames on {} in {:0.3f} s ({:0.0f} frames/s)".format(
+            filename, len(frames), channels, elapsed, len(frames) / elapsed))
+
+if __name__ == '__main__':
+    main()
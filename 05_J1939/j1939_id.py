@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Decode SAE J1939 fields from 29-bit CAN identifiers.
+
+decode_j1939_ids works on whole NumPy arrays of identifiers with masked
+bitwise operations. parseJ1939id is the scalar version used by the
+example scripts and uses the same masks, so both give the same PDU1 and
+PDU2 handling. See SAE J1939-21 for the field layout.
+"""
+import time
+import numpy as np
+
+PRIORITY_MASK       = 0x1C000000
+EXT_DATA_PAGE_MASK  = 0x02000000
+DATA_PAGE_MASK      = 0x01000000
+PDU_FORMAT_MASK     = 0x00FF0000
+PDU_SPECIFIC_MASK   = 0x0000FF00
+SOURCE_ADDRESS_MASK = 0x000000FF
+PDU1_PGN_MASK       = 0x03FF0000
+PDU2_PGN_MASK       = 0x03FFFF00
+
+PRIORITY_OFFSET      = 26
+EXT_DATA_PAGE_OFFSET = 25
+DATA_PAGE_OFFSET     = 24
+PDU_FORMAT_OFFSET    = 16
+DA_OFFSET            = 8
+PGN_OFFSET           = 8
+PDU2_THRESHOLD       = 240
+
+GLOBAL_SOURCE_ADDR = 0xFF
+
+def decode_j1939_ids(can_ids):
+    """Decodes an array of CAN IDs into a dictionary of J1939 field arrays.
+
+    PDU1 formats (PF < 240) are destination specific, so the PDU specific
+    byte is the destination address and is not part of the PGN. PDU2
+    formats are broadcast to the global address and the PDU specific byte
+    is a group extension that is part of the PGN.
+    """
+    ids = np.asarray(can_ids, dtype=np.uint32)
+    pdu_format = ((ids & PDU_FORMAT_MASK) >> PDU_FORMAT_OFFSET).astype(np.uint8)
+    pdu_specific = ((ids & PDU_SPECIFIC_MASK) >> DA_OFFSET).astype(np.uint8)
+    pdu1 = pdu_format < PDU2_THRESHOLD
+    pgn_mask = np.where(pdu1, np.uint32(PDU1_PGN_MASK), np.uint32(PDU2_PGN_MASK))
+    return {'priority': ((ids & PRIORITY_MASK) >> PRIORITY_OFFSET).astype(np.uint8),
+            'edp': ((ids & EXT_DATA_PAGE_MASK) >> EXT_DATA_PAGE_OFFSET).astype(np.uint8),
+            'dp': ((ids & DATA_PAGE_MASK) >> DATA_PAGE_OFFSET).astype(np.uint8),
+            'pdu_format': pdu_format,
+            'pdu_specific': pdu_specific,
+            'destination_address': np.where(pdu1, pdu_specific, np.uint8(GLOBAL_SOURCE_ADDR)),
+            'source_address': (ids & SOURCE_ADDRESS_MASK).astype(np.uint8),
+            'pgn': (ids & pgn_mask) >> PGN_OFFSET}
+
+def parseJ1939id(id):
+    """Decodes a single CAN ID. Kept for the scripts that work a frame at a time."""
+    sa = id & SOURCE_ADDRESS_MASK
+    priority = (id & PRIORITY_MASK) >> PRIORITY_OFFSET
+    pf = (id & PDU_FORMAT_MASK) >> PDU_FORMAT_OFFSET
+    if (pf < PDU2_THRESHOLD):  # See SAE J1939-21
+        # PDU 1 format uses values lower than 240
+        da = (id & PDU_SPECIFIC_MASK) >> DA_OFFSET
+        pgn = (id & PDU1_PGN_MASK) >> PGN_OFFSET
+    else:         # PDU 2 format
+        da = GLOBAL_SOURCE_ADDR
+        pgn = (id & PDU2_PGN_MASK) >> PGN_OFFSET
+    return {'source_address': sa,
+            'priority': priority,
+            'destination_address': da,
+            'pgn': pgn}
+
+def main():
+    num_ids = 1000000
+    can_ids = np.random.default_rng().integers(0, 0x20000000, num_ids, dtype=np.uint32)
+
+    start = time.perf_counter()
+    fields = decode_j1939_ids(can_ids)
+    vector_time = time.perf_counter() - start
+    print("Array decoder:  {} IDs in {:0.1f} ms".format(num_ids, vector_time * 1000))
+
+    start = time.perf_counter()
+    pgns = [parseJ1939id(can_id)['pgn'] for can_id in can_ids.tolist()]
+    scalar_time = time.perf_counter() - start
+    print("Scalar decoder: {} IDs in {:0.1f} ms".format(num_ids, scalar_time * 1000))
+    assert (fields['pgn'] == pgns).all()
+
+if __name__ == '__main__':
+    main()
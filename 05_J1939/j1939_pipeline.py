@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""
+Lazy processing stages for J1939 candump logs.
+
+Each stage takes an iterable and returns a generator, so stages can be
+chained and a log of any size is processed one frame at a time:
+
+    lines = read_lines('KWTruck.txt')
+    frames = parse_frames(lines)
+    frames = decode_j1939(frames)
+    frames = reassemble_transport(frames)
+    frames = filter_frames(frames, pgns={61444}, source_addresses={0})
+    frames = decode_spns(frames)
+
+Frames are the dictionaries made by parse_candump_line, with the
+J1939 fields added by decode_j1939. j1939_frames chains the common
+stages in one call.
+"""
+from itertools import islice
+from time import perf_counter_ns
+
+from j1939_id import parseJ1939id
+from j1939_transport import J1939TransportReassembler
+from metrics import METRICS
+
+# Timing every line would cost a sizable fraction of parsing it, so only one line in
+# PARSE_SAMPLE_EVERY is timed. Counts are kept in locals and added when a stage ends.
+PARSE_SAMPLE_EVERY = 64
+LINES_PARSED = METRICS.counter('candump_lines_parsed_total', "Candump lines parsed by parse_frames")
+PARSE_LATENCY = METRICS.histogram('candump_parse_line_seconds', "Time to parse a candump line, sampled")
+FRAMES_DECODED = METRICS.counter('j1939_frames_decoded_total', "Frames given J1939 fields by decode_j1939")
+TRANSPORT_MESSAGES = METRICS.counter('j1939_transport_messages_total',
+                                     "Messages reassembled by reassemble_transport")
+
+CANDUMP_TIMESTAMP_ADDR = 0
+CANDUMP_CHANNEL_ADDR   = 1
+CANDUMP_ID_ADDR        = 2
+CANDUMP_DLC_ADDR       = 3
+DATA_START_ADDR        = 4
+
+def parse_candump_line(line):
+    # Strip the newline characters and white space off the ends
+    # then split the string into a list based on whitespace.
+    data = line.strip().split()
+    # can_dump formats use parenthese to wrap the floating
+    # point timestamp. We just want the numbers so use [1:-1] to slice
+    time_stamp = float(data[CANDUMP_TIMESTAMP_ADDR][1:-1])
+    # physical CAN channel
+    channel = data[CANDUMP_CHANNEL_ADDR]
+    if '#' in data[CANDUMP_ID_ADDR]:
+        # Compact candump -L format: ID#DATA with the data in one hex string
+        id_string, data_string = data[CANDUMP_ID_ADDR].split('#')
+        can_id = int(id_string,16)
+        data_bytes = bytes.fromhex(data_string)
+        dlc = len(data_bytes)
+    else:
+        # determine the can arbitration identifier as an integer
+        can_id = int(data[CANDUMP_ID_ADDR],16)
+        # Data length code is a single byte wrapped in []
+        dlc = int(data[CANDUMP_DLC_ADDR][1])
+        # Build the data field as a byte array in one step instead of
+        # growing it a byte at a time
+        data_bytes = bytes.fromhex(''.join(data[DATA_START_ADDR:]))
+    #assert dlc == len(data_bytes)
+    can_frame = {'id':can_id,
+                 'dlc':dlc,
+                 'data':data_bytes,
+                 'timestamp':time_stamp,
+                 'channel':channel}
+    return can_frame
+
+def read_lines(filename):
+    """Yields the non-blank lines of a text log."""
+    with open(filename, 'r') as f:
+        for line in f:
+            if line.strip():
+                yield line
+
+def parse_frames(lines, parse_line=parse_candump_line):
+    """Yields a parsed frame for each line."""
+    count = 0
+    try:
+        for line in lines:
+            count += 1
+            if count % PARSE_SAMPLE_EVERY:
+                yield parse_line(line)
+            else:
+                t0 = perf_counter_ns()
+                frame = parse_line(line)
+                PARSE_LATENCY.observe(perf_counter_ns() - t0)
+                yield frame
+    finally:
+        LINES_PARSED.incr(count)
+
+def array_frames(frames, channels):
+    """Yields frames from a FRAME_DTYPE array, such as one loaded by parse_cache, in the parse_candump_line format."""
+    for timestamp, can_id, dlc, data, channel in zip(frames['timestamp'].tolist(),
+                                                    frames['can_id'].tolist(),
+                                                    frames['dlc'].tolist(),
+                                                    frames['data'],
+                                                    frames['channel'].tolist()):
+        yield {'id': can_id,
+               'dlc': dlc,
+               'data': data[:dlc].tobytes(),
+               'timestamp': timestamp,
+               'channel': channels[channel]}
+
+def decode_j1939(frames):
+    """Adds the source address, priority, destination address and PGN to each frame."""
+    count = 0
+    try:
+        for frame in frames:
+            frame.update(parseJ1939id(frame['id']))
+            count += 1
+            yield frame
+    finally:
+        FRAMES_DECODED.incr(count)
+
+def reassemble_transport(frames, reassembler=None):
+    """Passes every frame through and yields each reassembled transport message after the frame that completes it.
+
+    The reassembled messages have the channel of the last packet and are
+    marked with 'transport': True.
+    """
+    if reassembler is None:
+        reassembler = J1939TransportReassembler()
+    for frame in frames:
+        yield frame
+        transport_message = reassembler.process(frame)
+        if transport_message is not None:
+            transport_message['channel'] = frame['channel']
+            transport_message['transport'] = True
+            TRANSPORT_MESSAGES.incr()
+            yield transport_message
+
+def filter_frames(frames, pgns=None, source_addresses=None):
+    """Yields the frames that match one of the PGNs and source addresses.
+
+    None means any value is accepted.
+    """
+    for frame in frames:
+        if pgns is not None and frame['pgn'] not in pgns:
+            continue
+        if source_addresses is not None and frame['source_address'] not in source_addresses:
+            continue
+        yield frame
+
+def decode_spns(frames, decoder=None):
+    """Adds a dictionary of decoded SPN values to each frame as 'spns'."""
+    if decoder is None:
+        from spn_decoder import SPNDecoder
+        decoder = SPNDecoder()
+    for frame in frames:
+        frame['spns'] = decoder.decode(frame['pgn'], frame['data'])
+        yield frame
+
+def tap(frames, function):
+    """Calls function on each frame as it passes, for counting or logging."""
+    for frame in frames:
+        function(frame)
+        yield frame
+
+def batched(items, batch_size):
+    """Yields lists of up to batch_size items, such as rows for executemany."""
+    items = iter(items)
+    while True:
+        batch = list(islice(items, batch_size))
+        if not batch:
+            return
+        yield batch
+
+def j1939_frames(filename, pgns=None, source_addresses=None, transport=True, spn_decoder=None):
+    """Chains the stages to yield decoded frames from a candump file.
+
+    SPNs are only decoded when an SPNDecoder is given.
+    """
+    frames = decode_j1939(parse_frames(read_lines(filename)))
+    if transport:
+        frames = reassemble_transport(frames)
+    frames = filter_frames(frames, pgns, source_addresses)
+    if spn_decoder is not None:
+        frames = decode_spns(frames, spn_decoder)
+    return frames
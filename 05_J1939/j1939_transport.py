@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+"""
+Reassemble J1939 transport protocol (TP) messages from a frame stream.
+
+Sessions are opened by a broadcast announce (BAM) or a request to send
+(RTS) and closed when all of their data transfer (DT) packets arrive, on
+a connection abort, or when one of the SAE J1939-21 timeouts passes
+without the next expected frame. The timeouts are measured with the
+frame timestamps, so replaying a log behaves like the live bus.
+
+Each session copies its packets into a bytearray sized from the
+announcement, and the number of open sessions is capped. When the cap
+is reached the oldest session is dropped, so a flood of announcements
+can't grow memory without limit.
+"""
+import struct
+import logging
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+TP_CM_PGN = 0xEC00 # Transport Protocol Connection Management (TP.CM)
+TP_DT_PGN = 0xEB00 # Transport Protocol Data Transfer (TP.DT)
+
+TP_CM_RTS = 16       # Connection Mode Request to Send
+TP_CM_CTS = 17       # Connection Mode Clear to Send
+TP_CM_EOM_ACK = 19   # End of Message Acknowledgement
+TP_CM_BAM = 32       # Broadcast Announce Message
+TP_CONN_ABORT = 255  # Connection Abort
+
+# Timeouts from SAE J1939-21 in seconds
+T1 = 0.750 # Between data packets
+T2 = 1.250 # From a CTS to the first data packet
+T3 = 1.250 # From the last packet of a window (or an RTS) to the next CTS
+T4 = 1.050 # From a CTS that holds the connection open to the next CTS
+
+BYTES_PER_PACKET = 7
+MAX_SESSIONS = 32
+
+class J1939TransportSession():
+    __slots__ = ('pgn', 'sa', 'da', 'total_packets', 'message_size', 'broadcast',
+                 'message', 'received', 'received_count', 'deadline', 'window_end')
+
+    def __init__(self, pgn, sa, da, total_packets, message_size, broadcast, timestamp):
+        self.pgn = pgn
+        self.sa = sa
+        self.da = da
+        self.total_packets = total_packets
+        self.message_size = message_size
+        self.broadcast = broadcast
+        # Preallocate the whole message and a flag per sequence number
+        self.message = bytearray(total_packets * BYTES_PER_PACKET)
+        self.received = bytearray(total_packets + 1)
+        self.received_count = 0
+        self.deadline = timestamp + (T1 if broadcast else T3)
+        self.window_end = 0
+
+    def add_frame(self, data, timestamp):
+        """Copies a data transfer packet into the message.
+
+        Returns True when every packet has arrived.
+        """
+        sequence_num = data[0]
+        if sequence_num < 1 or sequence_num > self.total_packets:
+            return False
+        if not self.received[sequence_num]:
+            start = (sequence_num - 1) * BYTES_PER_PACKET
+            self.message[start:start + BYTES_PER_PACKET] = data[1:1 + BYTES_PER_PACKET].ljust(BYTES_PER_PACKET, b'\xff')
+            self.received[sequence_num] = 1
+            self.received_count += 1
+        if self.received_count == self.total_packets:
+            return True
+        if not self.broadcast and sequence_num >= self.window_end:
+            # The window is done, so the sender waits for the next CTS
+            self.deadline = timestamp + T3
+        else:
+            self.deadline = timestamp + T1
+        return False
+
+    def get_message(self):
+        return bytes(self.message[:self.message_size])
+
+class J1939TransportReassembler():
+    """Tracks transport sessions across a stream of decoded J1939 frames.
+
+    Frames are dictionaries with the 'pgn', 'source_address',
+    'destination_address', 'data' and 'timestamp' keys, as made by the
+    example scripts.
+    """
+    def __init__(self, max_sessions=MAX_SESSIONS):
+        self.max_sessions = max_sessions
+        # Keyed by (originator, responder) in the order they were opened
+        self.sessions = OrderedDict()
+        self.next_deadline = float('inf')
+        self.completed = 0
+        self.aborted = 0
+        self.timed_out = 0
+        self.evicted = 0
+        self.rejected = 0
+
+    def counters(self):
+        return {'open': len(self.sessions),
+                'completed': self.completed,
+                'aborted': self.aborted,
+                'timed_out': self.timed_out,
+                'evicted': self.evicted,
+                'rejected': self.rejected}
+
+    def expire(self, timestamp):
+        """Drops the sessions whose timeout has passed."""
+        if timestamp < self.next_deadline:
+            return
+        next_deadline = float('inf')
+        for key, session in list(self.sessions.items()):
+            if session.deadline <= timestamp:
+                del self.sessions[key]
+                self.timed_out += 1
+                logger.debug("Transport session from {:02X} to {:02X} timed out".format(*key))
+            else:
+                next_deadline = min(next_deadline, session.deadline)
+        self.next_deadline = next_deadline
+
+    def open_session(self, key, session):
+        if key in self.sessions:
+            # A new announcement replaces an unfinished session
+            del self.sessions[key]
+            self.aborted += 1
+        elif len(self.sessions) >= self.max_sessions:
+            oldest_key, _ = self.sessions.popitem(last=False)
+            self.evicted += 1
+            logger.debug("Evicted transport session from {:02X} to {:02X}".format(*oldest_key))
+        self.sessions[key] = session
+        self.next_deadline = min(self.next_deadline, session.deadline)
+
+    def process(self, j1939_message):
+        """Processes one frame.
+
+        Returns a dictionary describing the reassembled message when the
+        frame completes a session, otherwise None.
+        """
+        pgn = j1939_message['pgn']
+        if pgn != TP_CM_PGN and pgn != TP_DT_PGN:
+            # It's a normal 8-byte frame, not transport layer
+            return None
+        timestamp = j1939_message['timestamp']
+        self.expire(timestamp)
+        sa = j1939_message['source_address']
+        da = j1939_message['destination_address']
+        data = j1939_message['data']
+        if len(data) < 8:
+            self.rejected += 1
+            return None
+
+        if pgn == TP_CM_PGN:
+            control_byte = data[0]
+            if control_byte == TP_CM_RTS or control_byte == TP_CM_BAM:
+                message_size = struct.unpack('<H', data[1:3])[0]
+                total_packets = data[3]
+                new_pgn = data[5] | (data[6] << 8) | (data[7] << 16)
+                if (total_packets == 0 or
+                        (message_size + BYTES_PER_PACKET - 1) // BYTES_PER_PACKET != total_packets):
+                    self.rejected += 1
+                    return None
+                self.open_session((sa, da), J1939TransportSession(
+                    new_pgn, sa, da, total_packets, message_size,
+                    control_byte == TP_CM_BAM, timestamp))
+            elif control_byte == TP_CM_CTS:
+                # Clear to send comes from the responder, so the session
+                # is keyed the other way around
+                session = self.sessions.get((da, sa))
+                if session is not None:
+                    num_packets = data[1]
+                    next_packet = data[2]
+                    session.window_end = next_packet + num_packets - 1
+                    session.deadline = timestamp + (T2 if num_packets else T4)
+                    self.next_deadline = min(self.next_deadline, session.deadline)
+            elif control_byte == TP_CM_EOM_ACK:
+                self.sessions.pop((da, sa), None)
+            elif control_byte == TP_CONN_ABORT:
+                # Either side can abort the connection
+                if self.sessions.pop((sa, da), None) or self.sessions.pop((da, sa), None):
+                    self.aborted += 1
+            return None
+
+        session = self.sessions.get((sa, da))
+        if session is None: #Need to setup a session first.
+            return None
+        if not session.add_frame(data, timestamp):
+            self.next_deadline = min(self.next_deadline, session.deadline)
+            return None
+        #Delete the entry for the complete message
+        del self.sessions[(sa, da)]
+        self.completed += 1
+        return_message = session.get_message()
+        logger.debug("Found Transport Layer Message from {:02X} to {:02X}".format(sa, da))
+        return {'source_address': sa,
+                'destination_address': da,
+                'pgn': session.pgn,
+                'dlc': len(return_message),
+                'data': return_message,
+                'timestamp': timestamp}
+
+def main():
+    import time
+    from candump_reader import read_candump
+    from j1939_id import decode_j1939_ids
+
+    for filename in ('KWTruck.txt', 'candump-RTSMaxxForceResourceExhaustion.log'):
+        frames, channels = read_candump(filename)
+        fields = decode_j1939_ids(frames['can_id'])
+        reassembler = J1939TransportReassembler()
+        messages = 0
+        start = time.perf_counter()
+        for timestamp, dlc, data, pgn, sa, da in zip(frames['timestamp'].tolist(),
+                                                     frames['dlc'].tolist(),
+                                                     frames['data'],
+                                                     fields['pgn'].tolist(),
+                                                     fields['source_address'].tolist(),
+                                                     fields['destination_address'].tolist()):
+            if pgn != TP_CM_PGN and pgn != TP_DT_PGN:
+                continue
+            message = reassembler.process({'pgn': pgn,
+                                           'source_address': sa,
+                                           'destination_address': da,
+                                           'data': data[:dlc].tobytes(),
+                                           'timestamp': timestamp})
+            if message is not None:
+                messages += 1
+        elapsed = time.perf_counter() - start
+        print("{}: {} transport messages in {:0.3f} s".format(filename, messages, elapsed))
+        print("    {}".format(reassembler.counters()))
+
+if __name__ == '__main__':
+    main()
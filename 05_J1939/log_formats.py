@@ -0,0 +1,285 @@
+#!/usr/bin/env python3
+"""
+Read CAN logs from other tools into the candump_reader frame array.
+
+The example logs in 02_CAN Logging come from several loggers:
+    candump               (1543532003.571000) can1 18F00131#FFFFFF3F00FFFFFF
+    Vehicle Spy 3 CSV     VSpy on a Kenworth.csv
+    Vector CSV export     Vector CAN Case XL on Freightliner.csv
+    PCAN-View trace       PCAN View on a PACCAR MX.trc
+    NMFTA CAN Logger 2    NMFTA CAN Logger 2 on a Navistar A26.bin
+
+read_log detects the format and returns the same (frames, channels)
+pair as read_candump, with frames in FRAME_DTYPE. The text formats are
+read a line at a time into fixed size blocks, and the binary format is
+decoded with NumPy. write_candump converts any of them to a candump file.
+"""
+import os
+import time
+import calendar
+import numpy as np
+
+from candump_reader import FRAME_DTYPE, CANDUMP_PATTERN, read_candump
+
+LOG_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, '02_CAN Logging')
+
+# The VSpy and PCAN logs store local times. The example logs were
+# recorded in mountain time, which the notebook assumes as well.
+LOCAL_UTC_OFFSET = -7 * 3600
+
+# Rows collected before they are converted to an array
+BLOCK_ROWS = 1 << 16
+
+# Same layout as FRAME_DTYPE with the data held as a byte string, so
+# parsed bytes objects can be stored directly and viewed as FRAME_DTYPE.
+RECORD_DTYPE = np.dtype([('timestamp', np.float64),
+                         ('can_id', np.uint32),
+                         ('dlc', np.uint8),
+                         ('data', 'S8'),
+                         ('channel', np.uint8)])
+
+# Vehicle Spy 3 CSV columns
+VSPY_HEADER = "Vehicle Spy 3"
+VSPY_START_DATE_LINE = 3
+VSPY_START_TIME_LINE = 4
+VSPY_TIME_COL = 1
+VSPY_NETWORK_COL = 7
+VSPY_ID_COL = 9
+VSPY_DATA_COLS = slice(12, 20)
+VSPY_NETWORKS = {"HS CAN": 'can1', "MS CAN": 'can0'}
+
+# Vector CSV columns
+VECTOR_HEADER = ";Timestamp"
+VECTOR_TIME_COL = 0
+VECTOR_CHANNEL_COL = 4
+VECTOR_DLC_COL = 5
+VECTOR_ID_COL = 7
+VECTOR_DATA_START_COL = 9
+VECTOR_CHANNELS = {"ch:1": 'can1', "ch:0": 'can0'}
+
+# PCAN-View trace version 2.0 columns
+PCAN_HEADER = ";$FILEVERSION"
+PCAN_START_TIME = ";$STARTTIME="
+PCAN_OFFSET_COL = 1
+PCAN_TYPE_COL = 2
+PCAN_ID_COL = 3
+PCAN_DLC_COL = 5
+PCAN_DATA_START_COL = 6
+PCAN_DATA_FRAME = "DT"
+# PCAN-View records a single connection. It is the J1939 network, which
+# is can1 in the other conversions.
+PCAN_CHANNEL = 'can1'
+# Days between the OLE automation date epoch (1899-12-30) and the Unix epoch
+OLE_UNIX_EPOCH_DAYS = 25569
+
+# NMFTA CAN Logger 2 binary files are 512 byte blocks of 19 records
+NMFTA_HEADER = b"CAN2"
+NMFTA_BLOCK_SIZE = 512
+NMFTA_RECORDS_START = 4
+NMFTA_RECORDS_PER_BLOCK = 19
+NMFTA_RECORD_DTYPE = np.dtype([('channel', np.uint8),
+                               ('rtc_seconds', '<u4'),
+                               ('micros', '<u4'),
+                               ('can_id', '<u4'),
+                               ('timer', '<u2'),
+                               ('flags', np.uint8),
+                               ('dlc', np.uint8),
+                               ('data', np.uint8, (8,))])
+NMFTA_RECORDS_END = NMFTA_RECORDS_START + NMFTA_RECORDS_PER_BLOCK * NMFTA_RECORD_DTYPE.itemsize
+MICROS_WRAP = 1 << 32
+
+def channel_number(name, channels):
+    """Returns the index of a channel name, adding it to the list the first time."""
+    try:
+        return channels.index(name)
+    except ValueError:
+        channels.append(name)
+        return len(channels) - 1
+
+def collect_frames(records):
+    """Builds a FRAME_DTYPE array from (timestamp, can_id, dlc, data, channel) tuples.
+
+    The rows are converted a block at a time and joined once at the end,
+    so the cost stays linear in the size of the log.
+    """
+    blocks = []
+    block = []
+    for record in records:
+        block.append(record)
+        if len(block) >= BLOCK_ROWS:
+            blocks.append(np.array(block, dtype=RECORD_DTYPE))
+            block = []
+    blocks.append(np.array(block, dtype=RECORD_DTYPE))
+    return np.concatenate(blocks).view(FRAME_DTYPE)
+
+def iter_vspy(filename, channels, utc_offset=LOCAL_UTC_OFFSET):
+    with open(filename, 'r') as f:
+        header = [f.readline() for _ in range(VSPY_START_TIME_LINE + 1)]
+        if VSPY_HEADER not in header[0]:
+            raise ValueError("{} is not a Vehicle Spy file".format(filename))
+        start_date = header[VSPY_START_DATE_LINE].strip().split(',')[1]
+        start_time = header[VSPY_START_TIME_LINE].strip().split(',')[1]
+        log_time = time.strptime(start_date + ' ' + start_time, "%m/%d/%Y %I:%M:%S %p")
+        log_time_offset = calendar.timegm(log_time) - utc_offset
+        for line in f:
+            line_list = line.strip().split(',')
+            if len(line_list) < VSPY_DATA_COLS.stop or not line_list[0].isdigit():
+                continue # Header or blank line
+            # Extract the network as the channel:
+            channel = VSPY_NETWORKS.get(line_list[VSPY_NETWORK_COL])
+            if channel is None:
+                continue # This line wasn't from the CAN
+            can_data = bytes.fromhex("".join(line_list[VSPY_DATA_COLS]))
+            yield (round(float(line_list[VSPY_TIME_COL]) + log_time_offset, 6),
+                   int(line_list[VSPY_ID_COL], 16),
+                   len(can_data),
+                   can_data,
+                   channel_number(channel, channels))
+
+def iter_vector(filename, channels):
+    # The export has a micro sign in a non UTF-8 encoding, so read bytes
+    with open(filename, 'rb') as f:
+        for line in f:
+            line_list = line.decode('utf-8', 'ignore').strip().split(',')
+            if len(line_list) <= VECTOR_ID_COL:
+                continue
+            # Extract the network as the channel:
+            channel = VECTOR_CHANNELS.get(line_list[VECTOR_CHANNEL_COL][-4:])
+            if channel is None or not line_list[VECTOR_DLC_COL].startswith("Dlc:"):
+                continue # This line wasn't a CAN frame
+            try:
+                can_id = int(line_list[VECTOR_ID_COL], 16)
+            except ValueError:
+                continue
+            dlc = int(line_list[VECTOR_DLC_COL][4:])
+            can_data = bytes.fromhex("".join(line_list[VECTOR_DATA_START_COL:VECTOR_DATA_START_COL + dlc]))
+            # The times are relative to the start of the measurement
+            yield (float(line_list[VECTOR_TIME_COL]),
+                   can_id,
+                   len(can_data),
+                   can_data,
+                   channel_number(channel, channels))
+
+def iter_pcan(filename, channels, utc_offset=LOCAL_UTC_OFFSET):
+    log_time_offset = None
+    channel = channel_number(PCAN_CHANNEL, channels)
+    with open(filename, 'r') as f:
+        for line in f:
+            if line.startswith(';'):
+                if line.startswith(PCAN_START_TIME):
+                    ole_date = float(line[len(PCAN_START_TIME):])
+                    log_time_offset = (ole_date - OLE_UNIX_EPOCH_DAYS) * 86400 - utc_offset
+                continue
+            line_list = line.split()
+            if len(line_list) <= PCAN_DLC_COL or line_list[PCAN_TYPE_COL] != PCAN_DATA_FRAME:
+                continue # Error, status and other non data frames
+            if log_time_offset is None:
+                raise ValueError("{} has no start time".format(filename))
+            dlc = int(line_list[PCAN_DLC_COL])
+            can_data = bytes.fromhex("".join(line_list[PCAN_DATA_START_COL:PCAN_DATA_START_COL + dlc]))
+            yield (round(log_time_offset + float(line_list[PCAN_OFFSET_COL]) / 1000, 6),
+                   int(line_list[PCAN_ID_COL], 16),
+                   len(can_data),
+                   can_data,
+                   channel)
+
+def read_vspy(filename):
+    channels = []
+    return collect_frames(iter_vspy(filename, channels)), channels
+
+def read_vector(filename):
+    channels = []
+    return collect_frames(iter_vector(filename, channels)), channels
+
+def read_pcan(filename):
+    channels = []
+    return collect_frames(iter_pcan(filename, channels)), channels
+
+def read_nmfta(filename):
+    """Decodes an NMFTA CAN Logger 2 file with NumPy.
+
+    Each record has the real time clock seconds and a free running
+    microsecond counter. Times are the first clock reading plus the
+    elapsed microseconds, unwrapping the counter when it rolls over.
+    """
+    blocks = np.fromfile(filename, dtype=np.uint8)
+    blocks = blocks[:len(blocks) - len(blocks) % NMFTA_BLOCK_SIZE].reshape(-1, NMFTA_BLOCK_SIZE)
+    blocks = blocks[(blocks[:, :len(NMFTA_HEADER)] == np.frombuffer(NMFTA_HEADER, np.uint8)).all(axis=1)]
+    records = np.ascontiguousarray(blocks[:, NMFTA_RECORDS_START:NMFTA_RECORDS_END]).view(NMFTA_RECORD_DTYPE).reshape(-1)
+    frames = np.zeros(len(records), dtype=FRAME_DTYPE)
+    if len(records) == 0:
+        return frames, []
+    # Records from the two channels are interleaved, so the counter can
+    # step back a little. Treat the differences as signed.
+    steps = np.diff(records['micros'].astype(np.int64))
+    steps = (steps + MICROS_WRAP // 2) % MICROS_WRAP - MICROS_WRAP // 2
+    elapsed = np.concatenate(([0], np.cumsum(steps)))
+    frames['timestamp'] = records['rtc_seconds'][0] + elapsed / 1e6
+    frames['can_id'] = records['can_id']
+    frames['dlc'] = records['dlc']
+    # Bytes past the data length are zero, as in the other readers
+    frames['data'] = np.where(np.arange(8) < records['dlc'][:, None], records['data'], 0)
+    channel_names = np.unique(records['channel'])
+    channels = ['can{}'.format(channel) for channel in channel_names]
+    frames['channel'] = np.searchsorted(channel_names, records['channel'])
+    return frames, channels
+
+READERS = {'candump': read_candump,
+           'vspy': read_vspy,
+           'vector': read_vector,
+           'pcan': read_pcan,
+           'nmfta': read_nmfta}
+
+def detect_format(filename):
+    """Returns the READERS key for a log file from its first bytes."""
+    with open(filename, 'rb') as f:
+        head = f.read(4096)
+    if head.startswith(NMFTA_HEADER):
+        return 'nmfta'
+    if head.startswith(VSPY_HEADER.encode()):
+        return 'vspy'
+    if head.startswith(VECTOR_HEADER.encode()):
+        return 'vector'
+    if head.startswith(PCAN_HEADER.encode()):
+        return 'pcan'
+    if CANDUMP_PATTERN.search(head):
+        return 'candump'
+    raise ValueError("Unknown log format for {}".format(filename))
+
+def read_log(filename, log_format=None):
+    """Reads any supported log into (frames, channels) like read_candump."""
+    if log_format is None:
+        log_format = detect_format(filename)
+    return READERS[log_format](filename)
+
+def format_candump_line(timestamp, can_id, dlc, data, channel):
+    # Standard 11 bit IDs are written with 3 digits like candump does
+    id_format = "{:03X}" if can_id <= 0x7FF else "{:08X}"
+    return ("({:0.6f}) {} " + id_format + "#{}\n").format(timestamp, channel, can_id, data[:dlc].hex().upper())
+
+def write_candump(frames, channels, filename):
+    """Writes frames to a candump file one line at a time."""
+    with open(filename, 'w') as f:
+        f.writelines(format_candump_line(timestamp, can_id, dlc, data, channels[channel])
+                     for timestamp, can_id, dlc, data, channel in zip(frames['timestamp'].tolist(),
+                                                                      frames['can_id'].tolist(),
+                                                                      frames['dlc'].tolist(),
+                                                                      map(bytes, frames['data']),
+                                                                      frames['channel'].tolist()))
+
+def main():
+    for name in sorted(os.listdir(LOG_DIR)):
+        filename = os.path.join(LOG_DIR, name)
+        try:
+            log_format = detect_format(filename)
+        except ValueError:
+            continue
+        start = time.perf_counter()
+        frames, channels = read_log(filename, log_format)
+        elapsed = time.perf_counter() - start
+        print("{:8s} {:45s} {:7d} frames in {:0.3f} s ({:8.0f} frames/s, {:6.1f} MB/s)".format(
+            log_format, name, len(frames), elapsed, len(frames) / elapsed,
+            os.path.getsize(filename) / elapsed / 1e6))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,172 @@
+"""
+Metrics: named counters and fixed bucket latency histograms, cheap enough to leave on.
+
+Record into METRICS and export it with snapshot() or prometheus_text().
+The J1939 pipeline, the SQLite loader and the Tornado server import it
+from here, so everything that runs in one process shares a registry.
+"""
+from time import perf_counter_ns
+from bisect import bisect_left
+import functools
+import math
+
+# Bucket upper bounds in nanoseconds: 1, 2.5 and 5 for each power of ten from 1 us to 5 s
+LATENCY_BUCKETS_NS = tuple(int(mantissa * 10 ** exponent) for exponent in range(3, 10) for mantissa in (1, 2.5, 5))
+
+class Counter():
+    __slots__ = ('value',)
+
+    def __init__(self):
+        self.value = 0
+
+    def incr(self, count=1):
+        self.value += count
+
+class Histogram():
+    """Counts observations in fixed buckets, so recording one is a bisect and two additions."""
+    __slots__ = ('bounds', 'counts', 'sum')
+
+    def __init__(self, bounds=LATENCY_BUCKETS_NS):
+        self.bounds = tuple(bounds)
+        # The last count is for observations above every bound
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.sum = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+    def time(self):
+        """Returns a context manager that observes the nanoseconds its block takes."""
+        return HistogramTimer(self)
+
+    def quantile(self, fraction):
+        """Returns the upper bound of the bucket holding the given fraction of the observations."""
+        count = sum(self.counts)
+        if not count:
+            return None
+        rank = fraction * count
+        cumulative = 0
+        for bound, bucket_count in zip(self.bounds, self.counts):
+            cumulative += bucket_count
+            if cumulative >= rank:
+                return bound
+        return math.inf
+
+class HistogramTimer():
+    __slots__ = ('histogram', 't0')
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.t0 = perf_counter_ns()
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.histogram.observe(perf_counter_ns() - self.t0)
+
+def escape_label(value):
+    """Escapes a label value for the Prometheus text format."""
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def json_quantile(histogram, fraction):
+    """Returns a quantile for JSON, with '+Inf' for one above every bound, as in the bucket keys."""
+    value = histogram.quantile(fraction)
+    return '+Inf' if value == math.inf else value
+
+class Metrics():
+    """A registry of counters and latency histograms.
+
+    A metric is identified by its name and an optional dictionary of
+    labels. Look a metric up once and keep it when it is used in a loop.
+    Histograms record nanoseconds and are exported to Prometheus in
+    seconds, so their names end in _seconds by convention.
+    Updates aren't locked: a rare lost count between threads is the
+    price of keeping them cheap.
+    """
+    def __init__(self):
+        self.counters = {}
+        self.histograms = {}
+        self.help = {}
+
+    def _key(self, name, help, labels):
+        if help:
+            self.help[name] = help
+        return (name, tuple(sorted(labels.items())) if labels else ())
+
+    def counter(self, name, help=None, labels=None):
+        key = self._key(name, help, labels)
+        counter = self.counters.get(key)
+        if counter is None:
+            counter = self.counters[key] = Counter()
+        return counter
+
+    def histogram(self, name, help=None, labels=None, bounds=LATENCY_BUCKETS_NS):
+        key = self._key(name, help, labels)
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = Histogram(bounds)
+        return histogram
+
+    def timing(self, name, help=None, labels=None):
+        """Context manager that records how long its block takes in a histogram."""
+        return self.histogram(name, help, labels).time()
+
+    def timed(self, name, help=None, labels=None):
+        """Decorator that records how long each call takes in a histogram."""
+        histogram = self.histogram(name, help, labels)
+        def decorator(function):
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                t0 = perf_counter_ns()
+                try:
+                    return function(*args, **kwargs)
+                finally:
+                    histogram.observe(perf_counter_ns() - t0)
+            return wrapper
+        return decorator
+
+    def snapshot(self):
+        """Returns the current values as a dictionary that can be dumped as JSON."""
+        def labelled(name, labels):
+            return name + ('{' + ','.join('{}={}'.format(label, value) for label, value in labels) + '}' if labels else '')
+        histograms = {}
+        for (name, labels), histogram in self.histograms.items():
+            histograms[labelled(name, labels)] = {
+                'count': sum(histogram.counts),
+                'sum_ns': histogram.sum,
+                'p50_ns': json_quantile(histogram, 0.5),
+                'p99_ns': json_quantile(histogram, 0.99),
+                'buckets_ns': dict(zip([str(bound) for bound in histogram.bounds] + ['+Inf'], histogram.counts))}
+        return {'counters': {labelled(name, labels): counter.value for (name, labels), counter in self.counters.items()},
+                'histograms': histograms}
+
+    def prometheus_text(self):
+        """Returns the current values in the Prometheus text exposition format."""
+        def label_text(labels, extra=()):
+            pairs = list(labels) + list(extra)
+            return '{' + ','.join('{}="{}"'.format(label, escape_label(value)) for label, value in pairs) + '}' if pairs else ''
+        lines = []
+        for metrics, kind in ((self.counters, 'counter'), (self.histograms, 'histogram')):
+            for name in sorted({name for name, _ in metrics}):
+                if name in self.help:
+                    lines.append(f"# HELP {name} {self.help[name]}")
+                lines.append(f"# TYPE {name} {kind}")
+                for (metric_name, labels), metric in metrics.items():
+                    if metric_name != name:
+                        continue
+                    if kind == 'counter':
+                        lines.append(f"{name}{label_text(labels)} {metric.value}")
+                        continue
+                    cumulative = 0
+                    for bound, count in zip(metric.bounds, metric.counts):
+                        cumulative += count
+                        lines.append(f"{name}_bucket{label_text(labels, [('le', repr(bound / 1e9))])} {cumulative}")
+                    cumulative += metric.counts[-1]
+                    lines.append(f"{name}_bucket{label_text(labels, [('le', '+Inf')])} {cumulative}")
+                    lines.append(f"{name}_sum{label_text(labels)} {metric.sum / 1e9}")
+                    lines.append(f"{name}_count{label_text(labels)} {cumulative}")
+        return '\n'.join(lines) + '\n'
+
+METRICS = Metrics()
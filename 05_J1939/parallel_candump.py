@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Parse large candump files on several cores.
+
+The file is split into byte ranges that start and end on newline
+boundaries. Each range is parsed in a worker process with the same
+parse_candump_line function used by the j1939_pipeline stages, then the
+parsed chunks are joined back together in file order, so the output is
+the same as a serial parse.
+"""
+import os
+import time
+import itertools
+from concurrent.futures import ProcessPoolExecutor
+
+from j1939_pipeline import parse_candump_line
+
+BENCHMARK_FILE = 'candump-RTSMaxxForceResourceExhaustion.log'
+BENCHMARK_WORKERS = (1, 2, 4, 8)
+
+def find_chunk_boundaries(filename, num_chunks):
+    """Returns a list of (start, end) byte offsets aligned on newlines."""
+    file_size = os.path.getsize(filename)
+    boundaries = [0]
+    with open(filename, 'rb') as f:
+        for i in range(1, num_chunks):
+            f.seek(file_size * i // num_chunks)
+            # Move to the start of the next full line
+            f.readline()
+            position = f.tell()
+            if position > boundaries[-1] and position < file_size:
+                boundaries.append(position)
+    boundaries.append(file_size)
+    return list(zip(boundaries[:-1], boundaries[1:]))
+
+def parse_chunk(chunk):
+    """Parses the lines in a (filename, start, end) byte range."""
+    filename, start, end = chunk
+    with open(filename, 'rb') as f:
+        f.seek(start)
+        text = f.read(end - start).decode('ascii', 'ignore')
+    return [parse_candump_line(line) for line in text.splitlines() if line.strip()]
+
+def iter_candump_parallel(filename, workers=None, chunks_per_worker=4):
+    """Yields parsed frames from the file in file order.
+
+    More chunks than workers are used so a slow chunk does not leave
+    the other processes idle.
+    """
+    workers = workers or os.cpu_count()
+    ranges = find_chunk_boundaries(filename, workers * chunks_per_worker)
+    chunks = [(filename, start, end) for start, end in ranges]
+    if workers == 1:
+        parsed_chunks = [parse_chunk(chunk) for chunk in chunks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            parsed_chunks = list(pool.map(parse_chunk, chunks))
+    # The chunks are consecutive byte ranges, so joining them in order
+    # gives the frames in file order, whatever their timestamps
+    return itertools.chain.from_iterable(parsed_chunks)
+
+def parse_candump_parallel(filename, workers=None):
+    """Returns the list of parsed frames from the file."""
+    return list(iter_candump_parallel(filename, workers))
+
+def parse_candump_serial(filename):
+    """Reference single core parser, one line at a time."""
+    with open(filename, 'r') as f:
+        return [parse_candump_line(line) for line in f if line.strip()]
+
+def main():
+    print("Benchmarking {} on {} cores".format(BENCHMARK_FILE, os.cpu_count()))
+    start = time.perf_counter()
+    serial_frames = parse_candump_serial(BENCHMARK_FILE)
+    serial_time = time.perf_counter() - start
+    print("serial:    {:8.3f} s, {:8d} frames".format(serial_time, len(serial_frames)))
+    for workers in BENCHMARK_WORKERS:
+        start = time.perf_counter()
+        frames = parse_candump_parallel(BENCHMARK_FILE, workers)
+        elapsed = time.perf_counter() - start
+        assert frames == serial_frames, "Parallel output differs from the serial parser"
+        print("{} workers: {:8.3f} s, speedup {:5.2f}x".format(workers, elapsed, serial_time / elapsed))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Cache parsed candump logs in NumPy sidecar files.
+
+The first read of a log parses it with candump_reader and saves the
+frames next to it as <log>.npz, along with the log's size, modification
+time and BLAKE2b hash. Later reads load the columns straight from the
+sidecar. When the size or modification time changes, the log is hashed
+again and only reparsed if its content really changed. A sidecar that
+can't be read is rebuilt, and one that can't be written is skipped.
+"""
+import os
+import time
+import shutil
+import hashlib
+import logging
+import zipfile
+import tempfile
+import numpy as np
+
+from candump_reader import read_candump
+
+# Change this when the sidecar layout or the parser output changes so
+# old sidecars are rebuilt
+CACHE_VERSION = 1
+SIDECAR_EXTENSION = '.npz'
+HASH_BLOCK_SIZE = 1 << 20
+# What np.load raises for an .npz file that is missing, truncated or from an older layout
+SIDECAR_ERRORS = (OSError, ValueError, KeyError, EOFError, zipfile.BadZipFile)
+
+def sidecar_path(filename):
+    return filename + SIDECAR_EXTENSION
+
+def file_digest(filename):
+    """Returns the BLAKE2b hex digest of a file's contents."""
+    digest = hashlib.blake2b()
+    with open(filename, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def write_npz(path, **arrays):
+    """Writes arrays to an .npz file through a temporary file, so readers never see a partial file."""
+    fd, temp_file = tempfile.mkstemp(suffix='.tmp', dir=os.path.dirname(path) or '.')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            np.savez(f, **arrays)
+        os.replace(temp_file, path)
+    except BaseException:
+        os.remove(temp_file)
+        raise
+
+def try_write_npz(path, **arrays):
+    """Writes an .npz file, or logs why it couldn't, such as a read-only directory."""
+    try:
+        write_npz(path, **arrays)
+    except OSError as e:
+        logging.warning("Couldn't save %s: %s", path, e)
+
+def read_npz(path, version):
+    """Returns the arrays of an .npz file as a dictionary, or None if it can't be used."""
+    try:
+        with np.load(path, allow_pickle=False) as cache:
+            if cache['version'] != version:
+                return None
+            return {name: cache[name] for name in cache.files}
+    except SIDECAR_ERRORS:
+        return None
+
+def save_sidecar(sidecar, frames, channels, size, mtime_ns, digest):
+    """Saves the frames and the log's stat and digest, or logs why it couldn't."""
+    try_write_npz(sidecar,
+                  frames=frames,
+                  channels=np.array(channels, dtype=str),
+                  version=CACHE_VERSION,
+                  size=size,
+                  mtime_ns=mtime_ns,
+                  digest=digest)
+
+def load_sidecar(sidecar):
+    """Returns the contents of a sidecar as a dictionary, or None if it can't be used."""
+    return read_npz(sidecar, CACHE_VERSION)
+
+def load_candump(filename, sidecar=None):
+    """Returns (frames, channels) for a candump file, using the sidecar when it is current."""
+    if sidecar is None:
+        sidecar = sidecar_path(filename)
+    stat = os.stat(filename)
+    cache = load_sidecar(sidecar)
+    if cache is not None:
+        if cache['size'] == stat.st_size and cache['mtime_ns'] == stat.st_mtime_ns:
+            return cache['frames'], cache['channels'].tolist()
+        digest = file_digest(filename)
+        if cache['size'] == stat.st_size and str(cache['digest']) == digest:
+            # Touched but not changed, so only the stored time is updated
+            save_sidecar(sidecar, cache['frames'], cache['channels'].tolist(),
+                             stat.st_size, stat.st_mtime_ns, digest)
+            return cache['frames'], cache['channels'].tolist()
+    else:
+        digest = file_digest(filename)
+    frames, channels = read_candump(filename)
+    save_sidecar(sidecar, frames, channels, stat.st_size, stat.st_mtime_ns, digest)
+    return frames, channels
+
+def time_reads(filename):
+    """Prints the time of a first read, a cached read and a read after the log is touched."""
+    start = time.perf_counter()
+    frames, channels = load_candump(filename)
+    parse_time = time.perf_counter() - start
+    print("First read (parse and save): {:8.1f} ms, {} frames".format(parse_time * 1000, len(frames)))
+    start = time.perf_counter()
+    frames, channels = load_candump(filename)
+    cached_time = time.perf_counter() - start
+    print("Cached read:                 {:8.1f} ms".format(cached_time * 1000))
+    os.utime(filename)
+    start = time.perf_counter()
+    frames, channels = load_candump(filename)
+    touched_time = time.perf_counter() - start
+    print("Read after touch (rehash):   {:8.1f} ms".format(touched_time * 1000))
+
+def main():
+    # Time a copy, so touching it doesn't change the log in the repository
+    temp_dir = tempfile.mkdtemp()
+    filename = os.path.join(temp_dir, 'KWTruck.txt')
+    shutil.copy2('KWTruck.txt', filename)
+    try:
+        time_reads(filename)
+    finally:
+        shutil.rmtree(temp_dir)
+
+if __name__ == '__main__':
+    main()
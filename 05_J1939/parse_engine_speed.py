@@ -1,64 +1,79 @@
 #!/usr/bin/env python3
-import struct
-import matplotlib.pyplot as plt
+import argparse
+import os
+import sys
+from array import array
+from collections import Counter
 
-PRIORITY_MASK       = 0x1C000000
-PDU_FORMAT_MASK     = 0x00FF0000
-PDU_SPECIFIC_MASK   = 0x0000FF00 
-SOURCE_ADDRESS_MASK = 0x000000FF 
-DATA_PAGE_MASK      = 0x01000000 
-EXT_DATA_PAGE_MASK  = 0x02000000 
-PDU1_PGN_MASK       = 0x03FF0000 
-PDU2_PGN_MASK       = 0x03FFFF00
+# The candump parser and the processing stages are shared with the other scripts
+from j1939_pipeline import (parse_candump_line, array_frames, decode_j1939,
+                            tap, filter_frames, decode_spns)
+from parse_cache import load_candump
+from spn_decoder import SPNDecoder
+from signal_decimation import lttb, finite_samples, PLOT_POINTS
 
-PRIORITY_OFFSET    = 26 
-PDU_FORMAT_OFFSET  = 16 
-DA_OFFSET          = 8 
-PGN_OFFSET         = 8
-PDU2_THRESHOLD     = 240
+# The database queries live with the SQLite loader
+DATABASE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "00_Testing Code")
+if DATABASE_DIR not in sys.path:
+    sys.path.append(DATABASE_DIR)
+from queryDatabase_j1939 import CanDatabase
 
-GLOBAL_SOURCE_ADDR = 0xFF
 ENGINE_SA          = 0
 
-CANDUMP_TIMESTAMP_ADDR = 0
-CANDUMP_CHANNEL_ADDR   = 1
-CANDUMP_ID_ADDR        = 2
-CANDUMP_DLC_ADDR       = 3
-DATA_START_ADDR        = 4
-
 PGN_EEC1 = 61444
+SPN_ENGINE_SPEED = 190
+
+def engine_speed_from_log(filename):
+    """Returns arrays of the engine speed times and values from a candump log, and the frame count of each source address."""
+    # Only the plotted values are kept, in compact arrays of doubles
+    spn190_times = array('d')
+    spn190_values = array('d')
+    sa_count = Counter()
+    # We knew this data file was from Linux SocketCAN using candump.
+    # The parsed frames are cached next to the log, so later runs skip the parsing.
+    frames = decode_j1939(array_frames(*load_candump(filename)))
+    frames = tap(frames, lambda frame: sa_count.update((frame['source_address'],)))
+    # PGN for electronic engine control 1 messsage
+    frames = filter_frames(frames, pgns={PGN_EEC1}, source_addresses={ENGINE_SA})
+    # Scaling and bit positions come from J1939db.json
+    for j1939_frame in decode_spns(frames, SPNDecoder()):
+        rpm = j1939_frame['spns'][SPN_ENGINE_SPEED]
+        if rpm is None:
+            continue # Engine speed is not available or in error
+        spn190_values.append(rpm)
+        # Include the timestamp for time series data
+        spn190_times.append(j1939_frame['timestamp'])
+    return spn190_times, spn190_values, sa_count
 
-SPN190_SCALE = 0.125 #RPM/bit
-SPN190_OFFSET = 0
+def engine_speed_from_database(db_file):
+    """Returns arrays of the engine speed times and values from a database made with loadDatabase_j1939.py --timeseries."""
+    database = CanDatabase(db_file, cached=False)
+    try:
+        times, values = database.signal(PGN_EEC1, SPN_ENGINE_SPEED, ENGINE_SA)
+    finally:
+        database.conn.close()
+    # Drop the samples where engine speed is not available or in error
+    return finite_samples(times, values)
 
 def main():
-    spn190_times = []
-    spn190_values = []
-    filename = 'KWTruck.txt'
-    sa_count={}
-    with open(filename,'r') as f:
-        for line in f:
-            # We knew this data file was from Linux SocketCAN using candump.
-            j1939_frame = parse_candump_line(line)
-            # Add the additional results from parsing the id
-            j1939_frame.update(parseJ1939id(j1939_frame['id']))
-            # PGN for electronic engine control 1 messsage
-            try:
-                sa_count[j1939_frame["source_address"]]+=1
-            except KeyError:    
-                sa_count[j1939_frame["source_address"]]=1
-            if (j1939_frame['pgn'] == PGN_EEC1 and 
-                j1939_frame["source_address"] == ENGINE_SA): 
-                # Unpack the engine speed data in big endian format and 
-                # convert to engineering values
-                rpm = (struct.unpack('<H',j1939_frame['data'][3:5])[0]
-                         * SPN190_SCALE + SPN190_OFFSET)
-                spn190_values.append(rpm)
-                # Include the timestamp for time series data
-                spn190_times.append(j1939_frame['timestamp'])
-    print(sa_count)        
-    #Plot the engine speed  
-    plt.plot(spn190_times,spn190_values,'-',label="Engine RPM")
+    parser = argparse.ArgumentParser(description="Plot the engine speed from a candump log or a J1939 database.")
+    parser.add_argument("filename", nargs="?", default='KWTruck.txt', help="Path to the candump log.")
+    parser.add_argument("--db", default=None,
+                        help="Read the frames from this database, made with loadDatabase_j1939.py --timeseries, instead of the log.")
+    args = parser.parse_args()
+    # Import here so the parsing functions can be used without a plotting backend
+    import matplotlib.pyplot as plt
+    if args.db is not None:
+        spn190_times, spn190_values = engine_speed_from_database(args.db)
+        filename = os.path.basename(args.db)
+    else:
+        spn190_times, spn190_values, sa_count = engine_speed_from_log(args.filename)
+        print(dict(sa_count))
+        filename = os.path.basename(args.filename)
+    # Only as many points as the plot can show, so long logs still make small PDFs
+    plot_times, plot_values = lttb(spn190_times, spn190_values, PLOT_POINTS)
+    #Plot the engine speed
+    plt.plot(plot_times,plot_values,'-',label="Engine RPM")
     plt.xlabel("Time (sec.)")
     plt.ylabel("Engine Speed (RPM)")
     plt.title("Engine Speed for {}".format(filename))
@@ -67,48 +82,5 @@ def main():
     #plt.show()
     plt.savefig('EngineSpeedGraphFrom{}.pdf'.format(filename))
 
-def parseJ1939id(id):
-    sa = id & SOURCE_ADDRESS_MASK
-    priority = (id & PRIORITY_MASK) >> PRIORITY_OFFSET
-    pf = (id & PDU_FORMAT_MASK) >> PDU_FORMAT_OFFSET
-    if (pf < PDU2_THRESHOLD):  # See SAE J1939-21
-        # PDU 1 format uses values lower than 240
-        da = (id & PDU_SPECIFIC_MASK) >> DA_OFFSET
-        pgn = (id & PDU1_PGN_MASK) >> PGN_OFFSET
-    else:         # PDU 2 format
-        da = GLOBAL_SOURCE_ADDR
-        pgn = (id & PDU2_PGN_MASK) >> PGN_OFFSET
-    return {'source_address': sa,
-            'priority': priority,
-            'destination_address': da,
-            'pgn': pgn}
-
-def parse_candump_line(line):
-    # Strip the newline characters and white space off the ends
-    # then split the string into a list based on whitespace. 
-    data = line.strip().split()         
-    # can_dump formats use parenthese to wrap the floating
-    # point timestamp. We just want the numbers so use [1:-1] to slice
-    time_stamp = float(data[CANDUMP_TIMESTAMP_ADDR][1:-1])
-    # physical CAN channel
-    channel = data[CANDUMP_CHANNEL_ADDR]
-    # determine the can arbitration identifier as an integer
-    can_id = int(data[CANDUMP_ID_ADDR],16)
-    # Data length code is a single byte wrapped in []
-    dlc = int(data[CANDUMP_DLC_ADDR][1])
-    # Build the data field as a byte array
-    data_bytes = b''
-    for byte_string in data[DATA_START_ADDR:]:
-        # Convert text into a single byte
-        data_bytes += struct.pack('B',int(byte_string,16))
-    #assert dlc == len(data_bytes)
-    can_frame = {'id':can_id,
-                 'dlc':dlc,
-                 'data':data_bytes,
-                 'timestamp':time_stamp,
-                 'channel':channel}
-    return can_frame
-
 if __name__ == '__main__':
     main()
-
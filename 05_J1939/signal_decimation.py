@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+"""
+Reduce long signals to plot-ready series.
+
+A few hours of a 10 ms signal is millions of samples, far more than a
+plot has pixels. lttb picks the samples that keep the shape of the
+line (Largest-Triangle-Three-Buckets), and minmax_decimate keeps the
+lowest and highest sample of each bucket so spikes are never lost.
+
+build_aggregates precomputes the count, sum, min and max of a signal
+over 1, 10 and 60 second buckets. load_signal keeps the samples and the
+aggregates of one SPN next to the log, as <log>.<pgn>_<sa>_<spn>.signal.npz.
+plot_series reads from the finest level that has few enough points in
+the visible window, so zooming costs time in proportion to pixels
+rather than samples.
+"""
+import os
+import time
+import numpy as np
+
+from parse_cache import load_candump, read_npz, try_write_npz
+from j1939_id import decode_j1939_ids
+from spn_decoder import SPNDecoder
+
+RESOLUTIONS = (1, 10, 60)  # Seconds per aggregate bucket
+PLOT_POINTS = 2000
+# A window is read from a level with up to this many rows per plot point
+MAX_ROWS_PER_POINT = 16
+
+# Change this when the signal sidecar layout changes so old ones are rebuilt
+SIGNAL_CACHE_VERSION = 1
+SIGNAL_EXTENSION = '.signal.npz'
+
+AGGREGATE_DTYPE = np.dtype([('time', np.float64),  # Start of the bucket
+                            ('count', np.uint32),
+                            ('sum', np.float64),
+                            ('min', np.float64),
+                            ('min_time', np.float64),
+                            ('max', np.float64),
+                            ('max_time', np.float64)])
+
+def finite_samples(times, values):
+    """Returns float64 copies sorted by time, without the NaN samples of unavailable values."""
+    times = np.asarray(times, dtype=np.float64)
+    values = np.asarray(values, dtype=np.float64)
+    keep = ~np.isnan(values)
+    times = times[keep]
+    values = values[keep]
+    if len(times) > 1 and np.any(np.diff(times) < 0):
+        order = np.argsort(times, kind='stable')
+        times = times[order]
+        values = values[order]
+    return times, values
+
+def group_extremes(lows, highs, starts):
+    """Returns the min and max of each group of consecutive rows, with the times they occur.
+
+    starts holds the strictly increasing index of the first row of each
+    group. lows and highs are the same array for raw samples.
+    """
+    counts = np.diff(np.append(starts, len(lows)))
+    group = np.repeat(np.arange(len(starts)), counts)
+    mins = np.minimum.reduceat(lows, starts)
+    maxs = np.maximum.reduceat(highs, starts)
+    # The first row of each group that holds its extreme
+    min_rows = np.flatnonzero(lows == mins[group])
+    min_rows = min_rows[np.unique(group[min_rows], return_index=True)[1]]
+    max_rows = np.flatnonzero(highs == maxs[group])
+    max_rows = max_rows[np.unique(group[max_rows], return_index=True)[1]]
+    return mins, min_rows, maxs, max_rows
+
+def interleave_extremes(min_times, mins, max_times, maxs):
+    """Returns the min and max of each bucket as one series in time order."""
+    min_first = min_times <= max_times
+    times = np.empty(2 * len(mins))
+    values = np.empty(2 * len(mins))
+    times[0::2] = np.where(min_first, min_times, max_times)
+    times[1::2] = np.where(min_first, max_times, min_times)
+    values[0::2] = np.where(min_first, mins, maxs)
+    values[1::2] = np.where(min_first, maxs, mins)
+    return times, values
+
+def minmax_decimate(times, values, points=PLOT_POINTS):
+    """Reduces a series to about points samples, keeping the min and max of each bucket."""
+    times, values = finite_samples(times, values)
+    if len(values) <= points:
+        return times, values
+    buckets = max(points // 2, 1)
+    starts = np.unique(np.linspace(0, len(values), buckets, endpoint=False).astype(np.int64))
+    mins, min_rows, maxs, max_rows = group_extremes(values, values, starts)
+    return interleave_extremes(times[min_rows], mins, times[max_rows], maxs)
+
+def lttb(times, values, points=PLOT_POINTS):
+    """Reduces a series to points samples with Largest-Triangle-Three-Buckets.
+
+    The first and last samples are kept. From each bucket in between,
+    the sample kept is the one making the largest triangle with the
+    sample kept from the bucket before and the mean of the bucket after.
+    """
+    times, values = finite_samples(times, values)
+    count = len(values)
+    if points >= count or points < 3:
+        return times, values
+    edges = np.linspace(1, count - 1, points - 1).astype(np.int64)
+    selected = np.empty(points, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = count - 1
+    previous = 0
+    for bucket in range(points - 2):
+        start = edges[bucket]
+        end = edges[bucket + 1]
+        # The bucket after the last one is the final sample
+        next_end = edges[bucket + 2] if bucket + 2 < len(edges) else count
+        next_time = times[end:next_end].mean()
+        next_value = values[end:next_end].mean()
+        previous_time = times[previous]
+        previous_value = values[previous]
+        # Twice the triangle areas, which is enough to compare them
+        areas = np.abs((previous_time - next_time) * (values[start:end] - previous_value)
+                       - (previous_time - times[start:end]) * (next_value - previous_value))
+        previous = start + int(np.argmax(areas))
+        selected[bucket + 1] = previous
+    return times[selected], values[selected]
+
+def aggregate_rows(starts, counts, sums, lows, low_times, highs, high_times, bucket_times):
+    """Combines groups of consecutive rows into one aggregate row each."""
+    mins, min_rows, maxs, max_rows = group_extremes(lows, highs, starts)
+    aggregates = np.zeros(len(starts), dtype=AGGREGATE_DTYPE)
+    aggregates['time'] = bucket_times
+    aggregates['count'] = np.add.reduceat(counts, starts)
+    aggregates['sum'] = np.add.reduceat(sums, starts)
+    aggregates['min'] = mins
+    aggregates['min_time'] = low_times[min_rows]
+    aggregates['max'] = maxs
+    aggregates['max_time'] = high_times[max_rows]
+    return aggregates
+
+def bucket_starts(times, resolution):
+    """Returns the first row of each time bucket and the start time of those buckets."""
+    buckets = np.floor(times / resolution).astype(np.int64)
+    starts = np.flatnonzero(np.diff(buckets, prepend=buckets[0] - 1))
+    return starts, buckets[starts] * float(resolution)
+
+def build_aggregates(times, values, resolutions=RESOLUTIONS):
+    """Returns a dictionary of resolution to AGGREGATE_DTYPE rows, one per non-empty bucket.
+
+    The finest level is built from the samples and each coarser level
+    from the one before it, so only the first pass touches every sample.
+    Each resolution should be a multiple of the one before it.
+    """
+    times, values = finite_samples(times, values)
+    levels = {}
+    if not len(values):
+        return {resolution: np.zeros(0, dtype=AGGREGATE_DTYPE) for resolution in resolutions}
+    rows = None
+    for resolution in sorted(resolutions):
+        if rows is None:
+            starts, bucket_times = bucket_starts(times, resolution)
+            rows = aggregate_rows(starts, np.ones(len(values), dtype=np.uint32), values,
+                                  values, times, values, times, bucket_times)
+        else:
+            starts, bucket_times = bucket_starts(rows['time'], resolution)
+            rows = aggregate_rows(starts, rows['count'], rows['sum'],
+                                  rows['min'], rows['min_time'], rows['max'], rows['max_time'], bucket_times)
+        levels[resolution] = rows
+    return levels
+
+def plot_series(times, values, aggregates=None, start=None, end=None, points=PLOT_POINTS):
+    """Returns about points samples of the window from start to end, ready to plot.
+
+    times and values must already be sorted without NaN, as load_signal
+    returns them. The raw samples are used when the window holds few
+    enough of them. Otherwise the min and max are taken from the finest
+    aggregate level with at most MAX_ROWS_PER_POINT rows per point, or
+    the coarsest level when none has so few.
+    """
+    start = -np.inf if start is None else start
+    end = np.inf if end is None else end
+    first = np.searchsorted(times, start, side='left')
+    last = np.searchsorted(times, end, side='right')
+    limit = points * MAX_ROWS_PER_POINT
+    if last - first <= limit or not aggregates:
+        return minmax_decimate(times[first:last], values[first:last], points)
+    resolutions = sorted(aggregates)
+    for resolution in resolutions:
+        rows = aggregates[resolution]
+        # Include the bucket that holds the start of the window
+        row_first = np.searchsorted(rows['time'], start - resolution, side='right')
+        row_last = np.searchsorted(rows['time'], end, side='right')
+        if row_last - row_first <= limit or resolution == resolutions[-1]:
+            break
+    rows = rows[row_first:row_last]
+    if 2 * len(rows) > points:
+        buckets = max(points // 2, 1)
+        starts = np.unique(np.linspace(0, len(rows), buckets, endpoint=False).astype(np.int64))
+        mins, min_rows, maxs, max_rows = group_extremes(rows['min'], rows['max'], starts)
+        return interleave_extremes(rows['min_time'][min_rows], mins, rows['max_time'][max_rows], maxs)
+    return interleave_extremes(rows['min_time'], rows['min'], rows['max_time'], rows['max'])
+
+def extract_signal(frames, pgn, source_address, spn, decoder=None):
+    """Returns the times and values of an SPN from a candump_reader frame array, with NaN where unavailable."""
+    if decoder is None:
+        decoder = SPNDecoder()
+    fields = decode_j1939_ids(frames['can_id'])
+    frames = frames[(fields['pgn'] == pgn) & (fields['source_address'] == source_address)]
+    values = decoder.decode_batch(pgn, frames['data'])[spn]
+    for plan in decoder.compile_pgn(pgn):
+        if plan.spn == spn:
+            # Bytes past the data length code are padding, not values
+            values[frames['dlc'] <= plan.last_byte] = np.nan
+    return frames['timestamp'], values
+
+def signal_path(filename, pgn, source_address, spn):
+    return "{}.{}_{}_{}{}".format(filename, pgn, source_address, spn, SIGNAL_EXTENSION)
+
+def load_signal(filename, pgn, source_address, spn, resolutions=RESOLUTIONS, decoder=None):
+    """Returns (times, values, aggregates) for an SPN in a candump log.
+
+    The samples are sorted with the unavailable ones removed. They are
+    cached with their aggregates next to the log and rebuilt when the
+    log's size or modification time changes.
+    """
+    sidecar = signal_path(filename, pgn, source_address, spn)
+    stat = os.stat(filename)
+    cache = read_npz(sidecar, SIGNAL_CACHE_VERSION)
+    if (cache is not None and cache['size'] == stat.st_size and cache['mtime_ns'] == stat.st_mtime_ns
+            and tuple(cache['resolutions']) == tuple(resolutions)):
+        return cache['times'], cache['values'], {resolution: cache['aggregates_{}'.format(resolution)]
+                                                 for resolution in resolutions}
+    frames, channels = load_candump(filename)
+    times, values = finite_samples(*extract_signal(frames, pgn, source_address, spn, decoder))
+    aggregates = build_aggregates(times, values, resolutions)
+    try_write_npz(sidecar, times=times, values=values, version=SIGNAL_CACHE_VERSION,
+                  size=stat.st_size, mtime_ns=stat.st_mtime_ns, resolutions=np.array(resolutions),
+                  **{'aggregates_{}'.format(resolution): rows for resolution, rows in aggregates.items()})
+    return times, values, aggregates
+
+def main():
+    # Engine speed from the engine, as in parse_engine_speed.py, repeated to make a long run
+    times, values, aggregates = load_signal('KWTruck.txt', 61444, 0, 190)
+    span = times[-1] - times[0] + 1
+    repeats = 200
+    long_times = np.concatenate([times + i * span for i in range(repeats)])
+    long_values = np.tile(values, repeats)
+    print("{} samples over {:.1f} hours".format(len(long_values), (long_times[-1] - long_times[0]) / 3600))
+
+    start = time.perf_counter()
+    long_aggregates = build_aggregates(long_times, long_values)
+    print("Aggregates:     {:8.1f} ms, {}".format((time.perf_counter() - start) * 1000,
+                                                 {resolution: len(rows) for resolution, rows in long_aggregates.items()}))
+    for name, function in (('LTTB', lttb), ('Min/max', minmax_decimate)):
+        start = time.perf_counter()
+        series = function(long_times, long_values, PLOT_POINTS)
+        print("{:8s}        {:8.1f} ms, {} points".format(name, (time.perf_counter() - start) * 1000, len(series[0])))
+    for window in (60, 3600, long_times[-1] - long_times[0]):
+        start = time.perf_counter()
+        series = plot_series(long_times, long_values, long_aggregates, long_times[0], long_times[0] + window)
+        print("Window {:8.0f} s: {:6.2f} ms, {} points".format(window, (time.perf_counter() - start) * 1000, len(series[0])))
+
+if __name__ == '__main__':
+    main()
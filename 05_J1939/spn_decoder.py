@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+Decode J1939 suspect parameter numbers (SPNs) using J1939db.json.
+
+The database is read once. The first time a PGN is decoded, its SPNs
+are compiled into an extraction plan with the bit position, length,
+scaling and not available/error limits of each SPN. Every SPN in a
+message is then pulled from the same integer in one pass, and whole
+columns of payloads can be decoded at once with NumPy.
+"""
+import os
+import json
+import time
+from collections import namedtuple
+import numpy as np
+
+J1939DB_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'J1939db.json')
+
+# Largest top byte of a valid parameter value. Higher values are
+# reserved or indicate an error (0xFE) or not available (0xFF).
+# See SAE J1939-71 for parameter ranges.
+VALID_TOP_BYTE = 0xFA
+
+SPNPlan = namedtuple('SPNPlan', ['spn', 'start_bit', 'length', 'first_byte', 'last_byte',
+                                 'bit_shift', 'mask', 'resolution', 'offset', 'valid_max'])
+
+def valid_max(length):
+    """Returns the largest raw value that holds real data for a parameter size.
+
+    Parameters of a byte or more use the top byte values 0xFB to 0xFF as
+    reserved, error and not available indicators. Shorter parameters use
+    the all ones value for not available and the value below it for an
+    error.
+    """
+    if length >= 8:
+        return (VALID_TOP_BYTE << (length - 8)) | ((1 << (length - 8)) - 1)
+    return (1 << length) - 3 if length > 1 else 1
+
+class SPNDecoder():
+    def __init__(self, db_file=J1939DB_FILE):
+        with open(db_file, 'r') as f:
+            j1939db = json.load(f)
+        self.pgn_db = j1939db['J1939PGNdb']
+        self.spn_db = j1939db['J1939SPNdb']
+        self.plans = {}
+
+    def compile_pgn(self, pgn):
+        """Returns the extraction plan for a PGN, building it the first time."""
+        try:
+            return self.plans[pgn]
+        except KeyError:
+            pass
+        plan = []
+        pgn_entry = self.pgn_db.get(str(pgn), {})
+        for spn in pgn_entry.get('SPNs', []):
+            # The database doesn't describe every SPN listed for a PGN
+            spn_entry = self.spn_db.get(str(spn))
+            if spn_entry is None:
+                continue
+            length = spn_entry['SPNLength']
+            start_bit = spn_entry['StartBit']
+            if not isinstance(length, int) or not isinstance(start_bit, int) or length <= 0:
+                continue
+            plan.append(SPNPlan(spn,
+                                start_bit,
+                                length,
+                                start_bit // 8,
+                                (start_bit + length - 1) // 8,
+                                start_bit % 8,
+                                (1 << length) - 1,
+                                float(spn_entry['Resolution']),
+                                float(spn_entry['Offset']),
+                                valid_max(length)))
+        self.plans[pgn] = plan
+        return plan
+
+    def decode(self, pgn, data):
+        """Decodes every known SPN in one message.
+
+        Returns a dictionary of SPN to engineering value. The value is None
+        when the message says the parameter is not available or in error,
+        or when the message is too short to hold it.
+        """
+        message = int.from_bytes(data, 'little')
+        bit_count = 8 * len(data)
+        values = {}
+        for spn in self.compile_pgn(pgn):
+            if spn.start_bit + spn.length > bit_count:
+                values[spn.spn] = None
+                continue
+            raw = (message >> spn.start_bit) & spn.mask
+            if raw > spn.valid_max:
+                values[spn.spn] = None
+            else:
+                values[spn.spn] = raw * spn.resolution + spn.offset
+        return values
+
+    def decode_batch(self, pgn, data):
+        """Decodes every known SPN for a column of messages with the same PGN.
+
+        data is an (n, length) uint8 array, such as the 'data' column from
+        candump_reader. Returns a dictionary of SPN to float64 arrays with
+        NaN where the parameter is not available or in error.
+        """
+        data = np.asarray(data, dtype=np.uint8)
+        values = {}
+        for spn in self.compile_pgn(pgn):
+            if spn.last_byte >= data.shape[1]:
+                values[spn.spn] = np.full(len(data), np.nan)
+                continue
+            # Assemble the little endian bytes that hold the SPN
+            raw = np.zeros(len(data), dtype=np.uint64)
+            for i, byte in enumerate(range(spn.first_byte, spn.last_byte + 1)):
+                raw |= data[:, byte].astype(np.uint64) << np.uint64(8 * i)
+            raw = (raw >> np.uint64(spn.bit_shift)) & np.uint64(spn.mask)
+            scaled = raw * spn.resolution + spn.offset
+            scaled[raw > spn.valid_max] = np.nan
+            values[spn.spn] = scaled
+        return values
+
+    def describe(self, spn):
+        """Returns the name and units for an SPN."""
+        spn_entry = self.spn_db[str(spn)]
+        return spn_entry['Name'], spn_entry['Units']
+
+def main():
+    from candump_reader import read_candump
+    from j1939_id import decode_j1939_ids
+
+    decoder = SPNDecoder()
+    frames, channels = read_candump('KWTruck.txt')
+    fields = decode_j1939_ids(frames['can_id'])
+    for pgn in np.unique(fields['pgn']):
+        plan = decoder.compile_pgn(int(pgn))
+        if not plan:
+            continue
+        data = frames['data'][fields['pgn'] == pgn]
+        start = time.perf_counter()
+        values = decoder.decode_batch(int(pgn), data)
+        elapsed = time.perf_counter() - start
+        print("PGN {:5d}: {:6d} messages, {:2d} SPNs in {:0.2f} ms".format(
+            int(pgn), len(data), len(plan), elapsed * 1000))
+        for spn, column in values.items():
+            name, units = decoder.describe(spn)
+            available = column[np.isfinite(column)]
+            mean = available.mean() if len(available) else np.nan
+            print("    SPN {:4d} {:45s} mean {:10.3f} {}".format(spn, name[:45], mean, units))
+
+if __name__ == '__main__':
+    main()
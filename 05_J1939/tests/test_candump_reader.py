@@ -0,0 +1,85 @@
+
+from candump_reader import * #Import the file with the function to test
+from parse_engine_speed import parse_candump_line
+import numpy as np
+import os
+
+def test_read_both_layouts(faker):
+    candump_file = faker.file_name()
+    lines = [
+        "(1682544964.910156) can1 0CF00300#D10000FFFFFF00FF\n",
+        " (000.000041)  can1  18F11031   [8]  00 00 FF FF FF FF FF FF\n",
+        "(1682544964.911322) can0 18EFFF00#FFFF\n",
+        "(1682544964.911893) can1 301#00\n",
+        "\n",
+    ]
+    with open(candump_file,'w') as f:
+        f.writelines(lines)
+
+    frames, channels = read_candump(candump_file)
+    assert frames.dtype == FRAME_DTYPE
+    assert len(frames) == 4
+    assert channels == ['can1', 'can0']
+    # Check the columns against the line by line parser
+    for line, frame in zip(lines, frames):
+        expected = parse_candump_line(line)
+        assert frame['timestamp'] == expected['timestamp']
+        assert frame['can_id'] == expected['id']
+        assert frame['dlc'] == expected['dlc']
+        assert bytes(frame['data'][:frame['dlc']]) == expected['data']
+        assert channels[frame['channel']] == expected['channel']
+
+    os.remove(candump_file)
+
+def test_trailing_junk_is_rejected(faker):
+    candump_file = faker.file_name()
+    with open(candump_file,'w') as f:
+        f.write("(1682544964.910156) can1 123#R\n")
+        f.write("(1682544964.911322) can1 123#0011X\n")
+        f.write("(1682544964.911893) can1 301#0011\n")
+        f.write(" (000.000041)  can1  18F11031   [8]  00 00 FF FF FF FF FF FF\r\n")
+        f.write("(1682544964.912000) can0 18EFFF00#FFFF")
+
+    frames, channels = read_candump(candump_file)
+    assert list(frames['can_id']) == [0x301, 0x18F11031, 0x18EFFF00]
+    assert list(frames['dlc']) == [2, 8, 2]
+
+    os.remove(candump_file)
+
+def test_blocks_split_on_lines(faker):
+    candump_file = faker.file_name()
+    with open(candump_file,'w') as f:
+        for i in range(500):
+            f.write(f"({1682544964.910156 + i/100:0.6f}) can1 {i:08X}#F87D7D000000F07D\n")
+
+    # A tiny block size forces many blocks
+    frames, channels = read_candump(candump_file, block_size=100)
+    assert len(frames) == 500
+    assert (frames['can_id'] == range(500)).all()
+    assert (frames['data'][:, 1] == 0x7D).all()
+
+    os.remove(candump_file)
+
+def test_fixed_width_lines_match_the_pattern(faker, monkeypatch):
+    candump_file = faker.file_name()
+    lines = []
+    for i in range(3 * MIN_FIXED_LINES):
+        lines.append(f"({1682544964.910156 + i/1000:0.6f}) can{i % 2} {faker.random_int(max=0x1FFFFFFF):08X}#{faker.hexify('^' * 16)}\n")
+        lines.append(f" ({i/1000:011.6f})  can1  18F11031   [8]  {' '.join(faker.hexify('^^') for _ in range(8))}\n")
+        # Lines of the same width with other characters in the fields, which neither path parses
+        lines.append(f"({1682544964.910156 + i/1000:0.6f}) can1 0CF00400#{faker.hexify('^' * 15)}X\n")
+        lines.append(f"({i:017d}) can1 0CF00400 {faker.hexify('^' * 16)}\n")
+        lines.append(f"({i/1000:0.6f}) can0 {i % 0x800:03X}#{faker.hexify('^' * (2 * (i % 9)))}\n")
+    with open(candump_file,'w') as f:
+        f.writelines(lines)
+
+    frames, channels = read_candump(candump_file)
+    # Every line parsed with the regular expression alone
+    monkeypatch.setattr('candump_reader.MIN_FIXED_LINES', len(lines) + 1)
+    expected, expected_channels = read_candump(candump_file)
+    assert len(frames) == len(expected) == 3 * 3 * MIN_FIXED_LINES
+    for name in ('timestamp', 'can_id', 'dlc', 'data'):
+        assert np.array_equal(frames[name], expected[name])
+    assert [channels[i] for i in frames['channel']] == [expected_channels[i] for i in expected['channel']]
+
+    os.remove(candump_file)
@@ -0,0 +1,25 @@
+
+from j1939_id import * #Import the file with the function to test
+import numpy as np
+
+def test_known_ids():
+    # EEC1 from the engine is a PDU2 broadcast
+    fields = decode_j1939_ids([0x0CF00400, 0x18EFFF00, 0x18DAF100])
+    assert list(fields['pgn']) == [61444, 0xEF00, 0xDA00]
+    assert list(fields['source_address']) == [0x00, 0x00, 0x00]
+    assert list(fields['destination_address']) == [0xFF, 0xFF, 0xF1]
+    assert list(fields['priority']) == [3, 6, 6]
+    assert list(fields['pdu_format']) == [0xF0, 0xEF, 0xDA]
+    assert list(fields['pdu_specific']) == [0x04, 0xFF, 0xF1]
+
+def test_array_matches_scalar(faker):
+    can_ids = [faker.random_int(min=0, max=0x1FFFFFFF) for _ in range(2000)]
+    # Make sure the data page bits and both PDU formats are covered
+    can_ids += [0x03EF1234, 0x01F00400, 0x02FECA03]
+    fields = decode_j1939_ids(np.array(can_ids, dtype=np.uint32))
+    for i, can_id in enumerate(can_ids):
+        expected = parseJ1939id(can_id)
+        for key in expected:
+            assert fields[key][i] == expected[key]
+        assert fields['dp'][i] == (can_id >> 24) & 1
+        assert fields['edp'][i] == (can_id >> 25) & 1
@@ -0,0 +1,46 @@
+from j1939_pipeline import * #Import the file with the function to test
+from spn_decoder import SPNDecoder
+import types
+
+def test_stages_are_lazy():
+    frames = j1939_frames('KWTruck.txt')
+    assert isinstance(frames, types.GeneratorType)
+    first = next(frames)
+    assert first['timestamp'] >= 0
+    assert 'pgn' in first
+    frames.close()
+
+def test_filter_and_decode():
+    frames = j1939_frames('KWTruck.txt', pgns={61444}, source_addresses={0}, spn_decoder=SPNDecoder())
+    count = 0
+    for frame in frames:
+        assert frame['pgn'] == 61444
+        assert frame['source_address'] == 0
+        assert 190 in frame['spns']
+        count += 1
+    assert count > 0
+
+def test_transport_messages_added():
+    frames = list(j1939_frames('KWTruck.txt', pgns={0xFEE3, 0xFEEB}))
+    transport = [frame for frame in frames if frame.get('transport')]
+    assert len(transport) > 0
+    for frame in transport:
+        assert frame['dlc'] > 8
+        assert frame['channel'] == 'can1'
+
+def test_batched(faker):
+    items = list(range(faker.random_int(min=1, max=1000)))
+    batch_size = faker.random_int(min=1, max=100)
+    batches = list(batched(iter(items), batch_size))
+    assert [item for batch in batches for item in batch] == items
+    assert all(len(batch) == batch_size for batch in batches[:-1])
+
+def test_stage_metrics():
+    lines_before = LINES_PARSED.value
+    decoded_before = FRAMES_DECODED.value
+    samples_before = sum(PARSE_LATENCY.counts)
+    frames = list(decode_j1939(parse_frames(read_lines('KWTruck.txt'))))
+    assert LINES_PARSED.value - lines_before == len(frames)
+    assert FRAMES_DECODED.value - decoded_before == len(frames)
+    assert sum(PARSE_LATENCY.counts) - samples_before == len(frames) // PARSE_SAMPLE_EVERY
+    assert 'candump_lines_parsed_total {}'.format(LINES_PARSED.value) in METRICS.prometheus_text()
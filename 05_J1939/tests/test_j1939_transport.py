@@ -0,0 +1,70 @@
+from j1939_transport import * #Import the file with the function to test
+
+def tp_frame(pgn, sa, da, data, timestamp):
+    return {'pgn': pgn,
+            'source_address': sa,
+            'destination_address': da,
+            'data': data,
+            'timestamp': timestamp}
+
+def bam_frames(faker, sa, message, timestamp, pgn=0xFEE3):
+    total_packets = (len(message) + 6) // 7
+    frames = [tp_frame(TP_CM_PGN, sa, 0xFF,
+                       bytes([TP_CM_BAM, len(message) & 0xFF, len(message) >> 8, total_packets, 0xFF,
+                              pgn & 0xFF, (pgn >> 8) & 0xFF, pgn >> 16]),
+                       timestamp)]
+    for i in range(total_packets):
+        timestamp += 0.05
+        packet = message[7 * i:7 * i + 7].ljust(7, b'\xff')
+        frames.append(tp_frame(TP_DT_PGN, sa, 0xFF, bytes([i + 1]) + packet, timestamp))
+    return frames
+
+def test_bam_reassembly(faker):
+    message = faker.binary(length=faker.random_int(min=9, max=1785))
+    reassembler = J1939TransportReassembler()
+    results = [reassembler.process(frame) for frame in bam_frames(faker, 0x31, message, 10.0)]
+    assert results[:-1] == [None] * (len(results) - 1)
+    assert results[-1]['data'] == message
+    assert results[-1]['pgn'] == 0xFEE3
+    assert results[-1]['source_address'] == 0x31
+    assert reassembler.counters()['completed'] == 1
+    assert reassembler.counters()['open'] == 0
+
+def test_session_times_out(faker):
+    message = faker.binary(length=30)
+    reassembler = J1939TransportReassembler()
+    frames = bam_frames(faker, 0x31, message, 10.0)
+    for frame in frames[:3]:
+        reassembler.process(frame)
+    # The rest of the packets come after T1 has passed
+    for frame in frames[3:]:
+        frame['timestamp'] += T1
+        assert reassembler.process(frame) is None
+    assert reassembler.counters()['timed_out'] == 1
+    assert reassembler.counters()['completed'] == 0
+
+def test_sessions_are_capped(faker):
+    reassembler = J1939TransportReassembler(max_sessions=4)
+    for sa in range(10):
+        frames = bam_frames(faker, sa, faker.binary(length=20), 10.0)
+        reassembler.process(frames[0])
+    assert reassembler.counters()['open'] == 4
+    assert reassembler.counters()['evicted'] == 6
+    # The newest sessions are kept
+    assert list(reassembler.sessions) == [(sa, 0xFF) for sa in range(6, 10)]
+
+def test_abort_from_responder(faker):
+    reassembler = J1939TransportReassembler()
+    # Request to send from 0x01 to the engine, aborted by the engine
+    reassembler.process(tp_frame(TP_CM_PGN, 0x01, 0x00, bytes.fromhex("10F906FFFF01FE00"), 1.0))
+    assert reassembler.counters()['open'] == 1
+    reassembler.process(tp_frame(TP_CM_PGN, 0x00, 0x01, bytes.fromhex("FFFEFFFFFF01FE00"), 1.1))
+    assert reassembler.counters()['open'] == 0
+    assert reassembler.counters()['aborted'] == 1
+
+def test_bad_announcement_rejected(faker):
+    reassembler = J1939TransportReassembler()
+    # 39 bytes can't be sent in 2 packets
+    reassembler.process(tp_frame(TP_CM_PGN, 0x00, 0xFF, bytes.fromhex("20270002FFE3FE00"), 1.0))
+    assert reassembler.counters()['rejected'] == 1
+    assert reassembler.counters()['open'] == 0
@@ -0,0 +1,48 @@
+from log_formats import * #Import the file with the function to test
+import numpy as np
+import os
+
+def log_path(name):
+    return os.path.join(LOG_DIR, name)
+
+def assert_same_frames(frames, expected):
+    assert len(frames) == len(expected)
+    assert np.allclose(frames['timestamp'], expected['timestamp'], rtol=0, atol=1e-6)
+    for field in ('can_id', 'dlc', 'data', 'channel'):
+        assert np.array_equal(frames[field], expected[field])
+
+def test_detect_format():
+    assert detect_format(log_path('VSpy on a Kenworth.csv')) == 'vspy'
+    assert detect_format(log_path('Vector CAN Case XL on Freightliner.csv')) == 'vector'
+    assert detect_format(log_path('PCAN View on a PACCAR MX.trc')) == 'pcan'
+    assert detect_format(log_path('NMFTA CAN Logger 2 on a Navistar A26.bin')) == 'nmfta'
+    assert detect_format(log_path('candump on a Kenworth.log')) == 'candump'
+
+def test_matches_notebook_conversions():
+    # The notebook converted the start of each CSV file to candump
+    for csv_name, candump_name in (('VSpy on a Kenworth.csv', 'candump on a Kenworth.log'),
+                                   ('Vector CAN Case XL on Freightliner.csv', 'candump for CAN Case XL on Freightliner.log')):
+        frames, channels = read_log(log_path(csv_name))
+        expected, expected_channels = read_log(log_path(candump_name))
+        assert channels == expected_channels
+        assert_same_frames(frames[:len(expected)], expected)
+
+def test_pcan_and_nmfta():
+    frames, channels = read_log(log_path('PCAN View on a PACCAR MX.trc'))
+    assert channels == ['can1']
+    # The first data frame in the trace
+    assert frames['can_id'][0] == 0x18EEFF00
+    assert bytes(frames['data'][0]) == bytes.fromhex("FF02A10100000010")
+    frames, channels = read_log(log_path('NMFTA CAN Logger 2 on a Navistar A26.bin'))
+    assert channels == ['can0', 'can1']
+    assert frames['can_id'][0] == 0x0CF00400
+    assert (frames['dlc'] <= 8).all()
+    assert frames['timestamp'].max() - frames['timestamp'].min() < 100
+
+def test_write_candump_round_trip():
+    frames, channels = read_log(log_path('Vector CAN Case XL on Freightliner.csv'))
+    write_candump(frames, channels, 'test_log_formats.log')
+    converted, converted_channels = read_candump('test_log_formats.log')
+    assert converted_channels == channels
+    assert_same_frames(converted, frames)
+    os.remove('test_log_formats.log')
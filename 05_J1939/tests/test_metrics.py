@@ -0,0 +1,96 @@
+from metrics import * #Import the file with the function to test
+import json
+
+def test_snapshot_is_valid_json(faker):
+    metrics = Metrics()
+    counter = metrics.counter('frames_total', "Frames", {'channel': 'can0'})
+    histogram = metrics.histogram('parse_seconds', "Parse time")
+    count = faker.random_int(min=1, max=1000)
+    counter.incr(count)
+    # Every observation is above the largest bound
+    for _ in range(10):
+        histogram.observe(LATENCY_BUCKETS_NS[-1] + faker.random_int(min=1, max=10 ** 9))
+    snapshot = metrics.snapshot()
+    # Infinity isn't JSON, so strict parsers would reject the snapshot
+    snapshot = json.loads(json.dumps(snapshot, allow_nan=False))
+    assert snapshot['counters'] == {'frames_total{channel=can0}': count}
+    assert snapshot['histograms']['parse_seconds']['p99_ns'] == '+Inf'
+    assert snapshot['histograms']['parse_seconds']['buckets_ns']['+Inf'] == 10
+    assert metrics.histogram('parse_seconds').quantile(0.5) == math.inf
+
+def fake_clock(monkeypatch, step):
+    """Makes perf_counter_ns advance by step on every call."""
+    ticks = iter(range(0, 1000 * step, step))
+    monkeypatch.setattr('metrics.perf_counter_ns', lambda: next(ticks))
+
+def test_timed_records_each_call(monkeypatch):
+    metrics = Metrics()
+    fake_clock(monkeypatch, 3000)
+
+    @metrics.timed('call_seconds', "Call time")
+    def add(a, b):
+        """Adds two numbers."""
+        return a + b
+
+    @metrics.timed('call_seconds', labels={'result': 'error'})
+    def fail():
+        raise ValueError("failed")
+
+    assert add(1, 2) == 3
+    assert add.__name__ == 'add' and add.__doc__ == "Adds two numbers."
+    try:
+        fail()
+        assert False, "The exception should be raised"
+    except ValueError:
+        pass
+    histogram = metrics.histogram('call_seconds')
+    assert sum(histogram.counts) == 1
+    assert histogram.sum == 3000
+    # A call that raises is timed too
+    assert sum(metrics.histogram('call_seconds', labels={'result': 'error'}).counts) == 1
+
+def test_timing_block(monkeypatch):
+    metrics = Metrics()
+    fake_clock(monkeypatch, 7000)
+    for _ in range(4):
+        with metrics.timing('block_seconds'):
+            pass
+    histogram = metrics.histogram('block_seconds')
+    assert histogram.sum == 4 * 7000
+    assert histogram.counts[LATENCY_BUCKETS_NS.index(10000)] == 4
+
+def test_quantile_at_bucket_bounds():
+    histogram = Histogram((10, 20, 30))
+    assert histogram.quantile(0.5) is None
+    # An observation equal to a bound falls in that bound's bucket
+    for value in (10, 10, 20, 30):
+        histogram.observe(value)
+    assert histogram.counts == [2, 1, 1, 0]
+    assert histogram.quantile(0) == 10
+    assert histogram.quantile(0.5) == 10
+    assert histogram.quantile(0.51) == 20
+    assert histogram.quantile(0.75) == 20
+    assert histogram.quantile(1) == 30
+    histogram.observe(31)
+    assert histogram.quantile(1) == math.inf
+
+def test_prometheus_text():
+    metrics = Metrics()
+    metrics.counter('frames_total', "Frames", {'path': 'C:\\logs\\"can0"\nold'}).incr(5)
+    histogram = metrics.histogram('parse_seconds', "Parse time", {'stage': 'read'}, bounds=(1000, 2000))
+    for value in (500, 1000, 1500, 2500):
+        histogram.observe(value)
+    lines = metrics.prometheus_text().splitlines()
+    assert lines == [
+        '# HELP frames_total Frames',
+        '# TYPE frames_total counter',
+        'frames_total{path="C:\\\\logs\\\\\\"can0\\"\\nold"} 5',
+        '# HELP parse_seconds Parse time',
+        '# TYPE parse_seconds histogram',
+        # The buckets are cumulative
+        'parse_seconds_bucket{stage="read",le="1e-06"} 2',
+        'parse_seconds_bucket{stage="read",le="2e-06"} 3',
+        'parse_seconds_bucket{stage="read",le="+Inf"} 4',
+        'parse_seconds_sum{stage="read"} 5.5e-06',
+        'parse_seconds_count{stage="read"} 4',
+    ]
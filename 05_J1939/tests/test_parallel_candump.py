@@ -0,0 +1,52 @@
+
+from parallel_candump import * #Import the file with the function to test
+import os
+
+def test_chunk_boundaries_on_newlines(faker):
+    candump_file = faker.file_name()
+    with open(candump_file,'w') as f:
+        for i in range(50):
+            f.write(f"({1682544964.910156 + i/100:0.6f}) can1 0CF00400#F87D7D000000F07D\n")
+
+    chunks = find_chunk_boundaries(candump_file, 7)
+    assert chunks[0][0] == 0
+    assert chunks[-1][1] == os.path.getsize(candump_file)
+    with open(candump_file,'rb') as f:
+        data = f.read()
+    for start, end in chunks:
+        # Every chunk should hold whole lines
+        assert data[start:end].endswith(b"\n")
+        assert start == 0 or data[start-1:start] == b"\n"
+
+    os.remove(candump_file)
+
+def test_parallel_matches_serial(faker):
+    candump_file = faker.file_name()
+    with open(candump_file,'w') as f:
+        for i in range(200):
+            can_id = faker.random_int(min=0, max=0x1FFFFFFF)
+            f.write(f"({1682544964.910156 + i/100:0.6f}) can1 {can_id:08X}#F87D7D000000F07D\n")
+        # Include the spaced layout used in KWTruck.txt
+        f.write(" (1682544967.000000)  can1  18F11031   [8]  00 00 FF FF FF FF FF FF\n")
+
+    serial_frames = parse_candump_serial(candump_file)
+    assert len(serial_frames) == 201
+    assert parse_candump_parallel(candump_file, 1) == serial_frames
+    assert parse_candump_parallel(candump_file, 3) == serial_frames
+
+    os.remove(candump_file)
+
+def test_parallel_keeps_file_order(faker):
+    candump_file = faker.file_name()
+    with open(candump_file,'w') as f:
+        for i in range(200):
+            # Timestamps out of order, as when logs from two loggers are appended
+            timestamp = 1682544964.910156 + faker.random_int(min=0, max=10000) / 100
+            f.write(f"({timestamp:0.6f}) can1 0CF00400#{i:016X}\n")
+
+    serial_frames = parse_candump_serial(candump_file)
+    assert [frame['timestamp'] for frame in serial_frames] != sorted(frame['timestamp'] for frame in serial_frames)
+    assert parse_candump_parallel(candump_file, 1) == serial_frames
+    assert parse_candump_parallel(candump_file, 3) == serial_frames
+
+    os.remove(candump_file)
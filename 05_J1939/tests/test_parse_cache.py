@@ -0,0 +1,69 @@
+from parse_cache import * #Import the file with the function to test
+from j1939_pipeline import parse_candump_line, array_frames
+import numpy as np
+import os
+
+def write_log(filename, faker, num_frames):
+    lines = []
+    for i in range(num_frames):
+        lines.append("({:.6f}) can1 {:08X}#{}\n".format(
+            1682544964 + i * 0.01,
+            faker.random_int(min=0, max=0x1FFFFFFF),
+            faker.binary(length=8).hex().upper()))
+    with open(filename, 'w') as f:
+        f.writelines(lines)
+    return lines
+
+def test_cache_matches_parser(faker):
+    filename = 'test_parse_cache.log'
+    lines = write_log(filename, faker, 50)
+    frames, channels = load_candump(filename)
+    assert os.path.exists(sidecar_path(filename))
+    cached_frames, cached_channels = load_candump(filename)
+    assert np.array_equal(frames, cached_frames)
+    assert cached_channels == channels
+    assert list(array_frames(cached_frames, cached_channels)) == [parse_candump_line(line) for line in lines]
+    os.remove(filename)
+    os.remove(sidecar_path(filename))
+
+def test_cache_invalidated_on_change(faker):
+    filename = 'test_parse_cache_change.log'
+    write_log(filename, faker, 20)
+    frames, channels = load_candump(filename)
+    stat = os.stat(filename)
+    lines = write_log(filename, faker, 30)
+    # Put back the old modification time so only the size gives the change away
+    os.utime(filename, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    assert os.stat(filename).st_mtime_ns == stat.st_mtime_ns
+    frames, channels = load_candump(filename)
+    assert len(frames) == 30
+    # Touching the log without changing it keeps the cached frames
+    os.utime(filename)
+    touched_frames, channels = load_candump(filename)
+    assert np.array_equal(frames, touched_frames)
+    os.remove(filename)
+    os.remove(sidecar_path(filename))
+
+def test_truncated_sidecar_is_rebuilt(faker):
+    filename = 'test_parse_cache_truncated.log'
+    write_log(filename, faker, 40)
+    frames, channels = load_candump(filename)
+    sidecar = sidecar_path(filename)
+    with open(sidecar, 'r+b') as f:
+        f.truncate(os.path.getsize(sidecar) // 2)
+    assert load_sidecar(sidecar) is None
+    rebuilt_frames, channels = load_candump(filename)
+    assert np.array_equal(frames, rebuilt_frames)
+    assert load_sidecar(sidecar) is not None
+    os.remove(filename)
+    os.remove(sidecar)
+
+def test_unwritable_sidecar(faker, tmp_path):
+    filename = str(tmp_path / 'test_parse_cache_read_only.log')
+    write_log(filename, faker, 10)
+    # A directory where the sidecar should be can't be replaced by a file
+    os.mkdir(sidecar_path(filename))
+    frames, channels = load_candump(filename)
+    assert len(frames) == 10
+    # The temporary file is removed when it can't replace the sidecar
+    assert sorted(os.listdir(str(tmp_path))) == sorted([os.path.basename(filename), os.path.basename(sidecar_path(filename))])
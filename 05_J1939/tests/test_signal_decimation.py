@@ -0,0 +1,81 @@
+from signal_decimation import * #Import the file with the function to test
+import numpy as np
+import os
+
+def random_signal(faker, count):
+    rng = np.random.default_rng(faker.random_int())
+    times = np.cumsum(rng.uniform(0.005, 0.015, count)) + 1682544964
+    values = rng.normal(800, 50, count)
+    return times, values
+
+def test_minmax_keeps_extremes(faker):
+    times, values = random_signal(faker, faker.random_int(min=5000, max=50000))
+    values[faker.random_int(min=0, max=len(values) - 1)] = 5000
+    values[10] = np.nan
+    plot_times, plot_values = minmax_decimate(times, values, 500)
+    assert len(plot_values) <= 500
+    assert np.nanmax(values) == plot_values.max()
+    assert np.nanmin(values) == plot_values.min()
+    assert np.all(np.diff(plot_times) >= 0)
+    assert set(plot_times) <= set(times)
+
+def test_lttb(faker):
+    times, values = random_signal(faker, faker.random_int(min=1000, max=20000))
+    plot_times, plot_values = lttb(times, values, 300)
+    assert len(plot_values) == 300
+    assert plot_times[0] == times[0] and plot_times[-1] == times[-1]
+    assert np.all(np.diff(plot_times) > 0)
+    # Every point kept is one of the samples
+    assert np.array_equal(values[np.searchsorted(times, plot_times)], plot_values)
+    # A spike is the largest triangle in its bucket
+    values[len(values) // 2] = 1e6
+    assert 1e6 in lttb(times, values, 300)[1]
+
+def test_aggregates_match_samples(faker):
+    times, values = random_signal(faker, faker.random_int(min=10000, max=30000))
+    aggregates = build_aggregates(times, values)
+    for resolution, rows in aggregates.items():
+        assert rows['count'].sum() == len(values)
+        assert np.isclose(rows['sum'].sum(), values.sum())
+        buckets = np.floor(times / resolution) * resolution
+        for row in rows[::max(len(rows) // 10, 1)]:
+            in_bucket = buckets == row['time']
+            assert row['count'] == np.count_nonzero(in_bucket)
+            assert row['min'] == values[in_bucket].min()
+            assert row['max'] == values[in_bucket].max()
+            assert values[times == row['max_time']][0] == row['max']
+
+    # Wide windows come from the aggregates, and agree with the samples
+    plot_times, plot_values = plot_series(times, values, aggregates, points=40)
+    assert len(plot_values) <= 40
+    assert plot_values.max() == values.max()
+    assert plot_values.min() == values.min()
+    start = times[len(times) // 2]
+    narrow = plot_series(times, values, aggregates, start, start + 5, points=2000)
+    assert np.array_equal(narrow[1], values[(times >= start) & (times <= start + 5)])
+
+def test_load_signal_cache():
+    filename = 'KWTruck.txt'
+    sidecar = signal_path(filename, 61444, 0, 190)
+    if os.path.exists(sidecar):
+        os.remove(sidecar)
+    times, values, aggregates = load_signal(filename, 61444, 0, 190)
+    assert os.path.exists(sidecar)
+    assert len(values) > 0 and not np.isnan(values).any()
+    cached_times, cached_values, cached_aggregates = load_signal(filename, 61444, 0, 190)
+    assert np.array_equal(times, cached_times)
+    assert np.array_equal(values, cached_values)
+    assert all(np.array_equal(aggregates[resolution], cached_aggregates[resolution]) for resolution in RESOLUTIONS)
+    os.remove(sidecar)
+
+def test_truncated_signal_cache_is_rebuilt():
+    filename = 'KWTruck.txt'
+    sidecar = signal_path(filename, 61444, 0, 190)
+    times, values, aggregates = load_signal(filename, 61444, 0, 190)
+    with open(sidecar, 'r+b') as f:
+        f.truncate(os.path.getsize(sidecar) // 2)
+    rebuilt_times, rebuilt_values, rebuilt_aggregates = load_signal(filename, 61444, 0, 190)
+    assert np.array_equal(times, rebuilt_times)
+    assert np.array_equal(values, rebuilt_values)
+    assert read_npz(sidecar, SIGNAL_CACHE_VERSION) is not None
+    os.remove(sidecar)
@@ -0,0 +1,39 @@
+
+from spn_decoder import * #Import the file with the function to test
+import struct
+import numpy as np
+
+PGN_EEC1 = 61444
+
+def test_engine_speed_matches_hand_decoding():
+    decoder = SPNDecoder()
+    data = bytes.fromhex("F87D7D000000F07D")
+    values = decoder.decode(PGN_EEC1, data)
+    # The original scripts unpacked SPN 190 by hand
+    assert values[190] == struct.unpack('<H', data[3:5])[0] * 0.125
+    # Engine torque mode is the low nibble of the first byte
+    assert values[899] == 8
+
+def test_not_available_and_error():
+    decoder = SPNDecoder()
+    values = decoder.decode(PGN_EEC1, bytes.fromhex("FFFFFFFFFFFFFFFF"))
+    assert values[190] is None
+    assert values[899] is None
+    values = decoder.decode(PGN_EEC1, bytes.fromhex("FEFFFF00FEFFFFFF"))
+    assert values[190] is None
+    assert values[899] is None
+
+def test_batch_matches_single(faker):
+    decoder = SPNDecoder()
+    # Cruise control/vehicle speed has byte aligned and bit field SPNs
+    pgn = 65265
+    data = np.array([[faker.random_int(min=0, max=255) for _ in range(8)] for _ in range(200)], dtype=np.uint8)
+    columns = decoder.decode_batch(pgn, data)
+    assert len(columns) > 0
+    for i, row in enumerate(data):
+        values = decoder.decode(pgn, row.tobytes())
+        for spn, value in values.items():
+            if value is None:
+                assert np.isnan(columns[spn][i])
+            else:
+                assert columns[spn][i] == value
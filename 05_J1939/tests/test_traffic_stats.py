@@ -0,0 +1,59 @@
+from traffic_stats import * #Import the file with the function to test
+import statistics
+import os
+
+def write_log(filename, faker, num_frames):
+    can_ids = [faker.random_int(min=0x800, max=0x1FFFFFFF) for _ in range(5)]
+    timestamp = 1682544964.0
+    with open(filename, 'w') as f:
+        for i in range(num_frames):
+            timestamp += faker.random_int(min=1, max=20) / 1000
+            dlc = faker.random_int(min=0, max=8)
+            f.write("({:.6f}) can1 {:08X}#{}\n".format(timestamp, faker.random_element(can_ids),
+                                                       faker.binary(length=dlc).hex().upper()))
+
+def test_frame_bits():
+    # Worst case lengths of 8 byte frames from Davis et al.
+    assert frame_bits(0x123, 8) == 135
+    assert frame_bits(0x18FEF100, 8) == 160
+    assert frame_bits(0x100, 0, extended=True) == 80
+
+def test_matches_direct_calculation(faker):
+    filename = faker.file_name()
+    write_log(filename, faker, 500)
+    stats = traffic_stats(filename)
+    frames = [frame for frame in decode_j1939(parse_frames(read_lines(filename)))]
+    assert stats.total.count == len(frames)
+    for can_id, id_stats in stats.by_id.items():
+        times = [frame['timestamp'] for frame in frames if frame['id'] == can_id]
+        periods = [b - a for a, b in zip(times, times[1:])]
+        assert id_stats.count == len(times)
+        if len(periods) > 1:
+            assert abs(id_stats.mean_period - statistics.fmean(periods)) < 1e-9
+            assert abs(id_stats.jitter() - statistics.stdev(periods)) < 1e-9
+            assert id_stats.max_period == max(periods)
+    bits = sum(frame_bits(frame['id'], frame['dlc']) for frame in frames)
+    duration = frames[-1]['timestamp'] - frames[0]['timestamp']
+    assert abs(stats.bus_load() - 100 * bits / (BITRATE * duration)) < 1e-9
+    assert sum(stats.total.dlc_counts.values()) == len(frames)
+    assert sum(stats.by_source_address[sa].count for sa in stats.by_source_address) == len(frames)
+    os.remove(filename)
+
+def test_merged_chunks_match_single_pass(faker):
+    filename = faker.file_name()
+    write_log(filename, faker, 1000)
+    single = traffic_stats(filename)
+    merged = TrafficStats()
+    for start, end in find_chunk_boundaries(filename, 7):
+        merged.merge(chunk_stats((filename, start, end, BITRATE)))
+    assert merged.total.count == single.total.count
+    assert merged.bus_load() == single.bus_load()
+    for table, merged_table in ((single.by_id, merged.by_id), (single.by_pgn, merged.by_pgn)):
+        assert table.keys() == merged_table.keys()
+        for key, stats in table.items():
+            assert merged_table[key].count == stats.count
+            assert merged_table[key].periods == stats.periods
+            assert merged_table[key].dlc_counts == stats.dlc_counts
+            assert abs(merged_table[key].mean_period - stats.mean_period) < 1e-9
+            assert abs(merged_table[key].m2 - stats.m2) < 1e-9
+    os.remove(filename)
@@ -0,0 +1,280 @@
+#!/usr/bin/env python3
+"""
+Profile CAN traffic in one pass: counts, periods, jitter and bus load.
+
+TrafficStats keeps a MessageStats for every CAN ID, PGN and source
+address. Each one holds the count, the mean and variance of the time
+between frames (Welford's online algorithm), the shortest and longest
+period, a DLC histogram and the bits on the wire. Memory is constant
+per key, so it works the same on a live SocketCAN interface as on a
+log file. Stats from separate chunks of a log merge into the stats of
+the whole log, so large files can be profiled on several cores:
+
+    python traffic_stats.py candump-RTSMaxxForceResourceExhaustion.log --workers 4
+    python traffic_stats.py --interface can0 --duration 10
+"""
+import sys
+import time
+import socket
+import struct
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+from j1939_pipeline import read_lines, parse_frames, decode_j1939, parse_candump_line
+from parallel_candump import find_chunk_boundaries
+
+BITRATE = 250000  # J1939-11 and -15 networks run at 250 kbit/s
+STANDARD_ID_MAX = 0x7FF
+
+# SocketCAN frame layout used in the J1939 notebooks
+CAN_FRAME = struct.Struct("<LB3x8s")
+CAN_EFF_FLAG = 0x80000000
+CAN_EFF_MASK = 0x1FFFFFFF
+
+def frame_bits(can_id, dlc, extended=None):
+    """Returns the worst case bits a frame takes on the bus, with stuff bits and the interframe space.
+
+    From the CAN schedulability analysis of Davis et al. (2007): 47 bits
+    of overhead for an 11 bit ID or 67 for a 29 bit ID, 8 per data byte,
+    and a stuff bit for every 4 bits of the stuffed fields. IDs above
+    0x7FF are taken to be extended unless extended is given.
+    """
+    if extended is None:
+        extended = can_id > STANDARD_ID_MAX
+    data_bits = 8 * dlc
+    if extended:
+        return 67 + data_bits + (53 + data_bits) // 4
+    return 47 + data_bits + (33 + data_bits) // 4
+
+def combine_variance(count_a, mean_a, m2_a, count_b, mean_b, m2_b):
+    """Combines two sets of Welford statistics (Chan et al.). Returns (count, mean, m2)."""
+    count = count_a + count_b
+    if not count:
+        return 0, 0.0, 0.0
+    delta = mean_b - mean_a
+    mean = mean_a + delta * count_b / count
+    m2 = m2_a + m2_b + delta * delta * count_a * count_b / count
+    return count, mean, m2
+
+class MessageStats():
+    """Running statistics of the frames with one key."""
+    __slots__ = ('count', 'first', 'last', 'periods', 'mean_period', 'm2',
+                 'min_period', 'max_period', 'dlc_counts', 'bits')
+
+    def __init__(self):
+        self.count = 0
+        self.first = None
+        self.last = None
+        self.periods = 0
+        self.mean_period = 0.0
+        self.m2 = 0.0
+        self.min_period = float('inf')
+        self.max_period = 0.0
+        self.dlc_counts = {}
+        self.bits = 0
+
+    def add_period(self, period):
+        self.periods += 1
+        delta = period - self.mean_period
+        self.mean_period += delta / self.periods
+        self.m2 += delta * (period - self.mean_period)
+        if period < self.min_period:
+            self.min_period = period
+        if period > self.max_period:
+            self.max_period = period
+
+    def add(self, timestamp, dlc, bits):
+        if self.count:
+            self.add_period(timestamp - self.last)
+        else:
+            self.first = timestamp
+        self.last = timestamp
+        self.count += 1
+        self.bits += bits
+        self.dlc_counts[dlc] = self.dlc_counts.get(dlc, 0) + 1
+
+    def merge(self, other):
+        """Adds the frames counted by other, such as the next chunk of a log.
+
+        When one set of frames ends before the other starts, the gap
+        between them is counted as a period, so merging the chunks of a
+        log gives the same result as a single pass.
+        """
+        if not other.count:
+            return self
+        if not self.count:
+            for name in self.__slots__:
+                setattr(self, name, getattr(other, name))
+            self.dlc_counts = dict(other.dlc_counts)
+            return self
+        earlier, later = (self, other) if self.first <= other.first else (other, self)
+        gap = later.first - earlier.last
+        self.periods, self.mean_period, self.m2 = combine_variance(
+            self.periods, self.mean_period, self.m2, other.periods, other.mean_period, other.m2)
+        self.min_period = min(self.min_period, other.min_period)
+        self.max_period = max(self.max_period, other.max_period)
+        self.first = earlier.first
+        self.last = max(self.last, other.last)
+        if gap >= 0:
+            self.add_period(gap)
+        self.count += other.count
+        self.bits += other.bits
+        for dlc, count in other.dlc_counts.items():
+            self.dlc_counts[dlc] = self.dlc_counts.get(dlc, 0) + count
+        return self
+
+    def jitter(self):
+        """Returns the standard deviation of the period in seconds."""
+        return (self.m2 / (self.periods - 1)) ** 0.5 if self.periods > 1 else None
+
+class TrafficStats():
+    def __init__(self, bitrate=BITRATE):
+        self.bitrate = bitrate
+        self.total = MessageStats()
+        self.by_id = {}
+        self.by_pgn = {}
+        self.by_source_address = {}
+
+    def update(self, frame):
+        """Counts a frame with J1939 fields, as yielded by decode_j1939."""
+        timestamp = frame['timestamp']
+        dlc = frame['dlc']
+        bits = frame_bits(frame['id'], dlc, frame.get('extended'))
+        self.total.add(timestamp, dlc, bits)
+        for table, key in ((self.by_id, frame['id']),
+                           (self.by_pgn, frame['pgn']),
+                           (self.by_source_address, frame['source_address'])):
+            stats = table.get(key)
+            if stats is None:
+                stats = table[key] = MessageStats()
+            stats.add(timestamp, dlc, bits)
+
+    def update_frames(self, frames):
+        for frame in frames:
+            self.update(frame)
+        return self
+
+    def merge(self, other):
+        """Adds the stats of another TrafficStats, such as from another chunk of the same log."""
+        self.total.merge(other.total)
+        for table, other_table in ((self.by_id, other.by_id),
+                                   (self.by_pgn, other.by_pgn),
+                                   (self.by_source_address, other.by_source_address)):
+            for key, stats in other_table.items():
+                table.setdefault(key, MessageStats()).merge(stats)
+        return self
+
+    def duration(self):
+        if self.total.count < 2:
+            return None
+        return self.total.last - self.total.first
+
+    def bus_load(self, stats=None):
+        """Returns the percentage of the bus time used by the frames in stats, or by all frames."""
+        duration = self.duration()
+        if not duration:
+            return None
+        stats = self.total if stats is None else stats
+        return 100 * stats.bits / (self.bitrate * duration)
+
+    def profile(self, table):
+        """Returns a list of summary dictionaries, one per key of by_id, by_pgn or by_source_address."""
+        rows = []
+        for key in sorted(table):
+            stats = table[key]
+            jitter = stats.jitter()
+            rows.append({'key': key,
+                         'count': stats.count,
+                         'mean_period_ms': stats.mean_period * 1000 if stats.periods else None,
+                         'jitter_ms': jitter * 1000 if jitter is not None else None,
+                         'min_period_ms': stats.min_period * 1000 if stats.periods else None,
+                         'max_period_ms': stats.max_period * 1000 if stats.periods else None,
+                         'dlc_counts': dict(sorted(stats.dlc_counts.items())),
+                         'bus_load': self.bus_load(stats)})
+        return rows
+
+def chunk_lines(filename, start, end):
+    """Yields the non-blank lines in a byte range that starts and ends on newlines."""
+    with open(filename, 'rb') as f:
+        f.seek(start)
+        while f.tell() < end:
+            line = f.readline()
+            if line.strip():
+                yield line.decode('ascii', 'ignore')
+
+def chunk_stats(chunk):
+    """Returns the TrafficStats of a (filename, start, end, bitrate) byte range."""
+    filename, start, end, bitrate = chunk
+    frames = decode_j1939(parse_candump_line(line) for line in chunk_lines(filename, start, end))
+    return TrafficStats(bitrate).update_frames(frames)
+
+def traffic_stats(filename, bitrate=BITRATE, workers=1, chunks_per_worker=4):
+    """Profiles a candump log in one pass, split across worker processes when workers > 1."""
+    if workers == 1:
+        return TrafficStats(bitrate).update_frames(decode_j1939(parse_frames(read_lines(filename))))
+    ranges = find_chunk_boundaries(filename, workers * chunks_per_worker)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        chunks = list(pool.map(chunk_stats, [(filename, start, end, bitrate) for start, end in ranges]))
+    stats = TrafficStats(bitrate)
+    # The chunks are merged in file order
+    for chunk in chunks:
+        stats.merge(chunk)
+    return stats
+
+def socketcan_frames(interface, duration=None):
+    """Yields frames read from a SocketCAN interface, for duration seconds or until interrupted."""
+    sock = socket.socket(socket.PF_CAN, socket.SOCK_RAW, socket.CAN_RAW)
+    sock.bind((interface,))
+    stop_time = None if duration is None else time.monotonic() + duration
+    sock.settimeout(1)
+    try:
+        while stop_time is None or time.monotonic() < stop_time:
+            try:
+                can_id, dlc, data = CAN_FRAME.unpack(sock.recv(CAN_FRAME.size))
+            except socket.timeout:
+                continue
+            yield {'id': can_id & CAN_EFF_MASK,
+                   'dlc': dlc,
+                   'data': data[:dlc],
+                   'timestamp': time.time(),
+                   'channel': interface,
+                   'extended': bool(can_id & CAN_EFF_FLAG)}
+    finally:
+        sock.close()
+
+def print_profile(stats, limit=None):
+    print("{:>10s} {:>8s} {:>11s} {:>10s} {:>8s}  {}".format("CAN ID", "frames", "period ms", "jitter ms", "load %", "DLCs"))
+    rows = stats.profile(stats.by_id)
+    rows.sort(key=lambda row: row['count'], reverse=True)
+    for row in rows[:limit]:
+        print("{:10X} {:8d} {:>11s} {:>10s} {:8.3f}  {}".format(
+            row['key'], row['count'],
+            "{:.3f}".format(row['mean_period_ms']) if row['mean_period_ms'] is not None else "-",
+            "{:.3f}".format(row['jitter_ms']) if row['jitter_ms'] is not None else "-",
+            row['bus_load'] or 0, row['dlc_counts']))
+    load = stats.bus_load()
+    print("{} frames from {} IDs, {} PGNs and {} source addresses over {:.1f} s, bus load {}".format(
+        stats.total.count, len(stats.by_id), len(stats.by_pgn), len(stats.by_source_address),
+        stats.duration() or 0, "{:.2f}%".format(load) if load is not None else "-"))
+
+def main():
+    parser = argparse.ArgumentParser(description="Profile the traffic in a candump log or on a SocketCAN interface")
+    parser.add_argument("candump_file", nargs="?", default="KWTruck.txt")
+    parser.add_argument("--interface", help="Read from this SocketCAN interface instead of a file")
+    parser.add_argument("--duration", type=float, default=10, help="Seconds to read from the interface")
+    parser.add_argument("--bitrate", type=int, default=BITRATE)
+    parser.add_argument("--workers", type=int, default=1, help="Processes used to read a file")
+    parser.add_argument("--top", type=int, default=20, help="Number of CAN IDs to list")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    if args.interface:
+        stats = TrafficStats(args.bitrate).update_frames(decode_j1939(socketcan_frames(args.interface, args.duration)))
+    else:
+        stats = traffic_stats(args.candump_file, args.bitrate, args.workers)
+    elapsed = time.perf_counter() - start
+    print_profile(stats, args.top)
+    print("Profiled in {:.3f} s ({:.0f} frames/s)".format(elapsed, stats.total.count / elapsed), file=sys.stderr)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,122 @@
+from uds_decoder import * #Import the file with the function to test
+
+# Frames adapted from the DDEC Reports capture shown in the notebook. The services
+# follow the capture, but payloads and timings were edited and the 0x3E01 response
+# was shortened to keep the fixture small.
+CANDUMP = """\
+ (1531228570.100000)  can0  18DA00F1   [8]  02 10 03 00 00 00 00 00
+ (1531228570.109000)  can0  18DAF100   [8]  06 50 03 00 14 00 C8 01
+ (1531228570.200000)  can0  18DA00F1   [8]  03 22 F1 A0 00 00 00 00
+ (1531228570.210000)  can0  18DAF100   [8]  10 14 62 F1 A0 31 46 55
+ (1531228570.211000)  can0  18DA00F1   [8]  30 08 00 00 00 00 00 00
+ (1531228570.212000)  can0  18DAF100   [8]  21 42 47 44 44 52 38 43
+ (1531228570.213000)  can0  18DAF100   [8]  22 4C 42 46 33 30 30 30
+ (1531228570.300000)  can0  18DA00F1   [8]  02 27 05 00 00 00 00 00
+ (1531228570.310000)  can0  18DAF100   [8]  04 67 05 11 8E 00 00 00
+ (1531228570.400000)  can0  18DA00F1   [8]  04 27 06 C0 2C 00 00 00
+ (1531228570.410000)  can0  18DAF100   [8]  02 67 06 00 00 00 00 00
+ (1531228570.500000)  can0  18DA00F1   [8]  10 0D 2E F1 5C 00 00 00
+ (1531228570.501000)  can0  18DAF100   [8]  30 08 14 00 00 00 00 00
+ (1531228570.521000)  can0  18DA00F1   [8]  21 13 03 1C 00 00 00 00
+ (1531228570.530000)  can0  18DAF100   [8]  03 6E F1 5C 00 00 00 00
+ (1531228571.429646)  can0  18DA00F1   [8]  03 22 3E 01 00 00 00 00
+ (1531228571.453436)  can0  18DAF100   [8]  03 7F 22 78 00 00 00 00
+ (1531228572.223366)  can0  18DAF100   [8]  10 0A 62 3E 01 4A 01 05
+ (1531228572.224596)  can0  18DA00F1   [8]  30 08 00 00 00 00 00 00
+ (1531228572.225000)  can0  18DAF100   [8]  21 FF 07 7D FF 7F 02 00
+ (1531228572.300000)  can0  18DA00F1   [8]  03 22 F1 00 00 00 00 00
+"""
+
+def test_transactions(tmp_path):
+    candump_file = tmp_path / "uds.txt"
+    candump_file.write_text(CANDUMP)
+    transactions = list(read_uds_transactions(str(candump_file)))
+    assert [transaction.service for transaction in transactions] == [0x10, 0x22, 0x27, 0x27, 0x2E, 0x22, 0x22]
+    assert all(transaction.tester == 0xF1 and transaction.ecu == 0 for transaction in transactions)
+
+    session = transactions[0]
+    assert session.status == 'positive'
+    assert session.fields['session_name'] == 'extended'
+    assert session.fields['p2_server_max'] == 0.020
+    assert session.fields['p2_star_server_max'] == 2.0
+
+    vin = transactions[1]
+    assert vin.fields['did'] == 0xF1A0
+    assert vin.fields['value'] == b'1FUBGDDR8CLBF3000'
+    assert abs(vin.p2 - 0.010) < 1e-6
+
+    assert transactions[2].fields['seed'] == bytes.fromhex('118E')
+    assert transactions[3].fields['key'] == bytes.fromhex('C02C')
+
+    write = transactions[4]
+    assert write.request == bytes.fromhex('2EF15C00000013031C00000000')
+    assert write.fields == {'did': 0xF15C, 'value': bytes.fromhex('00000013031C00000000')}
+    assert write.status == 'positive'
+
+    pending = transactions[5]
+    assert pending.status == 'positive'
+    assert pending.pending_responses == 1
+    assert pending.response == bytes.fromhex('623E014A0105FF077DFF')
+    assert abs(pending.p2 - 0.023790) < 1e-6
+    assert abs(pending.p2_star - 0.769930) < 1e-6
+    assert pending.timing_ok
+
+    assert transactions[6].status == 'no_response'
+    assert transactions[6].response is None
+
+def test_compact_layout_long_response(tmp_path):
+    # The 0x3E01 response in the capture announces 335 bytes in its first frame, 11 4F
+    response = bytes.fromhex('623E01') + bytes(range(256)) + bytes(range(76))
+    assert len(response) == 0x14F
+    lines = ["(1531228571.429646) can1 18DA00F1#03223E0100000000\n",
+             "(1531228572.223366) can1 18DAF100#114F{}\n".format(response[:6].hex().upper()),
+             "(1531228572.224596) can1 18DA00F1#3000000000000000\n"]
+    for i, start in enumerate(range(6, len(response), 7)):
+        data = bytes([0x20 | (i + 1) & 0x0F]) + response[start:start + 7].ljust(7, b'\xaa')
+        lines.append("({:.6f}) can1 18DAF100#{}\n".format(1531228572.225 + i * 0.001, data.hex().upper()))
+    assert len(lines) == 3 + 47
+    candump_file = tmp_path / "uds_compact.log"
+    candump_file.write_text(''.join(lines))
+    transactions = list(read_uds_transactions(str(candump_file)))
+    assert len(transactions) == 1
+    transaction = transactions[0]
+    assert transaction.service == 0x22
+    assert transaction.status == 'positive'
+    assert transaction.response == response
+    assert transaction.fields['did'] == 0x3E01
+    assert transaction.fields['value'] == response[3:]
+    assert abs(transaction.p2 - 0.793720) < 1e-6
+
+def test_isotp_sequence_error():
+    reassembler = IsoTpReassembler()
+    frames = [bytes.fromhex('10 14 62 F1 A0 31 46 55'), bytes.fromhex('22 42 47 44 44 52 38 43')]
+    for i, data in enumerate(frames):
+        assert reassembler.process({'source_address': 0, 'destination_address': 0xF1,
+                                    'data': data, 'timestamp': i * 0.01}) is None
+    assert reassembler.counters()['sequence_errors'] == 1
+    assert not reassembler.sessions
+
+def test_isotp_random_lengths(faker):
+    message = faker.binary(length=faker.random_int(min=1, max=4095))
+    if len(message) <= 7:
+        frames = [bytes([len(message)]) + message]
+    else:
+        frames = [bytes([0x10 | len(message) >> 8, len(message) & 0xFF]) + message[:6]]
+        for i, start in enumerate(range(6, len(message), 7)):
+            frames.append(bytes([0x20 | (i + 1) & 0x0F]) + message[start:start + 7].ljust(7, b'\xaa'))
+    reassembler = IsoTpReassembler()
+    results = [reassembler.process({'source_address': 0, 'destination_address': 0xF1,
+                                    'data': data, 'timestamp': i * 0.001})
+               for i, data in enumerate(frames)]
+    assert results[:-1] == [None] * (len(results) - 1)
+    assert results[-1]['data'] == message
+    assert results[-1]['frames'] == len(frames)
+
+def test_suppressed_positive_response():
+    decoder = UdsTransactionDecoder()
+    message = {'source_address': 0xF1, 'destination_address': 0, 'data': bytes.fromhex('3E80'),
+               'start_timestamp': 1.0, 'timestamp': 1.0}
+    assert decoder.process(message) == []
+    transactions = decoder.process(dict(message, timestamp=3.0, start_timestamp=3.0))
+    assert transactions[0].status == 'suppressed'
+    assert decoder.flush()[0].request_timestamp == 3.0
@@ -0,0 +1,479 @@
+#!/usr/bin/env python3
+"""
+Decode UDS (ISO 14229) diagnostic transactions from candump logs.
+
+UDS on a J1939 network is sent peer to peer with PGN 0xDA00, where the
+PDU specific byte is the destination, and uses ISO 15765-2 (ISO-TP)
+framing. IsoTpReassembler rebuilds messages from the single, first and
+consecutive frames. UdsTransactionDecoder pairs each request from a
+tester with the ECU's response and follows response pending (0x78)
+replies. It also measures the P2 and P2* times against the limits the
+ECU gave in its DiagnosticSessionControl response. Both work a frame at
+a time, so a log of any size is decoded in one pass:
+
+    python uds_decoder.py DDECReportsExtaction032819.txt
+
+The 08 Unified Diagnostic Services notebook downloads that capture.
+"""
+import os
+import sys
+import time
+import struct
+import argparse
+from collections import OrderedDict, Counter
+from typing import NamedTuple, Optional
+
+# The candump parsing stages live with the J1939 examples
+J1939_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "05_J1939")
+if J1939_DIR not in sys.path:
+    sys.path.append(J1939_DIR)
+from j1939_pipeline import read_lines, parse_frames, decode_j1939
+
+UDS_PGN = 0xDA00  # Peer to peer diagnostics, the PDU specific byte is the destination
+
+# ISO 15765-2 protocol control information, the high nibble of the first byte
+ISOTP_SINGLE_FRAME = 0
+ISOTP_FIRST_FRAME = 1
+ISOTP_CONSECUTIVE_FRAME = 2
+ISOTP_FLOW_CONTROL = 3
+
+N_CR = 1.0                # Seconds a receiver waits for the next consecutive frame
+MAX_SESSIONS = 32         # Multi-frame messages being received at once
+MAX_MESSAGE_SIZE = 1 << 20  # First frames can announce up to 4 GB, which we don't preallocate
+
+NEGATIVE_RESPONSE = 0x7F
+RESPONSE_PENDING = 0x78
+POSITIVE_RESPONSE_OFFSET = 0x40
+SUPPRESS_POSITIVE_RESPONSE = 0x80
+
+# Default P2 and P2* server limits from ISO 14229-2, until an ECU reports its own
+DEFAULT_P2_SERVER_MAX = 0.050
+DEFAULT_P2_STAR_SERVER_MAX = 5.000
+# Allowance for bus and gateway delays on top of the server limits (delta P2 in ISO 14229-2)
+DELTA_P2 = 0.050
+
+SERVICE_NAMES = {
+    0x10: 'DiagnosticSessionControl',
+    0x11: 'ECUReset',
+    0x14: 'ClearDiagnosticInformation',
+    0x19: 'ReadDTCInformation',
+    0x22: 'ReadDataByIdentifier',
+    0x23: 'ReadMemoryByAddress',
+    0x27: 'SecurityAccess',
+    0x28: 'CommunicationControl',
+    0x2E: 'WriteDataByIdentifier',
+    0x2F: 'InputOutputControlByIdentifier',
+    0x31: 'RoutineControl',
+    0x34: 'RequestDownload',
+    0x35: 'RequestUpload',
+    0x36: 'TransferData',
+    0x37: 'RequestTransferExit',
+    0x3D: 'WriteMemoryByAddress',
+    0x3E: 'TesterPresent',
+    0x85: 'ControlDTCSetting',
+}
+
+# Services whose second byte is a sub-function, which can carry the suppress positive response bit
+SUBFUNCTION_SERVICES = {0x10, 0x11, 0x19, 0x27, 0x28, 0x31, 0x3E, 0x85}
+
+SESSION_NAMES = {
+    0x01: 'default',
+    0x02: 'programming',
+    0x03: 'extended',
+    0x04: 'safety system',
+}
+
+NEGATIVE_RESPONSE_CODES = {
+    0x10: 'generalReject',
+    0x11: 'serviceNotSupported',
+    0x12: 'subFunctionNotSupported',
+    0x13: 'incorrectMessageLengthOrInvalidFormat',
+    0x14: 'responseTooLong',
+    0x21: 'busyRepeatRequest',
+    0x22: 'conditionsNotCorrect',
+    0x24: 'requestSequenceError',
+    0x31: 'requestOutOfRange',
+    0x33: 'securityAccessDenied',
+    0x35: 'invalidKey',
+    0x36: 'exceedNumberOfAttempts',
+    0x37: 'requiredTimeDelayNotExpired',
+    0x72: 'generalProgrammingFailure',
+    0x78: 'requestCorrectlyReceivedResponsePending',
+    0x7E: 'subFunctionNotSupportedInActiveSession',
+    0x7F: 'serviceNotSupportedInActiveSession',
+}
+
+class IsoTpSession():
+    __slots__ = ('message', 'length', 'received', 'next_sequence', 'start_timestamp', 'deadline', 'frames')
+
+    def __init__(self, length, first_data, timestamp):
+        self.message = bytearray(length)
+        self.length = length
+        self.received = min(len(first_data), length)
+        self.message[:self.received] = first_data[:self.received]
+        self.next_sequence = 1
+        self.start_timestamp = timestamp
+        self.deadline = timestamp + N_CR
+        self.frames = 1
+
+    def add_frame(self, data, timestamp):
+        """Copies a consecutive frame into the message. Returns True when the message is complete."""
+        count = min(len(data) - 1, self.length - self.received)
+        self.message[self.received:self.received + count] = data[1:1 + count]
+        self.received += count
+        self.next_sequence = (self.next_sequence + 1) & 0x0F
+        self.deadline = timestamp + N_CR
+        self.frames += 1
+        return self.received == self.length
+
+class IsoTpReassembler():
+    """Rebuilds ISO-TP messages from frames, one conversation per source and destination pair.
+
+    Padding after the announced length is dropped. A consecutive frame
+    out of sequence or later than N_Cr ends the message it belongs to,
+    and the number of messages being received at once is capped.
+    """
+    def __init__(self, max_sessions=MAX_SESSIONS):
+        self.max_sessions = max_sessions
+        self.sessions = OrderedDict()
+        self.single_frames = 0
+        self.multi_frames = 0
+        self.flow_control = 0
+        self.sequence_errors = 0
+        self.timed_out = 0
+        self.evicted = 0
+        self.rejected = 0
+
+    def counters(self):
+        return {'single_frames': self.single_frames,
+                'multi_frames': self.multi_frames,
+                'flow_control': self.flow_control,
+                'sequence_errors': self.sequence_errors,
+                'timed_out': self.timed_out,
+                'evicted': self.evicted,
+                'rejected': self.rejected}
+
+    def message(self, frame, data, start_timestamp, frames):
+        return {'source_address': frame['source_address'],
+                'destination_address': frame['destination_address'],
+                'data': data,
+                'start_timestamp': start_timestamp,
+                'timestamp': frame['timestamp'],
+                'frames': frames}
+
+    def process(self, frame):
+        """Takes a frame with J1939 fields. Returns a message when one is complete, otherwise None."""
+        data = frame['data']
+        if not data:
+            return None
+        pci = data[0] >> 4
+        key = (frame['source_address'], frame['destination_address'])
+        timestamp = frame['timestamp']
+        if pci == ISOTP_SINGLE_FRAME:
+            length = data[0] & 0x0F
+            offset = 1
+            if length == 0 and len(data) > 8:
+                # CAN FD single frames put the length in the second byte
+                length = data[1]
+                offset = 2
+            if length == 0 or length > len(data) - offset:
+                self.rejected += 1
+                return None
+            self.single_frames += 1
+            return self.message(frame, bytes(data[offset:offset + length]), timestamp, 1)
+        if pci == ISOTP_FIRST_FRAME:
+            if len(data) < 2:
+                self.rejected += 1
+                return None
+            length = ((data[0] & 0x0F) << 8) | data[1]
+            offset = 2
+            if length == 0 and len(data) >= 6:
+                # Messages over 4095 bytes escape to a 32 bit length
+                length = struct.unpack_from('>L', data, 2)[0]
+                offset = 6
+            if length == 0 or length > MAX_MESSAGE_SIZE:
+                self.rejected += 1
+                return None
+            if key in self.sessions:
+                # A new first frame abandons the message in progress
+                del self.sessions[key]
+                self.sequence_errors += 1
+            elif len(self.sessions) >= self.max_sessions:
+                self.sessions.popitem(last=False)
+                self.evicted += 1
+            self.sessions[key] = IsoTpSession(length, data[offset:], timestamp)
+            return None
+        if pci == ISOTP_CONSECUTIVE_FRAME:
+            session = self.sessions.get(key)
+            if session is None:
+                self.rejected += 1
+                return None
+            if timestamp > session.deadline:
+                del self.sessions[key]
+                self.timed_out += 1
+                return None
+            if data[0] & 0x0F != session.next_sequence:
+                del self.sessions[key]
+                self.sequence_errors += 1
+                return None
+            if session.add_frame(data, timestamp):
+                del self.sessions[key]
+                self.multi_frames += 1
+                return self.message(frame, bytes(session.message), session.start_timestamp, session.frames)
+            return None
+        if pci == ISOTP_FLOW_CONTROL:
+            self.flow_control += 1
+            return None
+        self.rejected += 1
+        return None
+
+class UdsTransaction(NamedTuple):
+    """A request and the response that completed it. Times are frame timestamps in seconds."""
+    tester: int
+    ecu: int
+    service: int
+    service_name: str
+    request: bytes
+    response: Optional[bytes]
+    status: str  # 'positive', 'negative', 'no_response', or 'suppressed' when no positive response was asked for
+    negative_response_code: Optional[int]
+    pending_responses: int  # Response pending (0x78) replies before the final response
+    request_timestamp: float  # When the request finished arriving
+    response_timestamp: Optional[float]  # When the final response finished arriving
+    p2: Optional[float]  # From the end of the request to the start of the first response
+    p2_star: Optional[float]  # From the last response pending to the start of the final response
+    timing_ok: Optional[bool]  # Whether p2 and p2_star were within the ECU's limits plus DELTA_P2
+    fields: dict  # Values decoded for the service
+
+def is_request(sid):
+    # Response service IDs are the request IDs with bit 6 set, and 0x7F for negative responses
+    return not sid & POSITIVE_RESPONSE_OFFSET
+
+def decode_session_control(request, response):
+    fields = {'session': request[1] & 0x7F if len(request) > 1 else None}
+    fields['session_name'] = SESSION_NAMES.get(fields['session'])
+    if response is not None and response[0] == 0x50 and len(response) >= 6:
+        p2_server_max, p2_star_server_max = struct.unpack_from('>HH', response, 2)
+        fields['p2_server_max'] = p2_server_max / 1000
+        fields['p2_star_server_max'] = p2_star_server_max * 10 / 1000
+    return fields
+
+def decode_read_data(request, response):
+    fields = {'dids': [did for did, in struct.iter_unpack('>H', request[1:1 + (len(request) - 1) // 2 * 2])]}
+    if response is not None and response[0] == 0x62 and len(fields['dids']) == 1 and len(response) >= 3:
+        # Several identifiers can only be split up with their lengths, which are ECU specific
+        fields['did'] = struct.unpack_from('>H', response, 1)[0]
+        fields['value'] = bytes(response[3:])
+    return fields
+
+def decode_write_data(request, response):
+    if len(request) < 3:
+        return {}
+    return {'did': struct.unpack_from('>H', request, 1)[0], 'value': bytes(request[3:])}
+
+def decode_security_access(request, response):
+    if len(request) < 2:
+        return {}
+    level = request[1] & 0x7F
+    fields = {'level': level}
+    if level % 2:
+        # Odd levels request a seed, even levels send the key
+        if response is not None and response[0] == 0x67:
+            fields['seed'] = bytes(response[2:])
+    else:
+        fields['key'] = bytes(request[2:])
+    return fields
+
+def decode_subfunction(request, response):
+    return {'subfunction': request[1] & 0x7F} if len(request) > 1 else {}
+
+SERVICE_DECODERS = {
+    0x10: decode_session_control,
+    0x11: decode_subfunction,
+    0x22: decode_read_data,
+    0x27: decode_security_access,
+    0x2E: decode_write_data,
+    0x31: decode_subfunction,
+    0x3E: decode_subfunction,
+}
+
+class PendingRequest():
+    __slots__ = ('tester', 'ecu', 'request', 'timestamp', 'suppressed',
+                 'first_response_timestamp', 'last_pending_timestamp', 'pending_responses')
+
+    def __init__(self, tester, ecu, request, timestamp):
+        self.tester = tester
+        self.ecu = ecu
+        self.request = request
+        self.timestamp = timestamp
+        self.suppressed = (request[0] in SUBFUNCTION_SERVICES and len(request) > 1
+                           and bool(request[1] & SUPPRESS_POSITIVE_RESPONSE))
+        self.first_response_timestamp = None
+        self.last_pending_timestamp = None
+        self.pending_responses = 0
+
+class UdsTransactionDecoder():
+    """Pairs UDS requests with their responses.
+
+    The tester is whoever sent the request. A request still waiting when
+    the tester sends the next one to the same ECU, or when the log ends,
+    is finished without a response. The P2 limits reported by each ECU
+    in a DiagnosticSessionControl response are kept and used for the
+    timing checks that follow.
+    """
+    def __init__(self):
+        self.pending = {}
+        self.timing_limits = {}
+        self.unmatched_responses = 0
+
+    def finish(self, pending, response=None):
+        request = pending.request
+        sid = request[0]
+        status = 'suppressed' if pending.suppressed else 'no_response'
+        negative_response_code = None
+        response_data = None
+        response_timestamp = None
+        p2 = p2_star = timing_ok = None
+        if response is not None:
+            response_data = response['data']
+            response_timestamp = response['timestamp']
+            if response_data[0] == NEGATIVE_RESPONSE:
+                status = 'negative'
+                negative_response_code = response_data[2] if len(response_data) > 2 else None
+            else:
+                status = 'positive'
+            p2 = pending.first_response_timestamp - pending.timestamp
+            p2_server_max, p2_star_server_max = self.timing_limits.get(
+                pending.ecu, (DEFAULT_P2_SERVER_MAX, DEFAULT_P2_STAR_SERVER_MAX))
+            timing_ok = p2 <= p2_server_max + DELTA_P2
+            if pending.last_pending_timestamp is not None:
+                p2_star = response['start_timestamp'] - pending.last_pending_timestamp
+                timing_ok = timing_ok and p2_star <= p2_star_server_max + DELTA_P2
+        decoder = SERVICE_DECODERS.get(sid)
+        fields = decoder(request, response_data) if decoder is not None else {}
+        if sid == 0x10 and 'p2_server_max' in fields:
+            self.timing_limits[pending.ecu] = (fields['p2_server_max'], fields['p2_star_server_max'])
+        return UdsTransaction(pending.tester, pending.ecu, sid, SERVICE_NAMES.get(sid, 'Unknown'),
+                              request, response_data, status, negative_response_code,
+                              pending.pending_responses, pending.timestamp, response_timestamp,
+                              p2, p2_star, timing_ok, fields)
+
+    def process(self, message):
+        """Takes a reassembled message. Returns a list of the transactions it completes."""
+        data = message['data']
+        completed = []
+        if not data:
+            return completed
+        sid = data[0]
+        if is_request(sid):
+            key = (message['source_address'], message['destination_address'])
+            previous = self.pending.pop(key, None)
+            if previous is not None:
+                completed.append(self.finish(previous))
+            self.pending[key] = PendingRequest(key[0], key[1], data, message['timestamp'])
+            return completed
+        key = (message['destination_address'], message['source_address'])
+        pending = self.pending.get(key)
+        if sid == NEGATIVE_RESPONSE:
+            request_sid = data[1] if len(data) > 1 else None
+        else:
+            request_sid = sid - POSITIVE_RESPONSE_OFFSET
+        if pending is None or pending.request[0] != request_sid:
+            self.unmatched_responses += 1
+            return completed
+        if pending.first_response_timestamp is None:
+            pending.first_response_timestamp = message['start_timestamp']
+        if sid == NEGATIVE_RESPONSE and len(data) > 2 and data[2] == RESPONSE_PENDING:
+            pending.pending_responses += 1
+            pending.last_pending_timestamp = message['timestamp']
+            return completed
+        del self.pending[key]
+        completed.append(self.finish(pending, message))
+        return completed
+
+    def flush(self):
+        """Finishes the requests still waiting, for the end of a log."""
+        completed = [self.finish(pending) for pending in self.pending.values()]
+        self.pending.clear()
+        return completed
+
+def uds_frames(frames, pgn=UDS_PGN):
+    """Yields the frames sent with the UDS PGN."""
+    for frame in frames:
+        if frame['pgn'] == pgn:
+            yield frame
+
+def isotp_messages(frames, reassembler=None):
+    """Yields the ISO-TP messages rebuilt from frames with J1939 fields."""
+    if reassembler is None:
+        reassembler = IsoTpReassembler()
+    for frame in frames:
+        message = reassembler.process(frame)
+        if message is not None:
+            yield message
+
+def uds_transactions(messages, decoder=None):
+    """Yields a UdsTransaction for each request in a stream of ISO-TP messages."""
+    if decoder is None:
+        decoder = UdsTransactionDecoder()
+    for message in messages:
+        yield from decoder.process(message)
+    yield from decoder.flush()
+
+def read_uds_transactions(filename, reassembler=None, decoder=None):
+    """Decodes the UDS transactions in a candump log in one pass."""
+    frames = uds_frames(decode_j1939(parse_frames(read_lines(filename))))
+    return uds_transactions(isotp_messages(frames, reassembler), decoder)
+
+def format_transaction(transaction):
+    text = "{:17.6f} {:3d} -> {:3d} {:31s} {:11s}".format(
+        transaction.request_timestamp, transaction.tester, transaction.ecu,
+        "{} (0x{:02X})".format(transaction.service_name, transaction.service), transaction.status)
+    if transaction.negative_response_code is not None:
+        text += " {}".format(NEGATIVE_RESPONSE_CODES.get(transaction.negative_response_code,
+                                                          "0x{:02X}".format(transaction.negative_response_code)))
+    if transaction.p2 is not None:
+        text += " P2 {:.1f} ms".format(transaction.p2 * 1000)
+    if transaction.p2_star is not None:
+        text += " P2* {:.1f} ms".format(transaction.p2_star * 1000)
+    if transaction.timing_ok is False:
+        text += " LATE"
+    if transaction.fields:
+        text += " " + ", ".join("{}={}".format(name, "0x{:04X}".format(value) if name == 'did' else
+                                               value.hex(' ').upper() if isinstance(value, bytes) else value)
+                                for name, value in transaction.fields.items())
+    return text
+
+def main():
+    parser = argparse.ArgumentParser(description="Decode the UDS transactions in a candump log")
+    parser.add_argument("candump_file", nargs="?",
+                        default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "DDECReportsExtaction032819.txt"))
+    parser.add_argument("--quiet", action="store_true", help="Only print the summary")
+    args = parser.parse_args()
+    if not os.path.exists(args.candump_file):
+        print(f"{args.candump_file} not found. The 08 Unified Diagnostic Services notebook downloads it.")
+        sys.exit(1)
+
+    reassembler = IsoTpReassembler()
+    decoder = UdsTransactionDecoder()
+    statuses = Counter()
+    services = Counter()
+    p2_times = []
+    start = time.perf_counter()
+    for transaction in read_uds_transactions(args.candump_file, reassembler, decoder):
+        statuses[transaction.status] += 1
+        services[transaction.service_name] += 1
+        if transaction.p2 is not None:
+            p2_times.append(transaction.p2)
+        if not args.quiet:
+            print(format_transaction(transaction))
+    elapsed = time.perf_counter() - start
+    print(f"\n{sum(statuses.values())} transactions in {elapsed:.3f} s: {dict(statuses)}")
+    print(f"Services: {dict(services)}")
+    if p2_times:
+        p2_times.sort()
+        print("P2 median {:.1f} ms, max {:.1f} ms".format(p2_times[len(p2_times) // 2] * 1000, p2_times[-1] * 1000))
+    print(f"ISO-TP: {reassembler.counters()}, unmatched responses: {decoder.unmatched_responses}")
+
+if __name__ == '__main__':
+    main()